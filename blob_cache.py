@@ -0,0 +1,81 @@
+import threading
+from collections import OrderedDict
+
+
+# Default budget of the decrypted blob cache
+DEFAULT_CACHE_MAX_BYTES = 32 * 1024 * 1024
+DEFAULT_CACHE_MAX_ENTRIES = 256
+
+
+class BlobCache:
+    """Bounded LRU cache of decrypted blob contents.
+    
+    Entries are keyed by virtual path and tagged with a version (the blob's secure
+    filename, which changes on every write), so a stale entry is never returned even if
+    an invalidation was missed. Eviction happens when either the byte budget or the
+    entry count is exceeded; a single value larger than the byte budget is not cached.
+    """
+    
+    def __init__(self, max_bytes=DEFAULT_CACHE_MAX_BYTES, max_entries=DEFAULT_CACHE_MAX_ENTRIES):
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self._entries = OrderedDict()  # virtual path -> (version, data)
+        self._current_bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+    
+    def get(self, virtual_path, version):
+        """Get cached data for a path at a version, or None"""
+        with self._lock:
+            cached = self._entries.get(virtual_path)
+            if cached is None or cached[0] != version:
+                if cached is not None:
+                    self._drop(virtual_path)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(virtual_path)
+            self.hits += 1
+            return cached[1]
+    
+    def put(self, virtual_path, version, data):
+        """Cache data for a path at a version, evicting least recently used entries"""
+        size = len(data)
+        if self.max_entries <= 0 or size > self.max_bytes:
+            return
+        with self._lock:
+            self._drop(virtual_path)
+            self._entries[virtual_path] = (version, data)
+            self._current_bytes += size
+            while len(self._entries) > self.max_entries or self._current_bytes > self.max_bytes:
+                _, (_, evicted) = self._entries.popitem(last=False)
+                self._current_bytes -= len(evicted)
+                self.evictions += 1
+    
+    def invalidate(self, virtual_path):
+        """Forget the cached data of a path"""
+        with self._lock:
+            self._drop(virtual_path)
+    
+    def clear(self):
+        """Forget everything (e.g. when the journal is locked)"""
+        with self._lock:
+            self._entries.clear()
+            self._current_bytes = 0
+    
+    def _drop(self, virtual_path):
+        cached = self._entries.pop(virtual_path, None)
+        if cached is not None:
+            self._current_bytes -= len(cached[1])
+    
+    def get_stats(self):
+        """Hit/miss/eviction counters and current usage"""
+        with self._lock:
+            return {
+                "cache_hits": self.hits,
+                "cache_misses": self.misses,
+                "cache_evictions": self.evictions,
+                "cache_entries": len(self._entries),
+                "cache_bytes": self._current_bytes
+            }
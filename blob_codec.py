@@ -0,0 +1,210 @@
+import struct
+import zlib
+
+
+# Every encoded blob starts with this magic, a format version and the codec id.
+# Blobs written before codecs existed have no header and are returned unchanged.
+BLOB_MAGIC = b"SJB"
+BLOB_FORMAT_VERSION = 1
+_BLOB_HEADER = struct.Struct(">3sBB")
+BLOB_HEADER_SIZE = _BLOB_HEADER.size
+
+DEFAULT_CODEC = "zlib"
+DEFAULT_COMPRESSION_LEVEL = 6
+
+
+class BlobCodec:
+    """A named transform applied to blob contents before encryption.
+    
+    encode(data, level, dictionary) and decode(data, dictionaries) get the preset
+    dictionary in use as (dictionary_id, bytes) and all known dictionaries as
+    {dictionary_id: bytes}; codecs that do not use dictionaries ignore them.
+    
+    For streaming, stream_encoder(level, dictionary) returns (prefix, compressor) and
+    stream_decoder(prefix, dictionaries) returns a decompressor, where prefix is the
+    first stream_prefix_size bytes of the payload; compressors and decompressors have
+    the zlib compressobj/decompressobj interface.
+    """
+    
+    def __init__(self, codec_id, name, encode, decode, stream_encoder, stream_decoder,
+                 uses_dictionary=False, stream_prefix_size=0):
+        self.codec_id = codec_id
+        self.name = name
+        self.encode = encode
+        self.decode = decode
+        self.stream_encoder = stream_encoder
+        self.stream_decoder = stream_decoder
+        self.uses_dictionary = uses_dictionary
+        self.stream_prefix_size = stream_prefix_size
+
+
+_CODECS_BY_ID = {}
+_CODECS_BY_NAME = {}
+
+
+def register_codec(codec):
+    """Make a codec available for encoding (by name) and decoding (by id)"""
+    if codec.codec_id in _CODECS_BY_ID and _CODECS_BY_ID[codec.codec_id].name != codec.name:
+        raise ValueError(f"Codec id {codec.codec_id} is already used by {_CODECS_BY_ID[codec.codec_id].name}")
+    _CODECS_BY_ID[codec.codec_id] = codec
+    _CODECS_BY_NAME[codec.name] = codec
+
+
+def get_codec(name):
+    """Get a registered codec by name"""
+    codec = _CODECS_BY_NAME.get(name)
+    if codec is None:
+        raise ValueError(f"Unknown blob codec: {name}")
+    return codec
+
+
+def available_codecs():
+    """Names of all registered codecs"""
+    return sorted(_CODECS_BY_NAME)
+
+
+class _Passthrough:
+    """Compressor/decompressor of the raw codec"""
+    
+    def compress(self, data):
+        return data
+    
+    def decompress(self, data):
+        return data
+    
+    def flush(self):
+        return b""
+
+
+# Dictionary-compressed payloads start with the id of the preset dictionary they need
+_DICTIONARY_ID = struct.Struct(">I")
+
+
+def _zlib_dict_stream_encoder(level, dictionary):
+    if dictionary is None:
+        raise ValueError("The zlib-dict codec needs a preset dictionary")
+    dictionary_id, zdict = dictionary
+    return _DICTIONARY_ID.pack(dictionary_id), zlib.compressobj(level, zdict=zdict)
+
+
+def _zlib_dict_stream_decoder(prefix, dictionaries):
+    (dictionary_id,) = _DICTIONARY_ID.unpack(prefix)
+    zdict = (dictionaries or {}).get(dictionary_id)
+    if zdict is None:
+        raise ValueError(f"Missing compression dictionary {dictionary_id}")
+    return zlib.decompressobj(zdict=zdict)
+
+
+def _zlib_dict_encode(data, level, dictionary):
+    prefix, compressor = _zlib_dict_stream_encoder(level, dictionary)
+    return prefix + compressor.compress(data) + compressor.flush()
+
+
+def _zlib_dict_decode(data, dictionaries):
+    decompressor = _zlib_dict_stream_decoder(data[:_DICTIONARY_ID.size], dictionaries)
+    return decompressor.decompress(data[_DICTIONARY_ID.size:]) + decompressor.flush()
+
+
+register_codec(BlobCodec(
+    0, "raw",
+    lambda data, level, dictionary: data,
+    lambda data, dictionaries: data,
+    lambda level, dictionary: (b"", _Passthrough()),
+    lambda prefix, dictionaries: _Passthrough()))
+register_codec(BlobCodec(
+    1, "zlib",
+    lambda data, level, dictionary: zlib.compress(data, level),
+    lambda data, dictionaries: zlib.decompress(data),
+    lambda level, dictionary: (b"", zlib.compressobj(level)),
+    lambda prefix, dictionaries: zlib.decompressobj()))
+register_codec(BlobCodec(
+    2, "zlib-dict", _zlib_dict_encode, _zlib_dict_decode,
+    _zlib_dict_stream_encoder, _zlib_dict_stream_decoder,
+    uses_dictionary=True, stream_prefix_size=_DICTIONARY_ID.size))
+
+
+def peek_codec(prefix):
+    """Name of the codec a blob was encoded with, from its first BLOB_HEADER_SIZE bytes
+    (None for legacy blobs without a header)"""
+    if len(prefix) < _BLOB_HEADER.size or prefix[:len(BLOB_MAGIC)] != BLOB_MAGIC:
+        return None
+    codec = _CODECS_BY_ID.get(_BLOB_HEADER.unpack_from(prefix)[2])
+    return codec.name if codec is not None else "unknown"
+
+
+def encode_blob(data, codec_name=DEFAULT_CODEC, level=DEFAULT_COMPRESSION_LEVEL, dictionary=None):
+    """Prefix data with a blob header and apply the codec; falls back to raw when that is smaller"""
+    codec = get_codec(codec_name)
+    encoded = codec.encode(data, level, dictionary)
+    if codec.codec_id != 0 and len(encoded) >= len(data):
+        codec = _CODECS_BY_ID[0]
+        encoded = data
+    return _BLOB_HEADER.pack(BLOB_MAGIC, BLOB_FORMAT_VERSION, codec.codec_id) + encoded
+
+
+def decode_blob(payload, dictionaries=None):
+    """Undo encode_blob; payloads without a blob header (legacy blobs) are returned as they are"""
+    if len(payload) < _BLOB_HEADER.size or payload[:len(BLOB_MAGIC)] != BLOB_MAGIC:
+        return payload
+    _, version, codec_id = _BLOB_HEADER.unpack_from(payload)
+    if version != BLOB_FORMAT_VERSION:
+        raise ValueError(f"Unsupported blob format version: {version}")
+    codec = _CODECS_BY_ID.get(codec_id)
+    if codec is None:
+        raise ValueError(f"Unknown blob codec id: {codec_id}")
+    return codec.decode(payload[_BLOB_HEADER.size:], dictionaries)
+
+
+
+def encode_blob_stream(pieces, codec_name=DEFAULT_CODEC, level=DEFAULT_COMPRESSION_LEVEL, dictionary=None):
+    """Like encode_blob for contents given as an iterable of pieces; yields the encoded blob
+    piece by piece (and never falls back to raw)"""
+    codec = get_codec(codec_name)
+    prefix, compressor = codec.stream_encoder(level, dictionary)
+    yield _BLOB_HEADER.pack(BLOB_MAGIC, BLOB_FORMAT_VERSION, codec.codec_id) + prefix
+    for piece in pieces:
+        encoded = compressor.compress(piece)
+        if encoded:
+            yield encoded
+    tail = compressor.flush()
+    if tail:
+        yield tail
+
+
+def decode_blob_stream(pieces, dictionaries=None):
+    """Like decode_blob, for a blob that arrives as an iterable of pieces"""
+    return b"".join(iter_decode_blob(pieces, dictionaries))
+
+
+def iter_decode_blob(pieces, dictionaries=None):
+    """Decode a blob that arrives as an iterable of pieces, yielding the contents piece by piece"""
+    pieces = iter(pieces)
+    buffer = b""
+    for piece in pieces:
+        buffer += piece
+        if len(buffer) >= _BLOB_HEADER.size:
+            break
+    if len(buffer) < _BLOB_HEADER.size or buffer[:len(BLOB_MAGIC)] != BLOB_MAGIC:
+        yield buffer
+        yield from pieces
+        return
+    
+    _, version, codec_id = _BLOB_HEADER.unpack_from(buffer)
+    if version != BLOB_FORMAT_VERSION:
+        raise ValueError(f"Unsupported blob format version: {version}")
+    codec = _CODECS_BY_ID.get(codec_id)
+    if codec is None:
+        raise ValueError(f"Unknown blob codec id: {codec_id}")
+    
+    prefix_end = _BLOB_HEADER.size + codec.stream_prefix_size
+    while len(buffer) < prefix_end:
+        piece = next(pieces, None)
+        if piece is None:
+            raise ValueError("Truncated blob")
+        buffer += piece
+    decompressor = codec.stream_decoder(buffer[_BLOB_HEADER.size:prefix_end], dictionaries)
+    
+    yield decompressor.decompress(buffer[prefix_end:])
+    for piece in pieces:
+        yield decompressor.decompress(piece)
+    yield decompressor.flush()
\ No newline at end of file
@@ -0,0 +1,84 @@
+import json
+import re
+from collections import Counter
+
+
+# zlib only looks back 32 KB, so a larger preset dictionary is never used
+MAX_DICTIONARY_SIZE = 32 * 1024
+
+# Id of the dictionary shipped with the app; trained dictionaries get the ids after it.
+# Its bytes must never change, blobs written with it refer to it by id.
+DEFAULT_DICTIONARY_ID = 1
+
+# Boilerplate that QTextEdit.toHtml() repeats in every entry
+_QT_HTML_BOILERPLATE = (
+    '<!DOCTYPE HTML PUBLIC "-//W3C//DTD HTML 4.0//EN" "http://www.w3.org/TR/REC-html40/strict.dtd">\n'
+    '<html><head><meta name="qrichtext" content="1" /><style type="text/css">\n'
+    'p, li { white-space: pre-wrap; }\n'
+    "</style></head><body style=\" font-family:'Segoe UI'; font-size:12pt; font-weight:400; font-style:normal;\">\n"
+    '<ul style="margin-top: 0px; margin-bottom: 0px; margin-left: 0px; margin-right: 0px; -qt-list-indent: 1;">'
+    '<li style=" margin-top:12px; margin-bottom:12px; margin-left:0px; margin-right:0px; -qt-block-indent:0; text-indent:0px;"></li></ul>\n'
+    '<h2 style=" margin-top:16px; margin-bottom:12px; margin-left:0px; margin-right:0px; -qt-block-indent:0; text-indent:0px;">'
+    '<span style=" font-size:x-large; font-weight:600;"></span></h2>\n'
+    '<span style=" font-style:italic;"></span><span style=" text-decoration: underline;"></span>'
+    '<span style=" color:#ffffff;"></span><img src="data:image/png;base64," width="" height="" />\n'
+    '<p style="-qt-paragraph-type:empty; margin-top:0px; margin-bottom:0px; margin-left:0px; margin-right:0px; -qt-block-indent:0; text-indent:0px;"><br /></p>\n'
+    '<p style=" margin-top:0px; margin-bottom:0px; margin-left:0px; margin-right:0px; -qt-block-indent:0; text-indent:0px;">'
+    '<span style=" font-weight:600;"></span></p></body></html>'
+)
+
+
+def build_default_dictionary():
+    """The shipped preset dictionary: a saved entry as EntryManager.save_entry stores it.
+
+    Entries are JSON, so the HTML appears JSON-escaped; zlib prefers matches near the end
+    of the dictionary, so the most common text goes last.
+    """
+    sample_entry = {
+        "title": "",
+        "content": _QT_HTML_BOILERPLATE,
+        "plain_text": "",
+        "date": "2024-01-01",
+        "created_time": "2024-01-01T00:00:00.000000",
+        "modified_time": "2024-01-01T00:00:00.000000",
+        "word_count": 0,
+        "has_images": False,
+        "notebook": "Default"
+    }
+    return json.dumps(sample_entry).encode()
+
+
+# Fragments a trained dictionary is assembled from: tags, JSON keys and text runs
+_FRAGMENT_PATTERN = re.compile(rb'<[^<>]{1,400}>|"[a-z_]{2,40}": |[^<>]{8,200}')
+
+
+def train_dictionary(samples, max_size=MAX_DICTIONARY_SIZE):
+    """Build a preset dictionary from sample blobs (e.g. existing entries).
+
+    zlib has no dictionary trainer, so this keeps the fragments that occur in the most
+    samples, weighted by length, and puts the most valuable ones last. Fragments seen in
+    fewer than two samples are ignored; whatever room is left goes to the shipped
+    dictionary so a small journal still gets its benefit.
+    """
+    document_frequency = Counter()
+    for sample in samples:
+        document_frequency.update(set(_FRAGMENT_PATTERN.findall(sample)))
+
+    ranked = sorted(
+        (fragment for fragment, count in document_frequency.items() if count >= 2),
+        key=lambda fragment: document_frequency[fragment] * len(fragment),
+        reverse=True
+    )
+
+    chosen = []
+    used = 0
+    for fragment in ranked:
+        if used + len(fragment) > max_size:
+            continue
+        chosen.append(fragment)
+        used += len(fragment)
+
+    default_dictionary = build_default_dictionary()
+    room = max_size - used
+    prefix = default_dictionary[-room:] if room > 0 else b""
+    return prefix + b"".join(reversed(chosen))
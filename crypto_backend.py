@@ -0,0 +1,280 @@
+import os
+import base64
+import struct
+from collections import deque
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM, ChaCha20Poly1305
+from cryptography.hazmat.primitives.kdf.hkdf import HKDF
+
+
+# Binary AEAD format: magic, format version, algorithm id, nonce, then ciphertext + tag.
+# The header and the blob id are authenticated as associated data, so a blob cannot be
+# swapped for another one on disk. Anything without the magic is a legacy Fernet token.
+AEAD_MAGIC = b"SJC"
+AEAD_FORMAT_VERSION = 1
+AEAD_NONCE_SIZE = 12
+_AEAD_HEADER = struct.Struct(">3sBB12s")
+
+DEFAULT_CIPHER = "aes-gcm"
+
+# Chunked (STREAM) format: magic, version 3, algorithm id, 16-byte random salt and the
+# chunk size, followed by the chunks. Each blob is sealed with its own key, derived from
+# the AEAD key and the salt with HKDF, and every chunk is sealed on its own with the nonce
+# 7 zero bytes + 4-byte chunk index + final-chunk flag. Chunks can therefore be produced,
+# consumed and processed in parallel independently, truncating or reordering chunks fails
+# to decrypt, and nonces never repeat under a key. Version 2 used the shared AEAD key with
+# a random 7-byte nonce prefix in place of the salt; it is still read.
+STREAM_FORMAT_VERSION = 3
+STREAM_CHUNK_SIZE = 256 * 1024
+STREAM_SALT_SIZE = 16
+AEAD_TAG_SIZE = 16
+_STREAM_HEADER = struct.Struct(">3sBB16sI")
+_STREAM_CHUNK_ID = struct.Struct(">IB")
+_STREAM_NONCE_PREFIX = bytes(7)
+
+_STREAM_V2_FORMAT_VERSION = 2
+_STREAM_V2_HEADER = struct.Struct(">3sBB7sI")
+_STREAM_HEADERS = {STREAM_FORMAT_VERSION: _STREAM_HEADER, _STREAM_V2_FORMAT_VERSION: _STREAM_V2_HEADER}
+
+# Chunks in flight at once when a thread pool seals/opens them
+STREAM_WINDOW = 8
+
+
+def derive_aead_key(master_key, purpose=b"securejournal blob aead v1"):
+    """Derive a 256-bit AEAD key from the journal's master (Fernet) key with HKDF-SHA256"""
+    hkdf = HKDF(algorithm=hashes.SHA256(), length=32, salt=None, info=purpose)
+    return hkdf.derive(base64.urlsafe_b64decode(master_key))
+
+
+class FernetBackend:
+    """The original format: Fernet tokens (AES-CBC + HMAC, base64); the blob id is not bound"""
+    name = "fernet"
+
+    def __init__(self, fernet):
+        self.fernet = fernet
+
+    def encrypt(self, data, blob_id):
+        return self.fernet.encrypt(data)
+
+    def decrypt(self, token, blob_id):
+        return self.fernet.decrypt(bytes(token))
+
+
+class AEADBackend:
+    """Binary AEAD format with the blob id as associated data"""
+
+    def __init__(self, name, algorithm_id, aead_class, key):
+        self.name = name
+        self.algorithm_id = algorithm_id
+        self.aead_class = aead_class
+        self.key = key
+        self.aead = aead_class(key)
+
+    def _stream_aead(self, salt):
+        """AEAD keyed for one chunked blob: HKDF of the AEAD key with the blob's random salt"""
+        hkdf = HKDF(algorithm=hashes.SHA256(), length=32, salt=salt, info=b"securejournal stream blob key v1")
+        return self.aead_class(hkdf.derive(self.key))
+
+    def encrypt(self, data, blob_id):
+        header = _AEAD_HEADER.pack(AEAD_MAGIC, AEAD_FORMAT_VERSION, self.algorithm_id, os.urandom(AEAD_NONCE_SIZE))
+        nonce = header[-AEAD_NONCE_SIZE:]
+        return header + self.aead.encrypt(nonce, data, header + blob_id.encode())
+
+    def decrypt(self, token, blob_id):
+        header = bytes(token[:_AEAD_HEADER.size])
+        nonce = header[-AEAD_NONCE_SIZE:]
+        return self.aead.decrypt(nonce, token[_AEAD_HEADER.size:], header + blob_id.encode())
+
+    def encrypt_stream(self, pieces, blob_id, write, executor=None, chunk_size=STREAM_CHUNK_SIZE):
+        """Encrypt an iterable of plaintext pieces into the chunked format, calling write()
+        for the header and each sealed chunk as soon as it is ready. Returns the bytes written.
+        """
+        salt = os.urandom(STREAM_SALT_SIZE)
+        header = _STREAM_HEADER.pack(AEAD_MAGIC, STREAM_FORMAT_VERSION, self.algorithm_id, salt, chunk_size)
+        aead = self._stream_aead(salt)
+        associated_data = header + blob_id.encode()
+
+        def seal(index, chunk, final):
+            nonce = _STREAM_NONCE_PREFIX + _STREAM_CHUNK_ID.pack(index, 1 if final else 0)
+            return aead.encrypt(nonce, chunk, associated_data)
+
+        write(header)
+        written = len(header)
+        for sealed in _run_in_order(seal, _numbered_chunks(_rechunk(pieces, chunk_size)), executor):
+            write(sealed)
+            written += len(sealed)
+        return written
+
+    def decrypt_stream(self, view, blob_id, executor=None, first_chunk=0, last_chunk=None):
+        """Yield the plaintext of chunks first_chunk..last_chunk of a chunked blob.
+
+        view is a memoryview over the whole blob (e.g. an mmap); chunks are opened straight
+        from slices of it, so the ciphertext is never copied.
+        """
+        header_format = _STREAM_HEADERS[view[len(AEAD_MAGIC)]]
+        header = bytes(view[:header_format.size])
+        _, version, _, salt_or_prefix, chunk_size = header_format.unpack(header)
+        if version == STREAM_FORMAT_VERSION:
+            aead, nonce_prefix = self._stream_aead(salt_or_prefix), _STREAM_NONCE_PREFIX
+        else:
+            aead, nonce_prefix = self.aead, salt_or_prefix
+        associated_data = header + blob_id.encode()
+        record_size = chunk_size + AEAD_TAG_SIZE
+        # The chunk that ends the blob is the final one; a blob cut at a chunk boundary
+        # therefore ends in a chunk sealed as non-final and is rejected
+        chunk_count = max(1, -(-(len(view) - header_format.size) // record_size))
+        if last_chunk is None or last_chunk >= chunk_count:
+            last_chunk = chunk_count - 1
+
+        def open_chunk(index):
+            start = header_format.size + index * record_size
+            nonce = nonce_prefix + _STREAM_CHUNK_ID.pack(index, 1 if index == chunk_count - 1 else 0)
+            return aead.decrypt(nonce, view[start:start + record_size], associated_data)
+
+        yield from _run_in_order(open_chunk, ((index,) for index in range(first_chunk, last_chunk + 1)), executor)
+
+
+def _rechunk(pieces, chunk_size):
+    """Regroup pieces of any size into chunk_size chunks; the last (possibly empty) chunk is shorter"""
+    buffer = bytearray()
+    for piece in pieces:
+        buffer += piece
+        while len(buffer) >= chunk_size:
+            yield bytes(buffer[:chunk_size])
+            del buffer[:chunk_size]
+    yield bytes(buffer)
+
+
+def _numbered_chunks(chunks):
+    """Turn chunks into (index, chunk, is_final) tuples"""
+    chunks = iter(chunks)
+    current = next(chunks)
+    index = 0
+    for following in chunks:
+        yield index, current, False
+        current = following
+        index += 1
+    yield index, current, True
+
+
+def _run_in_order(function, argument_tuples, executor):
+    """Map function over argument tuples, on the executor if given, yielding results in order.
+    Only a small window of chunks is in flight, so memory stays bounded by the chunk size.
+    """
+    if executor is None:
+        for arguments in argument_tuples:
+            yield function(*arguments)
+        return
+
+    pending = deque()
+    for arguments in argument_tuples:
+        pending.append(executor.submit(function, *arguments))
+        if len(pending) >= STREAM_WINDOW:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
+
+
+# Algorithm id in the AEAD header -> (cipher name, AEAD class)
+_AEAD_ALGORITHMS = {
+    1: ("aes-gcm", AESGCM),
+    2: ("chacha20-poly1305", ChaCha20Poly1305),
+}
+
+
+def available_ciphers():
+    """Names accepted for the "cipher" setting"""
+    return [FernetBackend.name] + [name for name, _ in _AEAD_ALGORITHMS.values()]
+
+
+class BlobCipher:
+    """Encrypts with the configured backend and decrypts whatever format a token is in.
+
+    Old Fernet blobs therefore keep loading after switching to an AEAD cipher, and they
+    are upgraded when they are next written.
+    """
+
+    def __init__(self, fernet, cipher_name=DEFAULT_CIPHER, master_key=None):
+        self.fernet_backend = FernetBackend(fernet)
+        self.aead_backends = {}
+        if master_key is not None:
+            aead_key = derive_aead_key(master_key)
+            for algorithm_id, (name, aead_class) in _AEAD_ALGORITHMS.items():
+                self.aead_backends[algorithm_id] = AEADBackend(name, algorithm_id, aead_class, aead_key)
+
+        self.backend = self.fernet_backend
+        for backend in self.aead_backends.values():
+            if backend.name == cipher_name:
+                self.backend = backend
+
+    @property
+    def name(self):
+        return self.backend.name
+
+    @property
+    def has_aead_key(self):
+        """Whether the AEAD formats can be used (a master key was given)"""
+        return bool(self.aead_backends)
+
+    @staticmethod
+    def is_aead(token):
+        """Whether a token starts like one of the AEAD formats, which need the master key"""
+        return bytes(token[:len(AEAD_MAGIC)]) == AEAD_MAGIC
+
+    @property
+    def supports_streaming(self):
+        """Whether encrypt_stream writes the chunked format (Fernet has no streaming form)"""
+        return self.backend is not self.fernet_backend
+
+    def encrypt(self, data, blob_id):
+        """Encrypt data bound to blob_id with the configured backend"""
+        return self.backend.encrypt(data, blob_id)
+
+    def encrypt_stream(self, pieces, blob_id, write, executor=None):
+        """Encrypt an iterable of plaintext pieces, writing as it goes; returns the bytes written"""
+        if not self.supports_streaming:
+            token = self.fernet_backend.encrypt(b"".join(pieces), blob_id)
+            write(token)
+            return len(token)
+        return self.backend.encrypt_stream(pieces, blob_id, write, executor)
+
+    def describe(self, token):
+        """Format of a token from its first bytes: {"format": "fernet", "aead" or "stream",
+        "algorithm": cipher name, "chunk_size": stream chunk size or None}"""
+        if token[:len(AEAD_MAGIC)] != AEAD_MAGIC or len(token) <= len(AEAD_MAGIC) + 1:
+            return {"format": "fernet", "algorithm": FernetBackend.name, "chunk_size": None}
+        version = token[len(AEAD_MAGIC)]
+        algorithm = _AEAD_ALGORITHMS.get(token[len(AEAD_MAGIC) + 1], ("unknown",))[0]
+        header_format = _STREAM_HEADERS.get(version)
+        if header_format is not None and len(token) >= header_format.size:
+            chunk_size = header_format.unpack_from(token)[4]
+            return {"format": "stream", "algorithm": algorithm, "chunk_size": chunk_size}
+        return {"format": "aead", "algorithm": algorithm, "chunk_size": None}
+
+    def decrypt(self, token, blob_id):
+        """Decrypt a token of any supported format that was bound to blob_id"""
+        return b"".join(self.decrypt_view(memoryview(token), blob_id))
+
+    def decrypt_view(self, view, blob_id, executor=None, first_chunk=0, last_chunk=None):
+        """Yield the plaintext of a token given as a memoryview (e.g. over an mmap).
+
+        Chunked tokens are opened chunk by chunk from slices of the view, and only chunks
+        first_chunk..last_chunk when a range is given; other formats yield one piece.
+        """
+        if view[:len(AEAD_MAGIC)] != AEAD_MAGIC:
+            yield self.fernet_backend.decrypt(view, blob_id)
+            return
+        version = view[len(AEAD_MAGIC)]
+        backend = self._aead_backend(view[len(AEAD_MAGIC) + 1])
+        if version in _STREAM_HEADERS:
+            yield from backend.decrypt_stream(view, blob_id, executor, first_chunk, last_chunk)
+        elif version == AEAD_FORMAT_VERSION:
+            yield backend.decrypt(view, blob_id)
+        else:
+            raise ValueError(f"Unsupported encrypted blob version: {version}")
+
+    def _aead_backend(self, algorithm_id):
+        backend = self.aead_backends.get(algorithm_id)
+        if backend is None:
+            raise ValueError(f"No key available for encrypted blob algorithm {algorithm_id}")
+        return backend
@@ -0,0 +1,182 @@
+import os
+import threading
+
+
+# "strict": fsync every write before it is acknowledged
+# "group": fsyncs are batched and run once per group_commit_window (a crash loses at most
+#          the writes of the last window; files are still replaced atomically). Files that
+#          a later write refers to (new blobs before their index log record) are synced
+#          ahead with sync_now, so the reference never becomes durable without them
+# "relaxed": leave flushing to the OS (files are still replaced atomically)
+DURABILITY_MODES = ("strict", "group", "relaxed")
+DEFAULT_DURABILITY = "group"
+DEFAULT_GROUP_COMMIT_WINDOW = 0.5
+
+
+def _fsync_file(path):
+    try:
+        fd = os.open(path, os.O_RDWR)
+    except FileNotFoundError:
+        # Replaced or removed since it was written; nothing left to flush
+        return
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def _fsync_directory(path):
+    """Make renames/creations in a directory durable (not possible on Windows)"""
+    if os.name == "nt":
+        return
+    try:
+        fd = os.open(path, os.O_RDONLY)
+    except FileNotFoundError:
+        # An empty shard directory pruned since; nothing left to flush
+        return
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+class DurabilityPolicy:
+    """Atomic file replacement plus an fsync policy shared by all storage writes"""
+
+    def __init__(self, mode=DEFAULT_DURABILITY, group_commit_window=DEFAULT_GROUP_COMMIT_WINDOW):
+        self.mode = mode if mode in DURABILITY_MODES else DEFAULT_DURABILITY
+        self.group_commit_window = group_commit_window
+        self.sync_count = 0
+        self._pending_files = []
+        self._pending_directories = set()
+        self._pending_callbacks = []
+        self._lock = threading.Lock()
+        self._timer = None
+
+    def atomic_write(self, path, write, barrier=False):
+        """Write a file through a temp file and an atomic rename; write(file) produces the
+        contents and its result is returned.
+
+        barrier=True makes this write durable before returning in every mode but "relaxed",
+        for writes that later steps depend on (e.g. an index snapshot before its log is cut).
+        """
+        temp_path = path + ".tmp"
+        try:
+            with open(temp_path, "wb") as f:
+                result = write(f)
+                if self.mode == "strict" or (barrier and self.mode == "group"):
+                    f.flush()
+                    os.fsync(f.fileno())
+                    self.sync_count += 1
+            os.replace(temp_path, path)
+        except BaseException:
+            try:
+                os.remove(temp_path)
+            except OSError:
+                pass
+            raise
+
+        directory = os.path.dirname(path)
+        if self.mode == "strict" or (barrier and self.mode == "group"):
+            _fsync_directory(directory)
+        elif self.mode == "group":
+            self._defer(path, directory)
+        return result
+
+    def make_directories(self, path):
+        """os.makedirs that also makes the new directory entries durable according to the mode"""
+        created = []
+        while path and not os.path.isdir(path):
+            created.append(path)
+            path = os.path.dirname(path)
+        for directory in reversed(created):
+            os.makedirs(directory, exist_ok=True)
+            if self.mode == "strict":
+                _fsync_directory(os.path.dirname(directory))
+            elif self.mode == "group":
+                self._defer(None, os.path.dirname(directory))
+
+    def move(self, source, destination):
+        """Atomically rename a file, making both directory entries durable according to the mode"""
+        os.replace(source, destination)
+        for directory in {os.path.dirname(source), os.path.dirname(destination)}:
+            if self.mode == "strict":
+                _fsync_directory(directory)
+            elif self.mode == "group":
+                self._defer(None, directory)
+
+    def written(self, f, barrier=False):
+        """Call after writing to a file in place (appending to or truncating the index log)"""
+        f.flush()
+        if self.mode == "strict" or (barrier and self.mode == "group"):
+            os.fsync(f.fileno())
+            self.sync_count += 1
+        elif self.mode == "group":
+            self._defer(f.name, None)
+
+    def sync_now(self, paths):
+        """In "group" mode, make files written with atomic_write durable now, with the
+        directory entries of their renames, ahead of a write that refers to them. Pending
+        files in those directories are synced too, so no rename becomes durable before
+        its data. "strict" has synced them already; "relaxed" leaves them to the OS."""
+        if self.mode != "group" or not paths:
+            return
+        paths = set(paths)
+        with self._lock:
+            directories = {os.path.dirname(path) for path in paths}
+            directories.update(directory for directory in self._pending_directories
+                               if any(path.startswith(directory + os.sep) for path in paths))
+            files = [path for path in self._pending_files
+                     if path in paths or os.path.dirname(path) in directories]
+            self._pending_files = [path for path in self._pending_files if path not in files]
+            self._pending_directories -= directories
+        for path in files:
+            _fsync_file(path)
+        for directory in directories:
+            _fsync_directory(directory)
+        self.sync_count += 1
+
+    def after_sync(self, callback, depends_on=()):
+        """Run callback() once the files in depends_on are durable: right away in "strict"
+        mode, otherwise after the next group commit has synced them. "relaxed" mode syncs
+        these too, for steps that must never become durable first (e.g. deleting a blob
+        before the index change that stopped referring to it)."""
+        if self.mode == "strict":
+            callback()
+            return
+        with self._lock:
+            self._pending_callbacks.append(callback)
+        for path in depends_on or (None,):
+            self._defer(path, None)
+
+    def _defer(self, path, directory):
+        """Queue an fsync for the next group commit"""
+        with self._lock:
+            if path is not None and path not in self._pending_files:
+                self._pending_files.append(path)
+            if directory is not None:
+                self._pending_directories.add(directory)
+            if self._timer is None:
+                self._timer = threading.Timer(self.group_commit_window, self.flush)
+                self._timer.daemon = True
+                self._timer.start()
+
+    def flush(self):
+        """Run every queued fsync now: file contents first, then the directories that hold
+        the renames, so a renamed file is never durable before its data; then the callbacks
+        waiting for them"""
+        with self._lock:
+            files, self._pending_files = self._pending_files, []
+            directories, self._pending_directories = self._pending_directories, set()
+            callbacks, self._pending_callbacks = self._pending_callbacks, []
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+        for path in files:
+            _fsync_file(path)
+        for directory in directories:
+            _fsync_directory(directory)
+        if files or directories:
+            self.sync_count += 1
+        for callback in callbacks:
+            callback()
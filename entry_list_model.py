@@ -0,0 +1,240 @@
+from PyQt5.QtCore import Qt, QAbstractListModel, QModelIndex, QSize, QRect
+from PyQt5.QtGui import QFont, QFontMetrics, QColor, QPalette
+from PyQt5.QtWidgets import QStyledItemDelegate, QStyle
+
+
+# Rows handed to the view per fetchMore() call
+FETCH_BATCH_SIZE = 200
+
+# Role that returns the JournalEntry object of a row
+EntryRole = Qt.UserRole + 1
+
+
+def entry_sort_key(entry):
+    """Sort key for the entry list: most recently modified first when sorted in reverse"""
+    return entry.modified_time or entry.created_time
+
+
+def format_word_count(word_count):
+    """Format a word count for the entry list"""
+    if word_count == 0:
+        return "No words"
+    elif word_count == 1:
+        return "1 word"
+    return f"{word_count} words"
+
+
+class EntryListModel(QAbstractListModel):
+    """List model over the JournalEntry records of the current notebook.
+
+    Rows are exposed to the view in batches through canFetchMore/fetchMore, so a
+    notebook with a very large number of entries only materializes what is scrolled to.
+    """
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self._entries = []
+        self._entries_by_path = {}
+        self._loaded_count = 0
+
+    def set_entries(self, entries):
+        """Replace all rows with a new list of entries (sorted with entry_sort_key, newest first)"""
+        self.beginResetModel()
+        self._entries = entries
+        self._entries_by_path = {entry.file_path: entry for entry in entries}
+        self._loaded_count = min(FETCH_BATCH_SIZE, len(entries))
+        self.endResetModel()
+
+    def entries(self):
+        """The listed entries in row order (a copy, so later updates do not change it)"""
+        return list(self._entries)
+
+    def row_of_path(self, virtual_path):
+        """Get the row of the entry stored at a virtual path, or -1.
+
+        Binary search on the entry's sort key, then a step over the rows with an equal key.
+        """
+        entry = self._entries_by_path.get(virtual_path)
+        if entry is None:
+            return -1
+        key = entry_sort_key(entry)
+        row = self._insertion_row(entry)
+        while row < len(self._entries) and entry_sort_key(self._entries[row]) == key:
+            if self._entries[row] is entry:
+                return row
+            row += 1
+        # Only reached if the rows were handed over out of order
+        return self._entries.index(entry)
+
+    def place_entry(self, entry):
+        """Insert an entry, or update and re-position an existing one, keeping the sort order"""
+        old_row = self.row_of_path(entry.file_path)
+        if old_row < 0:
+            self._insert_row(self._insertion_row(entry), entry)
+            return
+
+        self._entries_by_path[entry.file_path] = entry
+        new_row = self._insertion_row(entry, skip_row=old_row)
+        if new_row == old_row:
+            self._entries[old_row] = entry
+            if old_row < self._loaded_count:
+                index = self.index(old_row)
+                self.dataChanged.emit(index, index)
+        elif old_row < self._loaded_count and new_row < self._loaded_count:
+            # A move keeps the view's selection on the entry
+            destination = new_row if new_row < old_row else new_row + 1
+            self.beginMoveRows(QModelIndex(), old_row, old_row, QModelIndex(), destination)
+            del self._entries[old_row]
+            self._entries.insert(new_row, entry)
+            self.endMoveRows()
+        else:
+            self._remove_row(old_row)
+            self._insert_row(new_row, entry)
+
+    def remove_path(self, virtual_path):
+        """Remove the entry stored at a virtual path, if it is listed"""
+        row = self.row_of_path(virtual_path)
+        if row >= 0:
+            del self._entries_by_path[virtual_path]
+            self._remove_row(row)
+
+    def _insertion_row(self, entry, skip_row=None):
+        """Binary search for the row of an entry in the newest-first order, ignoring skip_row"""
+        key = entry_sort_key(entry)
+        low = 0
+        high = len(self._entries) - (1 if skip_row is not None else 0)
+        while low < high:
+            middle = (low + high) // 2
+            actual_row = middle + 1 if skip_row is not None and middle >= skip_row else middle
+            if entry_sort_key(self._entries[actual_row]) > key:
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    def _insert_row(self, row, entry):
+        """Insert an entry, telling the view only when the row is within the fetched range"""
+        self._entries_by_path[entry.file_path] = entry
+        fully_fetched = self._loaded_count == len(self._entries)
+        if row < self._loaded_count or (row == self._loaded_count and fully_fetched):
+            self.beginInsertRows(QModelIndex(), row, row)
+            self._entries.insert(row, entry)
+            self._loaded_count += 1
+            self.endInsertRows()
+        else:
+            self._entries.insert(row, entry)
+
+    def _remove_row(self, row):
+        """Remove a row, telling the view only when the row is within the fetched range"""
+        if row < self._loaded_count:
+            self.beginRemoveRows(QModelIndex(), row, row)
+            del self._entries[row]
+            self._loaded_count -= 1
+            self.endRemoveRows()
+        else:
+            del self._entries[row]
+
+    def entry_at(self, row):
+        """Get the JournalEntry shown at a row, or None"""
+        if 0 <= row < len(self._entries):
+            return self._entries[row]
+        return None
+
+    def rowCount(self, parent=QModelIndex()):
+        if parent.isValid():
+            return 0
+        return self._loaded_count
+
+    def canFetchMore(self, parent=QModelIndex()):
+        if parent.isValid():
+            return False
+        return self._loaded_count < len(self._entries)
+
+    def fetchMore(self, parent=QModelIndex()):
+        if parent.isValid():
+            return
+        remaining = len(self._entries) - self._loaded_count
+        batch_size = min(FETCH_BATCH_SIZE, remaining)
+        if batch_size <= 0:
+            return
+        self.beginInsertRows(QModelIndex(), self._loaded_count, self._loaded_count + batch_size - 1)
+        self._loaded_count += batch_size
+        self.endInsertRows()
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid() or index.row() >= self._loaded_count:
+            return None
+
+        entry = self._entries[index.row()]
+        if role == Qt.DisplayRole:
+            return f"{entry.title}\n{entry.date}  •  {format_word_count(entry.word_count)}"
+        elif role == Qt.ToolTipRole:
+            return entry.preview or None
+        elif role == Qt.UserRole:
+            return index.row()
+        elif role == EntryRole:
+            return entry
+        return None
+
+
+class EntryItemDelegate(QStyledItemDelegate):
+    """Paints an entry row (title plus date/word count) with fonts and metrics built once"""
+
+    PADDING_X = 15
+    PADDING_Y = 12
+    LINE_SPACING = 4
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.title_font = QFont("Segoe UI", 11)
+        self.selected_title_font = QFont("Segoe UI", 11, QFont.Bold)
+        self.meta_font = QFont("Segoe UI", 9)
+        self.meta_color = QColor("#9ca3af")
+
+        self._title_metrics = QFontMetrics(self.title_font)
+        self._selected_title_metrics = QFontMetrics(self.selected_title_font)
+        self._title_height = self._selected_title_metrics.height()
+        self._meta_height = QFontMetrics(self.meta_font).height()
+        self._row_height = (self.PADDING_Y * 2 + self._title_height
+                            + self.LINE_SPACING + self._meta_height)
+
+    def sizeHint(self, option, index):
+        return QSize(option.rect.width(), self._row_height)
+
+    def paint(self, painter, option, index):
+        entry = index.data(EntryRole)
+        if entry is None:
+            return
+
+        # Background (selection/hover) comes from the style so the stylesheet still applies
+        self.initStyleOption(option, index)
+        option.text = ""
+        widget = option.widget
+        style = widget.style() if widget is not None else None
+        if style is not None:
+            style.drawPrimitive(QStyle.PE_PanelItemViewItem, option, painter, widget)
+
+        selected = bool(option.state & QStyle.State_Selected)
+        text_rect = option.rect.adjusted(self.PADDING_X, self.PADDING_Y, -self.PADDING_X, -self.PADDING_Y)
+
+        painter.save()
+
+        if selected:
+            title_font, title_metrics = self.selected_title_font, self._selected_title_metrics
+        else:
+            title_font, title_metrics = self.title_font, self._title_metrics
+        painter.setFont(title_font)
+        painter.setPen(option.palette.color(QPalette.HighlightedText if selected else QPalette.Text))
+        title_rect = QRect(text_rect.left(), text_rect.top(), text_rect.width(), self._title_height)
+        title = title_metrics.elidedText(entry.title, Qt.ElideRight, text_rect.width())
+        painter.drawText(title_rect, Qt.AlignLeft | Qt.AlignVCenter, title)
+
+        painter.setFont(self.meta_font)
+        if not selected:
+            painter.setPen(self.meta_color)
+        meta_rect = QRect(text_rect.left(), title_rect.bottom() + 1 + self.LINE_SPACING,
+                          text_rect.width(), self._meta_height)
+        painter.drawText(meta_rect, Qt.AlignLeft | Qt.AlignVCenter,
+                         f"{entry.date}  •  {format_word_count(entry.word_count)}")
+
+        painter.restore()
@@ -1,18 +1,24 @@
 import os
 import json
-import base64
-import re
+import functools
 from datetime import datetime, timedelta
-from PyQt5.QtWidgets import QMessageBox, QListWidgetItem, QFileDialog, QInputDialog, QDialog, QVBoxLayout, QHBoxLayout, QPushButton, QLabel, QSlider, QCheckBox
+from PyQt5.QtWidgets import QMessageBox, QListWidgetItem, QFileDialog, QInputDialog, QDialog, QVBoxLayout, QHBoxLayout, QPushButton, QLabel, QSlider, QCheckBox, QProgressDialog
 from PyQt5.QtCore import Qt
-from PyQt5.QtGui import QPixmap, QTextCursor
 from journal_entry import JournalEntry
 from secure_storage_manager import SecureStorageManager
-import json
+from sqlite_storage_manager import SQLiteStorageManager
+from image_store import ImageStore, has_inline_images, image_ids_in, image_url
+from image_ingest import prepare_image, read_image_size
+from entry_list_model import EntryRole, FETCH_BATCH_SIZE, entry_sort_key
+from storage_task_thread import StorageTaskThread
+
+
+# Number of plain-text characters kept in the index as an entry preview
+ENTRY_PREVIEW_LENGTH = 120
 
 
 class ImageResizeDialog(QDialog):
-    def __init__(self, parent=None, current_size=(600, 400)):
+    def __init__(self, parent=None, current_size=(600, 400), show_keep_original=False):
         super().__init__(parent)
         self.setWindowTitle("Resize Image")
         self.setModal(True)
@@ -81,6 +87,11 @@ class ImageResizeDialog(QDialog):
         self.maintain_aspect.stateChanged.connect(self.update_size_labels)
         layout.addWidget(self.maintain_aspect)
         
+        # Inserted images are stored downscaled; the full-size file only on request
+        self.keep_original_check = QCheckBox("Also keep the original full-size file")
+        self.keep_original_check.setVisible(show_keep_original)
+        layout.addWidget(self.keep_original_check)
+        
         # Buttons
         buttons_layout = QHBoxLayout()
         
@@ -156,16 +167,36 @@ class ImageResizeDialog(QDialog):
         else:
             height = int(width * 0.75)
         return width, height
+    
+    def keep_original(self):
+        return self.keep_original_check.isChecked()
 
 
 class EntryManager:
     def __init__(self, parent):
         self.parent = parent
-        # Initialize secure storage manager
-        self.secure_storage = SecureStorageManager(
+        # Initialize secure storage manager (blob files, or a SQLite database)
+        storage_class = SQLiteStorageManager if self.parent.config["storage_backend"] == "sqlite" else SecureStorageManager
+        self.secure_storage = storage_class(
             self.parent.journal_dir, 
-            self.parent.fernet
+            self.parent.fernet,
+            cache_max_bytes=self.parent.config["cache_max_bytes"],
+            cache_max_entries=self.parent.config["cache_max_entries"],
+            compression=self.parent.config["compression"],
+            compression_level=self.parent.config["compression_level"],
+            cipher=self.parent.config["cipher"],
+            master_key=self.parent.key,
+            durability=self.parent.config["durability"],
+            group_commit_window=self.parent.config["group_commit_window_ms"] / 1000
         )
+        # Images are stored once, outside the entries that show them
+        self.image_store = ImageStore(self.secure_storage)
+        self._loading_entries = False
+        self._storage_task = None
+        self._image_task = None
+        
+        # Keep the entry list in step with storage changes instead of reloading it
+        self.secure_storage.add_listener(self.on_storage_events)
 
     def new_entry(self):
         if self.parent.unsaved_changes:
@@ -212,24 +243,37 @@ class EntryManager:
             else:
                 virtual_path = f"notebooks/{self.parent.current_notebook}/{date_str}/{safe_title}_{timestamp}.enc"
             
-            # If updating existing entry, use the same path
+            created_time = now.isoformat()
+            
+            # If updating existing entry, use the same path and keep its creation date
             if self.parent.current_entry_path:
                 virtual_path = self.parent.current_entry_path
+                file_info = self.secure_storage.get_file_info(virtual_path)
+                if file_info and file_info.get("metadata"):
+                    date_str = file_info["metadata"].get("date", date_str)
+                    created_time = file_info["metadata"].get("created_time", created_time)
             
-            # Create entry data with embedded images
+            plain_text = self.parent.editor.toPlainText()
+            
+            # Create entry data; images are referenced, not embedded
             entry_data = {
                 "title": title,
                 "content": content,
-                "plain_text": self.parent.editor.toPlainText(),  # For word count and search
+                "plain_text": plain_text,  # For word count and search
                 "date": date_str,
-                "created_time": now.isoformat(),
-                "word_count": len(self.parent.editor.toPlainText().split()),
+                "created_time": created_time,
+                "modified_time": now.isoformat(),
+                "word_count": len(plain_text.split()),
                 "has_images": self._has_images(content),
                 "notebook": self.parent.current_notebook
             }
             
-            # Store the encrypted entry using secure storage
-            self.secure_storage.store_file(virtual_path, entry_data)
+            # Store the encrypted entry using secure storage, with its summary in the index.
+            # Newly pasted images move to the image store, so an entry whose images are all
+            # stored already only writes its text
+            with self.secure_storage.transaction():
+                entry_data["content"], _ = self.image_store.extract_images(content, self.parent.editor.loaded_images())
+                self.secure_storage.store_file(virtual_path, entry_data, self._build_entry_metadata(entry_data))
             
             self.parent.current_entry_path = virtual_path
             self.parent.unsaved_changes = False
@@ -241,10 +285,7 @@ class EntryManager:
             save_time_str = now.strftime("%H:%M:%S")
             self.parent.last_saved_label.setText(f"Saved at {save_time_str}")
             
-            
-            # IMPORTANT: Reload entries AFTER saving to show the new entry
-            self.load_recent_entries()
-            self.parent.notebook_manager.load_notebooks()
+            # The entry list and notebook counts follow through storage change events
             
         except Exception as e:
             QMessageBox.critical(self.parent, "Save Error", f"Failed to save entry: {str(e)}")
@@ -253,17 +294,49 @@ class EntryManager:
         """Check if HTML content contains images"""
         return "<img" in html_content.lower()
     
+    def _build_entry_metadata(self, entry_data):
+        """Build the small entry summary kept in the encrypted index for the entry list"""
+        plain_text = entry_data.get("plain_text", "")
+        created_time = entry_data.get("created_time", "")
+        return {
+            "title": entry_data.get("title", "Untitled"),
+            "date": entry_data.get("date", ""),
+            "created_time": created_time,
+            "modified_time": entry_data.get("modified_time", created_time),
+            "word_count": entry_data.get("word_count", len(plain_text.split())),
+            "has_images": entry_data.get("has_images", False),
+            "preview": " ".join(plain_text.split())[:ENTRY_PREVIEW_LENGTH],
+            # Stored images the entry shows; the storage keeps them while they are listed here
+            "images": image_ids_in(entry_data.get("content", ""))
+        }
+    
+    def load_entry_data(self, virtual_path, buffer=None):
+        """Decrypt and return the full data of a single entry.
+        
+        Bulk readers pass a reusable bytearray as buffer; the entry is then decoded into it
+        instead of going through the blob cache.
+        """
+        if buffer is not None:
+            if self.secure_storage.load_file_into(virtual_path, buffer) is None:
+                return None
+            return json.loads(buffer)
+        
+        decrypted_data = self.secure_storage.load_file(virtual_path)
+        if decrypted_data is None:
+            return None
+        # json.loads takes the UTF-8 bytes directly, without an intermediate str copy
+        return json.loads(decrypted_data)
+    
+    def get_notebook_prefix(self, notebook_name):
+        """Get the virtual path prefix that holds a notebook's entries"""
+        if notebook_name == "Default":
+            return "default/"
+        return f"notebooks/{notebook_name}/"
+    
     def get_notebook_entry_count(self, notebook_name):
         """Get the number of entries in a specific notebook"""
         try:
-            if notebook_name == "Default":
-                path_prefix = "default/"
-            else:
-                path_prefix = f"notebooks/{notebook_name}/"
-            
-            files = self.secure_storage.list_files(path_prefix)
-            entry_files = [f for f in files if f["virtual_path"].endswith('.enc')]
-            return len(entry_files)
+            return self.secure_storage.get_notebook_stats(notebook_name)["total_entries"]
             
         except Exception as e:
             print(f"Error counting entries for notebook {notebook_name}: {e}")
@@ -271,86 +344,99 @@ class EntryManager:
     
     def load_recent_entries(self):
         """Load and display recent entries with enhanced formatting"""
+        self._loading_entries = True
         try:
             # Get current notebook path
-            if self.parent.current_notebook == "Default":
-                path_prefix = "default/"
-            else:
-                path_prefix = f"notebooks/{self.parent.current_notebook}/"
+            path_prefix = self.get_notebook_prefix(self.parent.current_notebook)
             
-            # Get files from secure storage
+            # Get files from secure storage; the entry summaries come from the encrypted index
             files = self.secure_storage.list_files(path_prefix)
             entries = []
             
-            for file_info in files:
-                try:
-                    virtual_path = file_info["virtual_path"]
-                    if not virtual_path.endswith('.enc'):
-                        continue
-                    
-                    encrypted_data = self.secure_storage.load_file(virtual_path)
-                    if encrypted_data is None:
+            # Entries saved before summaries were indexed get theirs backfilled once
+            load_buffer = bytearray()
+            with self.secure_storage.transaction():
+                for file_info in files:
+                    try:
+                        virtual_path = file_info["virtual_path"]
+                        if not virtual_path.endswith('.enc'):
+                            continue
+                        
+                        metadata = file_info.get("metadata")
+                        if metadata is None:
+                            entry_data = self.load_entry_data(virtual_path, load_buffer)
+                            if entry_data is None:
+                                continue
+                            metadata = self._build_entry_metadata(entry_data)
+                            self.secure_storage.update_metadata(virtual_path, metadata)
+                        
+                        # Compact summary record; the body is decrypted only when opened
+                        entries.append(JournalEntry.from_metadata(
+                            virtual_path, metadata, self.parent.current_notebook
+                        ))
+                        
+                    except Exception as e:
+                        print(f"Error loading entry: {e}")
                         continue
-                    
-                    entry_data = json.loads(encrypted_data.decode())
-                    
-                    # Create a proper entry dict with the virtual_path
-                    entry_dict = {
-                        "title": entry_data.get("title", "Untitled"),
-                        "content": entry_data.get("content", ""),
-                        "plain_text": entry_data.get("plain_text", entry_data.get("content", "")),
-                        "date": entry_data.get("date", ""),
-                        "created_time": entry_data.get("created_time", ""),
-                        "word_count": entry_data.get("word_count", 0),
-                        "has_images": entry_data.get("has_images", False),
-                        "notebook": entry_data.get("notebook", self.parent.current_notebook),
-                        "virtual_path": virtual_path  # IMPORTANT: Include the path
-                    }
-                    entries.append(entry_dict)
-                    
-                except Exception as e:
-                    print(f"Error loading entry: {e}")
-                    continue
-            
-            # Sort entries by creation time (most recent first)
-            entries.sort(key=lambda x: x.get("created_time", ""), reverse=True)
-            
-            # Convert dicts to JournalEntry objects for compatibility
-            entry_objs = []
-            for entry in entries:
-                from journal_entry import JournalEntry
-                
-                je = JournalEntry(
-                    entry["title"], 
-                    entry["plain_text"], 
-                    entry["date"], 
-                    entry["virtual_path"]  # Use the correct path
-                )
-                je.word_count = entry["word_count"]
-                je.created_time = entry["created_time"]
-                je.has_images = entry["has_images"]
-                je.html_content = entry["content"]  # Store HTML content
-                entry_objs.append(je)
             
-            # Update the UI with formatted entries
-            self.parent.ui_components.update_entry_list_with_formatting(entry_objs)
+            # Sort entries by last modification (most recent first)
+            entries.sort(key=entry_sort_key, reverse=True)
             
-            # Update the entries list for compatibility
-            self.parent.entries = entry_objs
+            # Update the UI with formatted entries; the model owns the list from here on
+            self.parent.ui_components.update_entry_list_with_formatting(entries)
             
         except Exception as e:
             print(f"Error loading recent entries: {e}")
-            self.parent.entry_list.clear()
-            self.parent.entries = []
+            self.parent.ui_components.update_entry_list_with_formatting([])
+        finally:
+            self._loading_entries = False
+    
+    def on_storage_events(self, events):
+        """Apply storage changes to the current notebook's entry list one row at a time"""
+        if self._loading_entries:
+            return
+        
+        path_prefix = self.get_notebook_prefix(self.parent.current_notebook)
+        relevant_events = [
+            event for event in events
+            if event["path"].endswith('.enc') and (
+                event["path"].startswith(path_prefix)
+                or (event.get("old_path") or "").startswith(path_prefix)
+            )
+        ]
+        if not relevant_events:
+            return
+        
+        # Large bulk changes are cheaper to pick up with one reload
+        if len(relevant_events) > FETCH_BATCH_SIZE:
+            self.load_recent_entries()
+            return
+        
+        model = self.parent.entry_list_model
+        for event in relevant_events:
+            virtual_path = event["path"]
+            if event["type"] == "removed":
+                model.remove_path(virtual_path)
+                continue
+            
+            if event["type"] == "moved" and event["old_path"].startswith(path_prefix):
+                model.remove_path(event["old_path"])
+            
+            metadata = (event.get("info") or {}).get("metadata")
+            if virtual_path.startswith(path_prefix) and metadata is not None:
+                model.place_entry(JournalEntry.from_metadata(
+                    virtual_path, metadata, self.parent.current_notebook
+                ))
             
     def load_selected_entry(self, item):
-        # Safely capture index FIRST (before any dialogs/saves)
+        # Safely capture the entry FIRST (before any dialogs/saves); it comes from the model,
+        # whose rows move as storage events update it, so hold on to the entry itself
         try:
-            index = item.data(Qt.UserRole) if item is not None else None
+            entry = item.data(EntryRole) if item is not None else None
         except RuntimeError:
             # item already invalid
             return
-        if index is None or index < 0 or index >= len(self.parent.entries):
+        if entry is None:
             return
 
         if self.parent.unsaved_changes:
@@ -360,25 +446,25 @@ class EntryManager:
                 QMessageBox.Yes | QMessageBox.No | QMessageBox.Cancel
             )
             if reply == QMessageBox.Yes:
-                self.save_entry()  # this repopulates the list and invalidates 'item'
+                self.save_entry()  # this may re-order the list rows
             elif reply == QMessageBox.Cancel:
                 return
-            # DO NOT touch 'item' here; it may be deleted now
-
-        # Use the captured index against the current entries list
-        if not (0 <= index < len(self.parent.entries)):
-            return  # list might have changed shape; fail safe
 
         try:
-            entry = self.parent.entries[index]
+            entry_data = self.load_entry_data(entry.file_path)
+            if entry_data is None:
+                return
+            if entry_data.get("content") and has_inline_images(entry_data["content"]):
+                entry_data = self._move_inline_images(entry.file_path, entry_data)
+            
             self.parent.current_entry = entry
             self.parent.current_entry_path = entry.file_path
             self.parent.entry_title.setText(entry.title)
 
-            if hasattr(entry, 'html_content') and entry.html_content:
-                self.parent.editor.setHtml(entry.html_content)
+            if entry_data.get("content"):
+                self.parent.editor.setHtml(entry_data["content"])
             else:
-                self.parent.editor.setPlainText(entry.content)
+                self.parent.editor.setPlainText(entry_data.get("plain_text", ""))
 
             self.parent.date_label.setText(datetime.strptime(entry.date, "%Y-%m-%d").strftime("%B %d, %Y"))
             self.parent.unsaved_changes = False
@@ -388,6 +474,23 @@ class EntryManager:
             return
 
     
+    def _move_inline_images(self, virtual_path, entry_data):
+        """Move the data: URL images of an entry saved before the image store into the store.
+        
+        Qt would decode every embedded image on the GUI thread as the entry is laid out;
+        stored images are loaded lazily as they scroll into view. The entry is rewritten
+        once, keeping its modification time. Returns the entry data to show.
+        """
+        try:
+            with self.secure_storage.transaction():
+                content, _ = self.image_store.extract_images(entry_data["content"])
+                entry_data = dict(entry_data, content=content)
+                self.secure_storage.store_file(virtual_path, entry_data, self._build_entry_metadata(entry_data))
+        except Exception as e:
+            # The entry still opens with its embedded images
+            print(f"Error moving entry images to the image store: {e}")
+        return entry_data
+    
     def delete_entry(self):
         if not self.parent.current_entry_path:
             QMessageBox.information(self.parent, "No Entry", "No entry selected to delete.")
@@ -400,11 +503,53 @@ class EntryManager:
             try:
                 self.secure_storage.delete_file(self.parent.current_entry_path)
                 self.new_entry()
-                self.load_recent_entries()
-                self.parent.notebook_manager.load_notebooks()
             except Exception as e:
                 QMessageBox.critical(self.parent, "Delete Error", f"Failed to delete entry: {str(e)}")
     
+    def move_entry(self, virtual_path, target_notebook):
+        """Move an entry to another notebook by remapping its virtual path (no re-encryption)"""
+        # Entry paths are "default/<date>/<file>" or "notebooks/<name>/<date>/<file>"
+        if virtual_path.startswith("default/"):
+            relative_path = virtual_path[len("default/"):]
+        else:
+            relative_path = virtual_path.split("/", 2)[2]
+        
+        new_virtual_path = self.get_notebook_prefix(target_notebook) + relative_path
+        if new_virtual_path == virtual_path:
+            return virtual_path
+        
+        self.secure_storage.move_file(virtual_path, new_virtual_path)
+        return new_virtual_path
+    
+    def move_current_entry(self):
+        """Ask for a target notebook and move the open entry there"""
+        if not self.parent.current_entry_path:
+            QMessageBox.information(self.parent, "No Entry", "No entry selected to move.")
+            return
+        
+        notebooks = ["Default"] + [name for name in self.secure_storage.list_notebooks() if name != "Default"]
+        notebooks = [name for name in notebooks if name != self.parent.current_notebook]
+        if not notebooks:
+            QMessageBox.information(self.parent, "Move Entry", "There is no other notebook to move this entry to.")
+            return
+        
+        target_notebook, ok = QInputDialog.getItem(
+            self.parent, "Move Entry", "Move this entry to notebook:", notebooks, 0, False
+        )
+        if not ok:
+            return
+        
+        if self.parent.unsaved_changes:
+            self.save_entry()
+            if self.parent.unsaved_changes:
+                return
+        
+        try:
+            self.move_entry(self.parent.current_entry_path, target_notebook)
+            self.new_entry()
+        except Exception as e:
+            QMessageBox.critical(self.parent, "Move Error", f"Failed to move entry: {str(e)}")
+    
     def export_journal(self):
         file_path, _ = QFileDialog.getSaveFileName(self.parent, "Export Journal", 
                                                   f"journal_export_{datetime.now().strftime('%Y%m%d')}.html",
@@ -435,8 +580,13 @@ class EntryManager:
                         """.format(datetime.now().strftime("%B %d, %Y at %H:%M")))
                         
                         # Sort entries by date for export (newest first)
-                        sorted_entries = sorted(self.parent.entries, key=lambda x: x.created_time, reverse=True)
+                        sorted_entries = sorted(self.parent.entry_list_model.entries(), key=lambda x: x.created_time, reverse=True)
+                        load_buffer = bytearray()
                         for entry in sorted_entries:
+                            # Entry bodies are decrypted one at a time, only for the export
+                            entry_data = self.load_entry_data(entry.file_path, load_buffer) or {}
+                            entry_html = entry_data.get("content") or entry_data.get("plain_text", "").replace('\n', '<br>')
+                            entry_html = self.image_store.inline_images(entry_html)
                             f.write(f"""
                             <div class="entry">
                                 <div class="entry-header">
@@ -444,7 +594,7 @@ class EntryManager:
                                     <div class="entry-meta">{entry.date} • {entry.word_count} words</div>
                                 </div>
                                 <div class="entry-content">
-                                    {getattr(entry, 'html_content', entry.content.replace('\n', '<br>'))}
+                                    {entry_html}
                                 </div>
                             </div>
                             """)
@@ -453,13 +603,15 @@ class EntryManager:
                     else:
                         # Export as plain text
                         f.write("=== JOURNAL EXPORT ===\n\n")
-                        sorted_entries = sorted(self.parent.entries, key=lambda x: x.created_time, reverse=True)
+                        sorted_entries = sorted(self.parent.entry_list_model.entries(), key=lambda x: x.created_time, reverse=True)
+                        load_buffer = bytearray()
                         for entry in sorted_entries:
                             f.write(f"Title: {entry.title}\n")
                             f.write(f"Date: {entry.date}\n")
                             f.write(f"Words: {entry.word_count}\n")
                             f.write("-" * 50 + "\n")
-                            f.write(entry.content)
+                            entry_data = self.load_entry_data(entry.file_path, load_buffer) or {}
+                            f.write(entry_data.get("plain_text", ""))
                             f.write("\n\n" + "=" * 50 + "\n\n")
                 
                 QMessageBox.information(self.parent, "Export Complete", 
@@ -468,7 +620,11 @@ class EntryManager:
                 QMessageBox.critical(self.parent, "Export Error", f"Failed to export journal: {str(e)}")
     
     def insert_image(self):
-        """Insert an image into the current entry with size options"""
+        """Insert an image into the current entry with size options.
+        
+        The file is decoded, downscaled and re-encoded (without its metadata) on a worker
+        thread, then stored in the image store; the original is kept only if asked for.
+        """
         file_path, _ = QFileDialog.getOpenFileName(
             self.parent, 
             "Insert Image", 
@@ -478,112 +634,98 @@ class EntryManager:
         
         if file_path:
             try:
-                # Load image to get dimensions
-                pixmap = QPixmap(file_path)
-                original_width = pixmap.width()
-                original_height = pixmap.height()
+                # Read the dimensions from the file header; the pixels are decoded later, off the UI thread
+                original_width, original_height = read_image_size(file_path)
+                if original_width <= 0 or original_height <= 0:
+                    raise Exception("the file is not a supported image")
                 
                 # Show resize dialog
-                dialog = ImageResizeDialog(self.parent, (original_width, original_height))
+                dialog = ImageResizeDialog(self.parent, (original_width, original_height), show_keep_original=True)
                 if dialog.exec_() != QDialog.Accepted:
                     return
                 
                 width, height = dialog.get_size()
                 
-                # Read and encode the image
-                with open(file_path, "rb") as img_file:
-                    img_data = img_file.read()
-                
-                # Convert to base64 for embedding
-                img_base64 = base64.b64encode(img_data).decode()
-                
-                # Determine the image type
-                file_ext = os.path.splitext(file_path)[1].lower()
-                if file_ext == '.jpg':
-                    file_ext = '.jpeg'
-                
-                # Create the data URL
-                data_url = f"data:image/{file_ext[1:]};base64,{img_base64}"
-                
-                # Create comprehensive style string
-                style = (
-                    f"width: {width}px; "
-                    f"height: {height}px; "
-                    f"max-width: 100%; "
-                    f"display: block; "
-                    f"margin: 10px auto; "
-                    f"border-radius: 4px; "
-                    f"box-shadow: 0 2px 8px rgba(0,0,0,0.3); "
-                    f"cursor: pointer; "
-                    f"object-fit: contain;"
-                )
-                
-                # Insert the image into the editor
+                # Insert where the cursor is now; the cursor follows edits made meanwhile, but
+                # the progress dialog only turns modal after a delay, so the entry may be
+                # switched (and the document reused for another one) before the image is ready
                 cursor = self.parent.editor.textCursor()
-                
-                # Create an HTML img tag with the embedded image and styling
-                img_html = (
-                    f'<p><img src="{data_url}" '
-                    f'style="{style}" '
-                    f'width="{width}" '
-                    f'height="{height}" '
-                    f'alt="Embedded Image" '
-                    f'title="Click and use Ctrl+T to resize" '
-                    f'></p>'
+                entry_path = self.parent.current_entry_path
+                document_generation = self.parent.editor.document_generation
+                task = functools.partial(
+                    prepare_image, file_path,
+                    self.parent.config["image_max_dimension"],
+                    self.parent.config["image_quality"],
+                    dialog.keep_original()
                 )
                 
-                cursor.insertHtml(img_html)
+                def on_result(thread, prepared):
+                    if prepared is None:
+                        return
+                    if (self.parent.current_entry_path != entry_path
+                            or self.parent.editor.document_generation != document_generation):
+                        QMessageBox.information(
+                            self.parent, "Insert Image",
+                            "The image was not inserted because another entry was opened while it was being prepared."
+                        )
+                        return
+                    self._insert_prepared_image(cursor, prepared, width, height)
                 
-                # Mark as having unsaved changes
-                self.parent.unsaved_changes = True
-                self.parent.update_status()
+                self._run_storage_task(task, "Insert Image", "Preparing image...", on_result, slot="_image_task")
                 
             except Exception as e:
                 QMessageBox.critical(self.parent, "Image Error", f"Failed to insert image: {str(e)}")
     
-    def resize_selected_image(self):
-        """Properly resize the currently selected image in the editor"""
-        cursor = self.parent.editor.textCursor()
-        
-        # First, try to find if cursor is inside an image element
-        selected_html = ""
-        image_found = False
-        
-        if cursor.hasSelection():
-            # User has selected text, check if it contains an image
-            selected_html = cursor.selection().toHtml()
-            image_found = "<img" in selected_html.lower()
-        else:
-            # No selection, try to find image at cursor position
-            # Get the entire document HTML and cursor position
-            document = self.parent.editor.document()
-            cursor_position = cursor.position()
+    def _insert_prepared_image(self, cursor, prepared, width, height):
+        """Store an image made by prepare_image and insert it at cursor"""
+        try:
+            # Store it once in the encrypted image store; the entry only refers to it
+            with self.secure_storage.transaction():
+                original_id = None
+                if prepared["original"] is not None:
+                    original_id = self.image_store.store_image(*prepared["original"])
+                image_id = self.image_store.store_image(prepared["data"], prepared["mime"], original_id,
+                                                        (prepared["width"], prepared["height"]))
             
-            # Move cursor to find nearby image tags
-            original_position = cursor_position
+            # Create comprehensive style string
+            style = (
+                f"width: {width}px; "
+                f"height: {height}px; "
+                f"max-width: 100%; "
+                f"display: block; "
+                f"margin: 10px auto; "
+                f"border-radius: 4px; "
+                f"box-shadow: 0 2px 8px rgba(0,0,0,0.3); "
+                f"cursor: pointer; "
+                f"object-fit: contain;"
+            )
+            
+            # Create an HTML img tag referencing the stored image, with styling
+            img_html = (
+                f'<p><img src="{image_url(image_id)}" '
+                f'style="{style}" '
+                f'width="{width}" '
+                f'height="{height}" '
+                f'alt="Embedded Image" '
+                f'title="Click and use Ctrl+T to resize" '
+                f'></p>'
+            )
             
-            # Search backwards and forwards for image tags
-            test_cursor = QTextCursor(cursor)
+            cursor.insertHtml(img_html)
             
-            # Try different selection strategies
-            for _ in range(50):  # Look up to 50 characters in each direction
-                test_cursor.setPosition(max(0, cursor_position - 25))
-                test_cursor.setPosition(min(document.characterCount(), cursor_position + 25), QTextCursor.KeepAnchor)
-                test_html = test_cursor.selection().toHtml()
-                
-                if "<img" in test_html.lower():
-                    cursor = test_cursor
-                    selected_html = test_html
-                    image_found = True
-                    break
-        
-        if not image_found:
-            # Try to select the entire line/paragraph containing cursor
-            cursor.select(QTextCursor.BlockUnderCursor)
-            selected_html = cursor.selection().toHtml()
-            image_found = "<img" in selected_html.lower()
-        
-        if not image_found:
+            # Mark as having unsaved changes
+            self.parent.unsaved_changes = True
+            self.parent.update_status()
+            
+        except Exception as e:
+            QMessageBox.critical(self.parent, "Image Error", f"Failed to insert image: {str(e)}")
+    
+    def resize_selected_image(self):
+        """Resize the image at the cursor (or in the selection) in place, through its QTextImageFormat"""
+        editor = self.parent.editor
+        found = editor.image_at(editor.textCursor())
+        
+        if found is None:
             QMessageBox.information(
                 self.parent, 
                 "No Image Found", 
@@ -594,110 +736,22 @@ class EntryManager:
             )
             return
         
-        # Extract current image dimensions from the HTML
-        current_width, current_height = self._extract_image_dimensions(selected_html)
+        position, image_format = found
         
         # Show resize dialog with current dimensions
-        dialog = ImageResizeDialog(self.parent, (current_width, current_height))
+        dialog = ImageResizeDialog(self.parent, editor.image_display_size(image_format))
         
         if dialog.exec_() != QDialog.Accepted:
             return
         
         new_width, new_height = dialog.get_size()
         
-        # Update the image in the HTML
-        updated_html = self._update_image_dimensions(selected_html, new_width, new_height)
+        # Only the character format changes: no HTML round-trip, the image is not decoded again
+        editor.set_image_size(position, new_width, new_height)
         
-        if updated_html != selected_html:
-            # Replace the selected HTML with updated HTML
-            cursor.removeSelectedText()
-            cursor.insertHtml(updated_html)
-            
-            # Mark as having unsaved changes
-            self.parent.unsaved_changes = True
-            self.parent.update_status()
-            
-        else:
-            QMessageBox.warning(
-                self.parent, 
-                "Resize Failed", 
-                "Could not resize the image. The image may not have proper formatting."
-            )
-    
-    def _extract_image_dimensions(self, html_content):
-        """Extract width and height from image HTML"""
-        # Default dimensions
-        default_width, default_height = 600, 400
-        
-        # Look for style attribute with width/height
-        style_match = re.search(r'style="([^"]*)"', html_content, re.IGNORECASE)
-        if style_match:
-            style_content = style_match.group(1)
-            
-            # Extract width from style
-            width_match = re.search(r'width:\s*(\d+)px', style_content, re.IGNORECASE)
-            height_match = re.search(r'height:\s*(\d+)px', style_content, re.IGNORECASE)
-            
-            if width_match and height_match:
-                return int(width_match.group(1)), int(height_match.group(1))
-            elif width_match:
-                width = int(width_match.group(1))
-                # Estimate height based on common aspect ratio
-                height = int(width * 0.67)  # 3:2 ratio
-                return width, height
-        
-        # Look for direct width/height attributes
-        width_match = re.search(r'width="(\d+)"', html_content, re.IGNORECASE)
-        height_match = re.search(r'height="(\d+)"', html_content, re.IGNORECASE)
-        
-        if width_match and height_match:
-            return int(width_match.group(1)), int(height_match.group(1))
-        elif width_match:
-            width = int(width_match.group(1))
-            height = int(width * 0.67)
-            return width, height
-        
-        return default_width, default_height
-
-    def _update_image_dimensions(self, html_content, new_width, new_height):
-        """Update the width and height in image HTML"""
-        
-        # Create the new style string
-        new_style_parts = [
-            f"width: {new_width}px",
-            f"height: {new_height}px",
-            "max-width: 100%",
-            "display: block",
-            "margin: 10px auto",
-            "border-radius: 4px",
-            "box-shadow: 0 2px 8px rgba(0,0,0,0.3)",
-            "cursor: pointer"
-        ]
-        new_style = "; ".join(new_style_parts) + ";"
-        
-        # Try to update existing style attribute
-        if 'style="' in html_content:
-            # Replace the existing style attribute
-            updated_html = re.sub(
-                r'style="[^"]*"', 
-                f'style="{new_style}"', 
-                html_content, 
-                flags=re.IGNORECASE
-            )
-        else:
-            # Add style attribute to img tag
-            updated_html = re.sub(
-                r'(<img[^>]*?)(/?>)', 
-                rf'\1 style="{new_style}"\2', 
-                html_content, 
-                flags=re.IGNORECASE
-            )
-        
-        # Also update any direct width/height attributes
-        updated_html = re.sub(r'width="[^"]*"', f'width="{new_width}"', updated_html, flags=re.IGNORECASE)
-        updated_html = re.sub(r'height="[^"]*"', f'height="{new_height}"', updated_html, flags=re.IGNORECASE)
-        
-        return updated_html
+        # Mark as having unsaved changes
+        self.parent.unsaved_changes = True
+        self.parent.update_status()
     
     def get_storage_stats(self):
         """Get statistics about the secure storage"""
@@ -709,19 +763,126 @@ class EntryManager:
                 "virtual_files": 0,
                 "physical_files": 0,
                 "total_size_bytes": 0,
-                "total_size_mb": 0.0
+                "total_size_mb": 0.0,
+                "image_bytes": 0,
+                "text_bytes": 0,
+                "notebook_bytes": {},
+                "unindexed_files": 0,
+                "reconciled_time": None,
+                "cache_hits": 0,
+                "cache_misses": 0,
+                "cache_evictions": 0,
+                "cache_entries": 0,
+                "cache_bytes": 0
             }
     
     def cleanup_storage(self):
-        """Clean up orphaned files in storage"""
-        try:
-            cleaned = self.secure_storage.cleanup_orphaned_files()
-            QMessageBox.information(
-                self.parent, 
-                "Cleanup Complete", 
-                f"Cleaned up {cleaned} orphaned files from secure storage."
+        """Clean up orphaned files in storage on a background thread, with a cancellable progress dialog"""
+        if self.secure_storage.index_recovery_pending():
+            # Entries only the set-aside index files list would lose their blobs and images
+            file_names = "\n".join(os.path.basename(path) for path in self.secure_storage.index_recovery_files)
+            reply = QMessageBox.warning(
+                self.parent, "Cleanup Storage",
+                "Parts of the storage index could not be read and were set aside:\n\n"
+                f"{file_names}\n\n"
+                "Entries only listed there may still use files in secure storage. Discard these "
+                "index files and let cleanup remove everything they refer to? This cannot be undone.",
+                QMessageBox.Yes | QMessageBox.No, QMessageBox.No
             )
-            return cleaned
-        except Exception as e:
-            QMessageBox.critical(self.parent, "Cleanup Error", f"Failed to cleanup storage: {str(e)}")
-            return 0
\ No newline at end of file
+            if reply != QMessageBox.Yes:
+                return
+            try:
+                self.secure_storage.confirm_index_recovery()
+            except Exception as e:
+                QMessageBox.critical(self.parent, "Cleanup Storage Error", str(e))
+                return
+
+        def on_result(thread, cleaned):
+            if thread.is_cancelled():
+                message = f"Cleanup cancelled. Removed {cleaned} orphaned files before stopping."
+            else:
+                message = f"Cleaned up {cleaned} orphaned files from secure storage."
+            QMessageBox.information(self.parent, "Cleanup Complete", message)
+            self.parent.update_storage_display()
+        
+        self._run_storage_task(self.secure_storage.cleanup_orphaned_files, "Cleanup Storage",
+                               "Scanning secure storage...", on_result)
+    
+    def reconcile_storage_stats(self, on_done=None):
+        """Recount the physical storage files on a background thread; on_done(stats) runs afterwards"""
+        def on_result(thread, stats):
+            if stats is not None:
+                self.parent.update_storage_display()
+                if on_done:
+                    on_done(stats)
+        
+        self._run_storage_task(self.secure_storage.reconcile_storage_stats, "Storage Statistics",
+                               "Measuring secure storage...", on_result)
+    
+    def migrate_storage_layout(self):
+        """Move blobs of the old flat storage layout into shard directories in the background"""
+        if not self.secure_storage.needs_layout_migration():
+            return
+        
+        def on_result(thread, moved):
+            self.parent.update_storage_display()
+        
+        self._run_storage_task(self.secure_storage.migrate_to_sharded_layout, "Storage Upgrade",
+                               "Reorganizing secure storage...", on_result, show_progress=False)
+    
+    def _run_storage_task(self, task, title, label, on_result, show_progress=True, slot="_storage_task"):
+        """Run task(progress_callback, cancel_event) on a StorageTaskThread behind a progress dialog
+        (or silently, with show_progress=False, for maintenance the user keeps working through).
+        slot names the attribute holding the running thread; one task runs per slot."""
+        running = getattr(self, slot)
+        if running is not None and running.isRunning():
+            QMessageBox.information(self.parent, title, "Another storage task is still running.")
+            return
+        
+        thread = StorageTaskThread(task, self.parent)
+        progress = None
+        if show_progress:
+            progress = QProgressDialog(label, "Cancel", 0, 0, self.parent)
+            progress.setWindowTitle(title)
+            progress.setWindowModality(Qt.WindowModal)
+            progress.setMinimumDuration(500)
+            progress.canceled.connect(thread.cancel)
+        
+        def on_progress(done, total):
+            if progress is not None:
+                progress.setMaximum(total)
+                progress.setValue(done)
+        
+        def on_task_result(result):
+            if progress is not None:
+                progress.reset()
+            on_result(thread, result)
+        
+        def on_error(error):
+            if progress is not None:
+                progress.reset()
+            QMessageBox.critical(self.parent, f"{title} Error", error)
+        
+        def on_finished():
+            setattr(self, slot, None)
+            if progress is not None:
+                progress.deleteLater()
+            thread.deleteLater()
+        
+        thread.progress_signal.connect(on_progress)
+        thread.result_signal.connect(on_task_result)
+        thread.error_signal.connect(on_error)
+        thread.finished.connect(on_finished)
+        setattr(self, slot, thread)
+        thread.start()
+    
+    def stop_background_tasks(self):
+        """Cancel running storage and image tasks, wait for their threads to finish and flush pending writes"""
+        for thread in (self._storage_task, self._image_task):
+            if thread is not None and thread.isRunning():
+                thread.cancel()
+                thread.wait()
+        self.parent.editor.stop_image_loading()
+        
+        # Run the fsyncs a group commit is still holding back
+        self.secure_storage.flush()
\ No newline at end of file
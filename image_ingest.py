@@ -0,0 +1,92 @@
+from PyQt5.QtCore import Qt, QBuffer, QByteArray, QIODevice, QSize
+from PyQt5.QtGui import QImage, QImageReader, QImageIOHandler
+
+
+# Longest side an inserted image is stored at; the editor shows images at most 1200 px wide
+DEFAULT_IMAGE_MAX_DIMENSION = 1600
+# JPEG quality for re-encoded photos
+DEFAULT_IMAGE_QUALITY = 85
+
+# Source formats kept lossless (screenshots, drawings); everything else is stored as JPEG
+_LOSSLESS_FORMATS = ("png", "gif", "bmp")
+
+
+def read_image_size(file_path):
+    """Displayed size of an image file from its header, without decoding the pixels"""
+    reader = QImageReader(file_path)
+    reader.setAutoTransform(True)
+    size = reader.size()
+    if reader.transformation() & QImageIOHandler.TransformationRotate90:
+        size = QSize(size.height(), size.width())
+    return size.width(), size.height()
+
+
+def _without_text(image):
+    """Copy of an image's pixels without its text keys (PNG text chunks, JPEG comments),
+    which QImageReader fills in and QImage.save would write back"""
+    pixels = image.constBits()
+    pixels.setsize(image.sizeInBytes())
+    stripped = QImage(bytes(pixels), image.width(), image.height(), image.bytesPerLine(), image.format()).copy()
+    stripped.setColorTable(image.colorTable())
+    return stripped
+
+
+def prepare_image(file_path, max_dimension=DEFAULT_IMAGE_MAX_DIMENSION, quality=DEFAULT_IMAGE_QUALITY,
+                  keep_original=False, progress_callback=None, cancel_event=None):
+    """Decode, orient, downscale and re-encode an image file for storage.
+
+    Runs on a worker thread (QImage, unlike QPixmap, is safe off the GUI thread). The
+    image is decoded with its EXIF orientation applied and scaled so its longest side is
+    at most max_dimension. Only the pixels are re-encoded, so no metadata (EXIF, GPS,
+    text chunks, comments) reaches the stored image. Images with transparency or from
+    lossless formats become PNG, photos JPEG at quality.
+    Returns {"data", "mime", "width", "height", "original": (bytes, mime) or None}, or
+    None when cancelled.
+    """
+    def report(step):
+        if progress_callback:
+            progress_callback(step, 4)
+        return cancel_event is not None and cancel_event.is_set()
+
+    try:
+        reader = QImageReader(file_path)
+        reader.setAutoTransform(True)
+        source_format = bytes(reader.format()).decode().lower()
+        image = reader.read()
+        if image.isNull():
+            raise Exception(reader.errorString())
+        if report(1):
+            return None
+
+        if max(image.width(), image.height()) > max_dimension:
+            image = image.scaled(max_dimension, max_dimension, Qt.KeepAspectRatio, Qt.SmoothTransformation)
+        image = _without_text(image)
+        if report(2):
+            return None
+
+        if image.hasAlphaChannel() or source_format in _LOSSLESS_FORMATS:
+            image_format, mime_type, save_quality = "PNG", "image/png", -1
+        else:
+            image_format, mime_type, save_quality = "JPEG", "image/jpeg", quality
+        encoded = QByteArray()
+        buffer = QBuffer(encoded)
+        buffer.open(QIODevice.WriteOnly)
+        if not image.save(buffer, image_format, save_quality):
+            raise Exception(f"could not encode {image_format}")
+        if report(3):
+            return None
+
+        original = None
+        if keep_original:
+            with open(file_path, "rb") as f:
+                original = (f.read(), f"image/{'jpeg' if source_format == 'jpg' else source_format or 'png'}")
+        report(4)
+        return {
+            "data": bytes(encoded),
+            "mime": mime_type,
+            "width": image.width(),
+            "height": image.height(),
+            "original": original
+        }
+    except Exception as e:
+        raise Exception(f"Failed to prepare image: {str(e)}")
@@ -0,0 +1,141 @@
+import re
+import base64
+import hashlib
+
+
+# Images live once per distinct content under images/<sha256 of the bytes>, as regular
+# encrypted storage files. Entry HTML refers to them with sjimg:<id> URLs, which the
+# editor resolves through its resource loader, and entry metadata lists the ids it uses
+# ("images"), which is what the storage reference-counts them by.
+IMAGE_URL_SCHEME = "sjimg"
+IMAGE_PATH_PREFIX = "images/"
+# Codec for image blobs: the bytes are JPEG/PNG-compressed already, zlib only costs CPU
+IMAGE_COMPRESSION = "raw"
+
+_DATA_URL_PATTERN = re.compile(r'src="data:(image/[\w.+-]+);base64,([A-Za-z0-9+/=\s]+)"')
+_IMAGE_URL_PATTERN = re.compile(r'src="' + IMAGE_URL_SCHEME + r':([0-9a-f]{64})"')
+
+
+def image_id_for(data):
+    """Content address of image bytes"""
+    return hashlib.sha256(data).hexdigest()
+
+
+def image_path(image_id):
+    """Virtual storage path of an image"""
+    return f"{IMAGE_PATH_PREFIX}{image_id}.img"
+
+
+def image_id_of_path(virtual_path):
+    """Image id of a virtual path under IMAGE_PATH_PREFIX, or None"""
+    if virtual_path.startswith(IMAGE_PATH_PREFIX) and virtual_path.endswith(".img"):
+        return virtual_path[len(IMAGE_PATH_PREFIX):-len(".img")]
+    return None
+
+
+def image_url(image_id):
+    # No "//": a 64-character id is not a valid host name for QUrl
+    return f"{IMAGE_URL_SCHEME}:{image_id}"
+
+
+def has_inline_images(html):
+    """Whether HTML still embeds images as data: URLs (entries saved before the image store)"""
+    return _DATA_URL_PATTERN.search(html) is not None
+
+
+def image_ids_in(html):
+    """Ids of the stored images an entry's HTML refers to, in order of first use"""
+    return list(dict.fromkeys(_IMAGE_URL_PATTERN.findall(html)))
+
+
+class ImageStore:
+    """Deduplicated, encrypted image storage on top of a SecureStorageManager"""
+
+    def __init__(self, storage):
+        self.storage = storage
+
+    def has_image(self, image_id):
+        return image_path(image_id) in self.storage.file_index
+
+    def store_image(self, data, mime_type, original_id=None, size=None):
+        """Store image bytes unless the same image is already stored; returns its id.
+
+        original_id names the stored original a downscaled image was made from; the image
+        lists it as a reference, so the original is kept exactly as long as the image.
+        size ((width, height) in px) lets the editor lay the image out before decoding it.
+        """
+        image_id = image_id_for(data)
+        if original_id == image_id:
+            # Re-encoding reproduced the original; an image must not keep itself alive
+            original_id = None
+        info = self.storage.get_file_info(image_path(image_id))
+        if info is None:
+            # has_images counts the bytes as image bytes in the storage statistics
+            metadata = {"mime": mime_type, "has_images": True}
+            if size is not None:
+                metadata["width"], metadata["height"] = size
+            if original_id is not None:
+                metadata["images"] = [original_id]
+            self.storage.store_file(image_path(image_id), data, metadata)
+        elif original_id is not None and original_id not in (info.get("metadata") or {}).get("images", []):
+            metadata = dict(info.get("metadata") or {})
+            metadata["images"] = metadata.get("images", []) + [original_id]
+            self.storage.update_metadata(image_path(image_id), metadata)
+        return image_id
+
+    def original_of(self, image_id):
+        """Id of the original kept for a downscaled image, or None"""
+        info = self.storage.get_file_info(image_path(image_id))
+        originals = ((info or {}).get("metadata") or {}).get("images") or []
+        return originals[0] if originals else None
+
+    def image_size(self, image_id):
+        """(width, height) recorded when the image was stored, or None"""
+        info = self.storage.get_file_info(image_path(image_id))
+        metadata = (info or {}).get("metadata") or {}
+        if "width" not in metadata or "height" not in metadata:
+            return None
+        return metadata["width"], metadata["height"]
+
+    def load_image(self, image_id):
+        """Image bytes, or None if the image is not stored"""
+        return self.storage.load_file(image_path(image_id))
+
+    def fetch_image(self, image_id):
+        """load_image for worker threads: only reads, never touches the index"""
+        return self.storage.fetch_file(image_path(image_id))
+
+    def mime_type(self, image_id):
+        info = self.storage.get_file_info(image_path(image_id))
+        if info is None:
+            return None
+        return (info.get("metadata") or {}).get("mime", "image/png")
+
+    def extract_images(self, html, known_images=None):
+        """Move data: URL images out of entry HTML into the store.
+
+        Returns the HTML with sjimg: references instead, and the ids it refers to.
+        known_images ({id: (bytes, mime type)}, e.g. what the editor has loaded) restores
+        referenced images that are no longer stored, such as an image whose last other
+        reference was deleted while this entry was open.
+        """
+        def store_match(match):
+            image_id = self.store_image(base64.b64decode(match.group(2)), match.group(1))
+            return f'src="{image_url(image_id)}"'
+
+        html = _DATA_URL_PATTERN.sub(store_match, html)
+        image_ids = image_ids_in(html)
+        for image_id in image_ids:
+            if not self.has_image(image_id) and known_images and image_id in known_images:
+                self.store_image(*known_images[image_id])
+        return html, image_ids
+
+    def inline_images(self, html):
+        """Replace sjimg: references with data: URLs (for exports that leave the app)"""
+        def inline_match(match):
+            data = self.load_image(match.group(1))
+            if data is None:
+                return match.group(0)
+            return f'src="data:{self.mime_type(match.group(1))};base64,{base64.b64encode(data).decode()}"'
+
+        return _IMAGE_URL_PATTERN.sub(inline_match, html)
@@ -23,7 +23,6 @@ class EncryptedJournal(QMainWindow):
         super().__init__()
         self.current_entry = None
         self.current_entry_path = None
-        self.entries = []
         self.unsaved_changes = False
         self.left_panel_visible = True
         
@@ -60,6 +59,9 @@ class EncryptedJournal(QMainWindow):
         # Update initial storage info
         self.update_storage_display()
         
+        # Journals from before the sharded storage layout are upgraded in the background
+        self.entry_manager.migrate_storage_layout()
+        
     def setup_shortcuts(self):
         """Setup keyboard shortcuts"""
         # Image resize shortcut
@@ -74,6 +76,10 @@ class EncryptedJournal(QMainWindow):
         new_shortcut = QShortcut(QKeySequence("Ctrl+N"), self)
         new_shortcut.activated.connect(self.new_entry)
         
+        # Move entry to another notebook shortcut
+        move_shortcut = QShortcut(QKeySequence("Ctrl+M"), self)
+        move_shortcut.activated.connect(self.move_entry)
+        
     def authenticate_user(self):
         """Authenticate user with password. Delete everything after 3 failed attempts."""
         # Check if password file exists
@@ -351,6 +357,9 @@ class EncryptedJournal(QMainWindow):
         self.entry_manager.delete_entry()
         self.update_storage_display()
     
+    def move_entry(self):
+        self.entry_manager.move_current_entry()
+    
     def show_calendar(self):
         dialog = CalendarDialog(self)
         if dialog.exec_() == QDialog.Accepted:
@@ -375,9 +384,7 @@ class EncryptedJournal(QMainWindow):
             
             # Get all notebooks
             try:
-                virtual_folders = self.entry_manager.secure_storage.list_virtual_folders()
-                notebook_folders = [folder.replace("notebooks/", "") for folder in virtual_folders if folder.startswith("notebooks/")]
-                notebooks.extend(sorted(notebook_folders))
+                notebooks.extend(name for name in self.entry_manager.secure_storage.list_notebooks() if name != "Default")
             except Exception:
                 pass
             
@@ -385,18 +392,32 @@ class EncryptedJournal(QMainWindow):
                 nb_stats = self.notebook_manager.get_notebook_stats(notebook)
                 notebook_stats.append(f"{notebook}: {nb_stats['total_entries']} entries ({nb_stats['total_size_mb']} MB)")
             
+            text_mb = round(stats['text_bytes'] / (1024 * 1024), 2)
+            image_mb = round(stats['image_bytes'] / (1024 * 1024), 2)
+            reconciled = stats['reconciled_time']
+            recount_note = f"Last recount from disk: {reconciled[:16].replace('T', ' ')}" if reconciled else "Physical totals have not been recounted from disk yet."
+            
             message = f"""Storage Statistics:
                         
             Total Files: {stats['virtual_files']}
             Physical Files: {stats['physical_files']}
             Total Size: {stats['total_size_mb']} MB
+            Text Entries: {text_mb} MB
+            Entries With Images: {image_mb} MB
+            Cache: {stats['cache_hits']} hits, {stats['cache_misses']} misses, {stats['cache_evictions']} evictions
 
             Notebook Breakdown:
             {chr(10).join(notebook_stats)}
 
+            {recount_note}
+
             Note: All files and folder names are encrypted and secure."""
             
-            QMessageBox.information(self, "Storage Statistics", message)
+            box = QMessageBox(QMessageBox.Information, "Storage Statistics", message, QMessageBox.Ok, self)
+            recount_button = box.addButton("Recount from Disk", QMessageBox.ActionRole)
+            box.exec_()
+            if box.clickedButton() == recount_button:
+                self.entry_manager.reconcile_storage_stats(on_done=lambda _stats: self.show_storage_stats())
             
         except Exception as e:
             QMessageBox.critical(self, "Error", f"Failed to get storage statistics: {str(e)}")
@@ -405,7 +426,6 @@ class EncryptedJournal(QMainWindow):
         """Clean up orphaned files"""
         try:
             self.entry_manager.cleanup_storage()
-            self.update_storage_display()
         except Exception as e:
             QMessageBox.critical(self, "Error", f"Failed to cleanup storage: {str(e)}")
     
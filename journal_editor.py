@@ -0,0 +1,311 @@
+import bisect
+from collections import OrderedDict
+from PyQt5.QtWidgets import QTextEdit
+from PyQt5.QtGui import QImage, QTextDocument, QTextCursor, QTextFormat, QTextImageFormat, QColor
+from PyQt5.QtCore import QObject, QRunnable, QThreadPool, QTimer, QPoint, QUrl, QVariant, pyqtSignal
+from image_store import IMAGE_URL_SCHEME, image_url
+
+
+# Decoded images kept in memory; images further away show their placeholder again
+DECODED_IMAGE_CACHE_SIZE = 24
+# Pool threads decrypting and decoding images
+IMAGE_DECODE_THREADS = 2
+# Placeholder size for images stored without their size (before downscaling on insert)
+DEFAULT_PLACEHOLDER_SIZE = (320, 240)
+# Pause after scrolling or layout changes before visible images are looked up, in ms
+VIEWPORT_SCAN_DELAY_MS = 30
+
+_PLACEHOLDER_COLOR = QColor("#3a3a3a")
+
+
+class _ImageDecodeSignals(QObject):
+    # image id, decoded QImage (null if the image could not be loaded), (bytes, mime type) or None
+    decoded = pyqtSignal(str, object, object)
+
+
+class _ImageDecodeTask(QRunnable):
+    """Decrypts and decodes one stored image on a pool thread (QImage, unlike QPixmap, is safe there).
+
+    Reads go through ImageStore.fetch_image, which never changes the index, so no storage
+    listener runs off the GUI thread and no open transaction is joined.
+    """
+
+    def __init__(self, image_store, image_id, signals):
+        super().__init__()
+        self.image_store = image_store
+        self.image_id = image_id
+        self.signals = signals
+
+    def run(self):
+        stored = None
+        image = QImage()
+        try:
+            data = self.image_store.fetch_image(self.image_id)
+            if data is not None:
+                stored = (data, self.image_store.mime_type(self.image_id))
+                image = QImage.fromData(data)
+        except Exception as e:
+            print(f"Error loading image {self.image_id}: {str(e)}")
+        self.signals.decoded.emit(self.image_id, image, stored)
+
+
+class JournalEditor(QTextEdit):
+    """Entry editor that resolves sjimg: image references from the encrypted image store.
+
+    Images are loaded lazily: while the document is laid out every stored image gets a
+    placeholder of its size, and only the images in or near the viewport are decrypted
+    and decoded, on a thread pool. A small LRU of decoded images backs the document's
+    resources; evicted images fall back to their placeholder until they scroll back in.
+    """
+
+    def __init__(self, image_store=None, parent=None):
+        super().__init__(parent)
+        self.image_store = image_store
+        # Bytes of the stored images this document has shown: id -> (bytes, mime type)
+        self._loaded_images = {}
+        # id -> (QImage, bytes, mime type), least recently shown first
+        self._decoded_images = OrderedDict()
+        # Images of this document whose decoded version is in its resources, being
+        # decoded, or not loadable
+        self._shown_images = set()
+        self._decoding = set()
+        self._unavailable = set()
+        # Placeholders by size; equal sizes share one image
+        self._placeholders = {}
+        # (positions, QTextImageFormats) of the document's images; None when out of date
+        self._image_index = None
+        # Set while the document changes in ways that leave the image index valid
+        self._keep_image_index = False
+        # Counts the times the content was replaced (another entry loaded, a new one started)
+        self.document_generation = 0
+
+        self._decode_pool = QThreadPool(self)
+        self._decode_pool.setMaxThreadCount(IMAGE_DECODE_THREADS)
+        self._decode_signals = _ImageDecodeSignals(self)
+        self._decode_signals.decoded.connect(self._on_image_decoded)
+
+        self._viewport_timer = QTimer(self)
+        self._viewport_timer.setSingleShot(True)
+        self._viewport_timer.setInterval(VIEWPORT_SCAN_DELAY_MS)
+        self._viewport_timer.timeout.connect(self._load_visible_images)
+        self.verticalScrollBar().valueChanged.connect(self._schedule_viewport_scan)
+        self.document().contentsChange.connect(self._on_contents_change)
+        self.document().documentLayout().documentSizeChanged.connect(self._schedule_viewport_scan)
+
+    def loadResource(self, resource_type, url):
+        if resource_type == QTextDocument.ImageResource and url.scheme() == IMAGE_URL_SCHEME:
+            # The document caches this for good, so hand it the placeholder and add the
+            # decoded image as a (removable) resource once it is in view
+            self._schedule_viewport_scan()
+            return self._placeholder(url.path())
+        return super().loadResource(resource_type, url)
+
+    def loaded_images(self):
+        """Stored images shown in this document, so a save can restore any that were deleted meanwhile"""
+        return dict(self._loaded_images)
+
+    def setHtml(self, html):
+        self._reset_images()
+        super().setHtml(html)
+        self._load_visible_images()
+
+    def setPlainText(self, text):
+        self._reset_images()
+        super().setPlainText(text)
+
+    def clear(self):
+        self._reset_images()
+        super().clear()
+
+    def resizeEvent(self, event):
+        super().resizeEvent(event)
+        self._schedule_viewport_scan()
+
+    def stop_image_loading(self):
+        """Drop queued image decodes and wait for the running ones"""
+        self._decode_pool.clear()
+        self._decode_pool.waitForDone()
+
+    def image_positions(self):
+        """(positions, QTextImageFormats) of the images in the document, in document order"""
+        if self._image_index is None:
+            positions, formats = [], []
+            block = self.document().begin()
+            while block.isValid():
+                iterator = block.begin()
+                while not iterator.atEnd():
+                    fragment = iterator.fragment()
+                    char_format = fragment.charFormat()
+                    if char_format.isImageFormat():
+                        image_format = char_format.toImageFormat()
+                        # Adjacent images with the same format share one fragment
+                        for offset in range(fragment.length()):
+                            positions.append(fragment.position() + offset)
+                            formats.append(image_format)
+                    iterator += 1
+                block = block.next()
+            self._image_index = (positions, formats)
+        return self._image_index
+
+    def image_at(self, cursor):
+        """(position, QTextImageFormat) of the image a cursor selects or sits next to, or None.
+
+        Falls back to the first image in the cursor's paragraph.
+        """
+        positions, formats = self.image_positions()
+        if cursor.hasSelection():
+            start, end = cursor.selectionStart(), cursor.selectionEnd()
+        else:
+            # The image character just after or just before the cursor
+            start, end = cursor.position() - 1, cursor.position() + 1
+        index = bisect.bisect_left(positions, start)
+        if index == len(positions) or positions[index] >= end:
+            block = cursor.block()
+            index = bisect.bisect_left(positions, block.position())
+            if index == len(positions) or positions[index] >= block.position() + block.length():
+                return None
+        return positions[index], formats[index]
+
+    def image_display_size(self, image_format):
+        """(width, height) an image is shown at: its format's size, completed from the image's own"""
+        image = self.document().resource(QTextDocument.ImageResource, QUrl(image_format.name()))
+        if isinstance(image, QImage) and not image.isNull():
+            natural_width, natural_height = image.width(), image.height()
+        else:
+            natural_width, natural_height = DEFAULT_PLACEHOLDER_SIZE
+        has_width = image_format.hasProperty(QTextFormat.ImageWidth)
+        has_height = image_format.hasProperty(QTextFormat.ImageHeight)
+        if has_width and has_height:
+            return int(image_format.width()), int(image_format.height())
+        if has_width:
+            return int(image_format.width()), int(image_format.width() * natural_height / natural_width)
+        if has_height:
+            return int(image_format.height() * natural_width / natural_height), int(image_format.height())
+        return natural_width, natural_height
+
+    def set_image_size(self, position, width, height):
+        """Resize the image at a document position by changing its format in place.
+
+        The image keeps its resource, so nothing is serialized or decoded again. Returns
+        False if there is no image at position.
+        """
+        positions, formats = self.image_positions()
+        index = bisect.bisect_left(positions, position)
+        if index == len(positions) or positions[index] != position:
+            return False
+        image_format = QTextImageFormat(formats[index])
+        image_format.setWidth(width)
+        image_format.setHeight(height)
+        cursor = QTextCursor(self.document())
+        cursor.setPosition(position)
+        cursor.setPosition(position + 1, QTextCursor.KeepAnchor)
+        # A format change moves no characters, so the index only needs the new format
+        self._keep_image_index = True
+        try:
+            cursor.setCharFormat(image_format)
+        finally:
+            self._keep_image_index = False
+        formats[index] = image_format
+        return True
+
+    def _on_contents_change(self, position, chars_removed, chars_added):
+        if not self._keep_image_index:
+            self._image_index = None
+
+    def _reset_images(self):
+        """Forget the images of the current document before it is replaced"""
+        self.document_generation += 1
+        self._decode_pool.clear()
+        for image_id in self._shown_images:
+            self.document().addResource(QTextDocument.ImageResource, QUrl(image_url(image_id)), QVariant())
+        self._shown_images = set()
+        self._decoding = set()
+        self._unavailable = set()
+        self._placeholders = {}
+        self._loaded_images = {}
+
+    def _placeholder(self, image_id):
+        size = self.image_store.image_size(image_id) if self.image_store else None
+        width, height = size if size and size[0] > 0 and size[1] > 0 else DEFAULT_PLACEHOLDER_SIZE
+        placeholder = self._placeholders.get((width, height))
+        if placeholder is None:
+            # One bit per pixel keeps a full-size box cheap
+            placeholder = QImage(width, height, QImage.Format_Mono)
+            placeholder.setColorTable([_PLACEHOLDER_COLOR.rgb(), _PLACEHOLDER_COLOR.rgb()])
+            placeholder.fill(0)
+            self._placeholders[(width, height)] = placeholder
+        return placeholder
+
+    def _schedule_viewport_scan(self, *args):
+        if not self._viewport_timer.isActive():
+            self._viewport_timer.start()
+
+    def _load_visible_images(self):
+        """Show or start decoding the stored images within a screen of the viewport"""
+        if self.image_store is None:
+            return
+        positions, formats = self.image_positions()
+        if not positions:
+            return
+        height = self.viewport().height()
+        first = self.cursorForPosition(QPoint(0, -height)).position()
+        last = self.cursorForPosition(QPoint(self.viewport().width(), 2 * height)).position()
+        # An image taller than the margin can start just before the first position hit
+        start = bisect.bisect_left(positions, first - 1)
+        end = bisect.bisect_right(positions, last)
+        for image_format in formats[start:end]:
+            url = QUrl(image_format.name())
+            if url.scheme() != IMAGE_URL_SCHEME:
+                continue
+            image_id = url.path()
+            if image_id in self._decoded_images:
+                if image_id in self._shown_images:
+                    self._decoded_images.move_to_end(image_id)
+                else:
+                    self._show_image(image_id)
+            elif image_id not in self._decoding and image_id not in self._unavailable:
+                self._decoding.add(image_id)
+                self._decode_pool.start(_ImageDecodeTask(self.image_store, image_id, self._decode_signals))
+        self._trim_decoded_images()
+
+    def _on_image_decoded(self, image_id, image, stored):
+        if image.isNull():
+            if image_id in self._decoding:
+                self._unavailable.add(image_id)
+            self._decoding.discard(image_id)
+            return
+        self._decoded_images[image_id] = (image, *stored)
+        # Results for a document that has been replaced since are only cached
+        if image_id in self._decoding:
+            self._decoding.discard(image_id)
+            self._show_image(image_id)
+        self._trim_decoded_images()
+
+    def _show_image(self, image_id):
+        image, data, mime_type = self._decoded_images[image_id]
+        self._decoded_images.move_to_end(image_id)
+        self.document().addResource(QTextDocument.ImageResource, QUrl(image_url(image_id)), image)
+        self._shown_images.add(image_id)
+        self._loaded_images[image_id] = (data, mime_type)
+        self._relayout_image(image_id)
+
+    def _trim_decoded_images(self):
+        while len(self._decoded_images) > DECODED_IMAGE_CACHE_SIZE:
+            image_id, _ = self._decoded_images.popitem(last=False)
+            if image_id in self._shown_images:
+                # Back to the placeholder the document cached when it was laid out
+                self._shown_images.discard(image_id)
+                self.document().addResource(QTextDocument.ImageResource, QUrl(image_url(image_id)), QVariant())
+                self._relayout_image(image_id)
+
+    def _relayout_image(self, image_id):
+        """Redraw every occurrence of an image after its resource changed"""
+        positions, formats = self.image_positions()
+        name = image_url(image_id)
+        self._keep_image_index = True
+        try:
+            for position, image_format in zip(positions, formats):
+                if image_format.name() == name:
+                    self.document().markContentsDirty(position, 1)
+        finally:
+            self._keep_image_index = False
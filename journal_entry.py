@@ -2,10 +2,36 @@ from datetime import datetime
 
 
 class JournalEntry:
-    def __init__(self, title, content, date, file_path=None):
+    """Compact entry record: only the summary shown in the entry list plus the virtual path.
+    
+    The entry body stays encrypted on disk and is decrypted on demand when the entry is opened.
+    """
+    __slots__ = ("title", "date", "file_path", "word_count", "created_time",
+                 "modified_time", "has_images", "notebook", "preview")
+    
+    def __init__(self, title, date, file_path=None, word_count=0, created_time=None,
+                 modified_time=None, has_images=False, notebook=None, preview=""):
         self.title = title
-        self.content = content
         self.date = date
         self.file_path = file_path
-        self.word_count = len(content.split()) if content else 0
-        self.created_time = datetime.now().strftime("%H:%M")
\ No newline at end of file
+        self.word_count = word_count
+        self.created_time = created_time or datetime.now().isoformat()
+        self.modified_time = modified_time or self.created_time
+        self.has_images = has_images
+        self.notebook = notebook
+        self.preview = preview
+    
+    @classmethod
+    def from_metadata(cls, virtual_path, metadata, notebook=None):
+        """Build an entry from the summary stored in the encrypted index"""
+        return cls(
+            metadata.get("title", "Untitled"),
+            metadata.get("date", ""),
+            virtual_path,
+            word_count=metadata.get("word_count", 0),
+            created_time=metadata.get("created_time", ""),
+            modified_time=metadata.get("modified_time"),
+            has_images=metadata.get("has_images", False),
+            notebook=notebook,
+            preview=metadata.get("preview", "")
+        )
@@ -0,0 +1,139 @@
+"""Copy a journal's secure storage between the blob-file and SQLite backends.
+
+Run with:  python migrate_storage.py --to sqlite|files [--journal DIR] [--switch]
+
+Every file is decrypted from the current backend and stored again in the other one
+(with the configured cipher and compression), together with its index metadata and
+the trained compression dictionaries. The source is left untouched; --switch makes the
+app use the new backend by updating config.json. Close the app before migrating.
+Migrating back to a backend whose old storage is still in the journal directory is
+refused, with the list of files to move aside first.
+"""
+import os
+import sys
+import json
+import argparse
+
+from cryptography.fernet import Fernet
+
+from secure_storage_manager import SecureStorageManager
+from sqlite_storage_manager import SQLiteStorageManager
+
+
+STORAGE_BACKENDS = {"files": SecureStorageManager, "sqlite": SQLiteStorageManager}
+
+# Files copied per destination transaction
+MIGRATION_BATCH_SIZE = 200
+
+
+def open_storage(journal_dir, backend, config=None):
+    """Open the storage of a journal directory with the given backend and its config.json settings"""
+    with open(os.path.join(journal_dir, "master.key"), "rb") as f:
+        master_key = f.read()
+    options = {}
+    for key in ("compression", "compression_level", "cipher", "durability"):
+        if config and key in config:
+            options[key] = config[key]
+    return STORAGE_BACKENDS[backend](journal_dir, Fernet(master_key), master_key=master_key, **options)
+
+
+def leftover_storage_files(journal_dir, backend):
+    """Files that hold a backend's storage in a journal directory, e.g. left behind by an
+    earlier migration away from it: the index and dictionary files of the blob-file backend
+    (blob files are only orphans once these are gone), or the SQLite database"""
+    secure_path = os.path.join(journal_dir, "secure_storage")
+    if not os.path.isdir(secure_path):
+        return []
+    if backend == "sqlite":
+        prefixes = ("storage.db",)
+    else:
+        prefixes = ("index.enc", "index.log", "index.dictionaries.enc")
+    return sorted(os.path.join(secure_path, name) for name in os.listdir(secure_path)
+                  if name.startswith(prefixes) and not name.endswith(".tmp"))
+
+
+def migrate_storage(source, destination, progress_callback=None):
+    """Copy every file (contents and index metadata) from source to destination.
+
+    The destination must be empty. progress_callback(copied, total) is called after
+    every batch. Returns the number of files copied.
+    """
+    if len(destination.file_index):
+        raise Exception("Failed to migrate storage: the destination already holds files")
+    if source.index_load_error is not None:
+        raise Exception(f"Failed to migrate storage: the source index could not be loaded ({source.index_load_error})")
+    if source.dictionary_load_error is not None:
+        raise Exception(f"Failed to migrate storage: the source compression dictionaries could not be loaded "
+                        f"({source.dictionary_load_error})")
+
+    # Keep compressing with the dictionaries the journal was trained on
+    destination.compression_dictionaries.update(source.compression_dictionaries)
+    destination.active_dictionary_id = source.active_dictionary_id
+    destination._save_dictionaries()
+
+    files = source.list_files()
+    buffer = bytearray()
+    copied = 0
+    for start in range(0, len(files), MIGRATION_BATCH_SIZE):
+        with destination.transaction():
+            for file_info in files[start:start + MIGRATION_BATCH_SIZE]:
+                if source.load_file_into(file_info["virtual_path"], buffer) is None:
+                    continue
+                destination.store_file(file_info["virtual_path"], bytes(buffer), file_info["metadata"])
+                copied += 1
+        if progress_callback:
+            progress_callback(min(start + MIGRATION_BATCH_SIZE, len(files)), len(files))
+    destination.flush()
+    return copied
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Move SecureJournal storage to another backend")
+    parser.add_argument("--to", choices=sorted(STORAGE_BACKENDS), required=True, help="backend to copy into")
+    parser.add_argument("--journal", default=os.path.expanduser("~/.encrypted_journal_pro"), help="journal directory")
+    parser.add_argument("--switch", action="store_true", help="use the new backend from now on (updates config.json)")
+    args = parser.parse_args(argv)
+
+    config_path = os.path.join(args.journal, "config.json")
+    config = {}
+    if os.path.exists(config_path):
+        with open(config_path) as f:
+            config = json.load(f)
+    current_backend = config.get("storage_backend", "files")
+    if current_backend == args.to:
+        print(f"The journal already uses the {args.to} backend")
+        return 1
+
+    source = open_storage(args.journal, current_backend, config)
+    destination = open_storage(args.journal, args.to, config)
+    if len(destination.file_index):
+        # Storage of the target backend is still there from before an earlier migration
+        print(f"The journal still holds {len(destination.file_index)} files in old {args.to} storage. "
+              f"Move these files out of the journal directory (keep them until the journal checks out) "
+              f"and run the migration again:")
+        for path in leftover_storage_files(args.journal, args.to):
+            print(f"  {path}")
+        if args.to == "files":
+            print("Blob files of the old storage are removed by Cleanup Storage afterwards.")
+        return 1
+
+    def report(copied, total):
+        print(f"\rCopied {copied}/{total} files", end="", flush=True)
+
+    try:
+        copied = migrate_storage(source, destination, report)
+    except Exception as e:
+        print(f"\n{e}")
+        return 1
+    print(f"\nMigrated {copied} files from {current_backend} to {args.to} storage")
+
+    if args.switch:
+        config["storage_backend"] = args.to
+        with open(config_path, "w") as f:
+            json.dump(config, f)
+        print("config.json updated; the old storage was kept and can be removed once the journal checks out")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -184,12 +184,7 @@ class NotebookContextDialog(QDialog):
 
         # Check if name already exists
         try:
-            virtual_folders = self.parent.entry_manager.secure_storage.list_virtual_folders()
-            existing_notebooks = [
-                folder.replace("notebooks/", "")
-                for folder in virtual_folders
-                if folder.startswith("notebooks/")
-            ]
+            existing_notebooks = self.parent.entry_manager.secure_storage.list_notebooks()
             if new_name in existing_notebooks:
                 QMessageBox.warning(self, "Duplicate Name", f"A notebook named '{new_name}' already exists!")
                 return
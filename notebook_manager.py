@@ -1,14 +1,17 @@
 import os
-import json
 from datetime import datetime
 from PyQt5.QtWidgets import QInputDialog, QMessageBox, QListWidgetItem, QDialog
 from PyQt5.QtCore import Qt
 from notebook_context_dialog import NotebookContextDialog
+from secure_storage_manager import notebook_for_path
 
 
 class NotebookManager:
     def __init__(self, parent):
         self.parent = parent
+        
+        # Keep the sidebar counts in step with entry changes instead of reloading them
+        self.parent.entry_manager.secure_storage.add_listener(self.on_storage_events)
 
     def create_notebook(self):
         name, ok = QInputDialog.getText(self.parent, "New Notebook", "Enter notebook name:")
@@ -17,9 +20,7 @@ class NotebookManager:
             
             # Check if notebook already exists
             try:
-                existing_notebooks = []
-                virtual_folders = self.parent.entry_manager.secure_storage.list_virtual_folders()
-                existing_notebooks = [folder.replace("notebooks/", "") for folder in virtual_folders if folder.startswith("notebooks/")]
+                existing_notebooks = self.parent.entry_manager.secure_storage.list_notebooks()
                 
                 if notebook_name in existing_notebooks:
                     QMessageBox.warning(self.parent, "Duplicate Notebook", 
@@ -119,53 +120,35 @@ class NotebookManager:
             QMessageBox.critical(self.parent, "Error", f"Failed to show notebook options: {str(e)}")
     
     def rename_notebook(self, old_name, new_name):
-        """Rename a notebook by moving all its entries to a new folder"""
+        """Rename a notebook by remapping its entries to a new folder in the index"""
         if old_name == "Default":
             QMessageBox.warning(self.parent, "Cannot Rename", "The Default notebook cannot be renamed.")
             return
             
         try:
-            # Get all files in the old notebook
+            secure_storage = self.parent.entry_manager.secure_storage
             old_path_prefix = f"notebooks/{old_name}/"
-            files_to_move = self.parent.entry_manager.secure_storage.list_files(old_path_prefix)
+            new_path_prefix = f"notebooks/{new_name}/"
             
-            # Create new notebook folder
-            new_virtual_folder_path = f"notebooks/{new_name}"
-            self.parent.entry_manager.secure_storage.create_virtual_folder(new_virtual_folder_path)
+            # Refuse to merge into an existing notebook
+            if new_name in secure_storage.list_notebooks():
+                QMessageBox.warning(self.parent, "Duplicate Notebook", 
+                                  f"A notebook named '{new_name}' already exists!")
+                return
             
-            # Move all files to new location
-            moved_count = 0
-            for file_info in files_to_move:
-                old_virtual_path = file_info["virtual_path"]
-                if not old_virtual_path.endswith('.enc'):
-                    continue
-                    
-                # Create new path by replacing the notebook name
-                new_virtual_path = old_virtual_path.replace(f"notebooks/{old_name}/", f"notebooks/{new_name}/")
-                
-                # Load data from old location
-                encrypted_data = self.parent.entry_manager.secure_storage.load_file(old_virtual_path)
-                if encrypted_data is None:
-                    continue
-                
-                # Update the notebook field in the entry data
-                try:
-                    entry_data = json.loads(encrypted_data.decode())
-                    entry_data["notebook"] = new_name
-                    updated_encrypted_data = json.dumps(entry_data).encode()
-                except Exception:
-                    # If we can't parse/update the data, just move it as-is
-                    updated_encrypted_data = encrypted_data
+            # Notebook membership lives in the index, so renaming is an index-only remap:
+            # no entry is decrypted, rewritten or physically moved
+            with secure_storage.transaction():
+                moved_count = secure_storage.get_notebook_stats(old_name)["total_entries"]
+                secure_storage.move_prefix(old_path_prefix, new_path_prefix)
                 
-                # Store in new location
-                if self.parent.entry_manager.secure_storage.store_file(new_virtual_path, updated_encrypted_data):
-                    # Delete from old location
-                    if self.parent.entry_manager.secure_storage.delete_file(old_virtual_path):
-                        moved_count += 1
+                # Make sure the renamed notebook keeps its folder marker
+                if secure_storage.get_file_info(f"{new_path_prefix}.folder_marker") is None:
+                    secure_storage.create_virtual_folder(f"notebooks/{new_name}")
             
-            # Delete old folder marker
-            old_folder_marker = f"notebooks/{old_name}/.folder_marker"
-            self.parent.entry_manager.secure_storage.delete_file(old_folder_marker)
+            # Keep the open entry pointing at its new location
+            if self.parent.current_entry_path and self.parent.current_entry_path.startswith(old_path_prefix):
+                self.parent.current_entry_path = new_path_prefix + self.parent.current_entry_path[len(old_path_prefix):]
             
             # Update current notebook if it was the renamed one
             if self.parent.current_notebook == old_name:
@@ -196,24 +179,10 @@ class NotebookManager:
         })
         
         try:
-            # Get all virtual folders that start with "notebooks/"
-            virtual_folders = self.parent.entry_manager.secure_storage.list_virtual_folders()
-            notebook_folders = []
-            
-            for folder in virtual_folders:
-                if folder.startswith("notebooks/"):
-                    # Extract just the notebook name, not the full path with dates
-                    notebook_name = folder.replace("notebooks/", "")
-                    # Only take the first part before any slash (to avoid date subfolders)
-                    if "/" in notebook_name:
-                        notebook_name = notebook_name.split("/")[0]
-                    
-                    # Avoid duplicates
-                    if notebook_name and notebook_name not in notebook_folders:
-                        notebook_folders.append(notebook_name)
-            
-            # Add other notebooks with their counts
-            for notebook_name in sorted(notebook_folders):
+            # Notebook names and counts are maintained by the storage layer
+            for notebook_name in self.parent.entry_manager.secure_storage.list_notebooks():
+                if notebook_name == "Default":
+                    continue
                 entry_count = self.parent.entry_manager.get_notebook_entry_count(notebook_name)
                 notebooks_data.append({
                     'name': notebook_name,
@@ -226,6 +195,23 @@ class NotebookManager:
         # Update the UI with notebook data including counts
         self.parent.ui_components.update_notebooks_with_counts(notebooks_data)
     
+    def on_storage_events(self, events):
+        """Refresh the entry count of each notebook row affected by entry changes"""
+        changed_notebooks = set()
+        for event in events:
+            if event["type"] == "updated" or not event["path"].endswith('.enc'):
+                continue
+            changed_notebooks.add(notebook_for_path(event["path"]))
+            if event.get("old_path"):
+                changed_notebooks.add(notebook_for_path(event["old_path"]))
+        
+        # Rows for notebooks not listed yet are added by the next load_notebooks()
+        for notebook_name in changed_notebooks:
+            if notebook_name is not None:
+                self.parent.ui_components.update_notebook_count(
+                    notebook_name, self.parent.entry_manager.get_notebook_entry_count(notebook_name)
+                )
+    
     def select_notebook(self, item):
         old_notebook = self.parent.current_notebook
         # Get the actual notebook name from UserRole data
@@ -275,16 +261,18 @@ class NotebookManager:
             virtual_path_prefix = f"notebooks/{notebook_name}/"
             files_to_delete = self.parent.entry_manager.secure_storage.list_files(virtual_path_prefix)
             
-            # Delete all files
-            deleted_count = 0
-            for file_info in files_to_delete:
-                virtual_path = file_info["virtual_path"]
-                if self.parent.entry_manager.secure_storage.delete_file(virtual_path):
-                    deleted_count += 1
-            
-            # Delete the folder marker
-            folder_marker_path = f"notebooks/{notebook_name}/.folder_marker"
-            self.parent.entry_manager.secure_storage.delete_file(folder_marker_path)
+            # Delete everything in a single storage transaction (one index write)
+            with self.parent.entry_manager.secure_storage.transaction():
+                # Delete all files
+                deleted_count = 0
+                for file_info in files_to_delete:
+                    virtual_path = file_info["virtual_path"]
+                    if self.parent.entry_manager.secure_storage.delete_file(virtual_path):
+                        deleted_count += 1
+                
+                # Delete the folder marker
+                folder_marker_path = f"notebooks/{notebook_name}/.folder_marker"
+                self.parent.entry_manager.secure_storage.delete_file(folder_marker_path)
             
             # Switch to Default notebook if we deleted the current one
             if self.parent.current_notebook == notebook_name:
@@ -324,6 +312,7 @@ class NotebookManager:
                 
                 files = self.parent.entry_manager.secure_storage.list_files(path_prefix)
                 entries = []
+                load_buffer = bytearray()
                 
                 for file_info in files:
                     try:
@@ -331,11 +320,10 @@ class NotebookManager:
                         if not virtual_path.endswith('.enc'):
                             continue
                         
-                        encrypted_data = self.parent.entry_manager.secure_storage.load_file(virtual_path)
-                        if encrypted_data is None:
+                        entry_data = self.parent.entry_manager.load_entry_data(virtual_path, load_buffer)
+                        if entry_data is None:
                             continue
                         
-                        entry_data = json.loads(encrypted_data.decode())
                         entries.append(entry_data)
                         
                     except Exception as e:
@@ -377,7 +365,7 @@ class NotebookManager:
                                     <div class="entry-meta">{entry.get("date", "")} • {entry.get("word_count", 0)} words</div>
                                 </div>
                                 <div class="entry-content">
-                                    {entry.get("content", "")}
+                                    {self.parent.entry_manager.image_store.inline_images(entry.get("content", ""))}
                                 </div>
                             </div>
                             """)
@@ -409,21 +397,14 @@ class NotebookManager:
     def get_notebook_stats(self, notebook_name):
         """Get statistics for a specific notebook"""
         try:
-            if notebook_name == "Default":
-                path_prefix = "default/"
-            else:
-                path_prefix = f"notebooks/{notebook_name}/"
-            
-            files = self.parent.entry_manager.secure_storage.list_files(path_prefix)
-            entry_files = [f for f in files if f["virtual_path"].endswith('.enc')]
-            
-            total_entries = len(entry_files)
-            total_size = sum(f["size"] for f in entry_files)
+            stats = self.parent.entry_manager.secure_storage.get_notebook_stats(notebook_name)
+            total_size = stats["total_size_bytes"]
             
             return {
-                "total_entries": total_entries,
+                "total_entries": stats["total_entries"],
                 "total_size_bytes": total_size,
-                "total_size_mb": round(total_size / (1024 * 1024), 2) if total_size > 0 else 0.0
+                "total_size_mb": round(total_size / (1024 * 1024), 2) if total_size > 0 else 0.0,
+                "last_modified": stats["last_modified"]
             }
             
         except Exception as e:
@@ -431,5 +412,6 @@ class NotebookManager:
             return {
                 "total_entries": 0,
                 "total_size_bytes": 0,
-                "total_size_mb": 0.0
-            }
\ No newline at end of file
+                "total_size_mb": 0.0,
+                "last_modified": ""
+            }
@@ -0,0 +1,98 @@
+from bisect import bisect_left, insort
+from collections.abc import MutableMapping
+
+
+def _prefix_upper_bound(prefix):
+    """Smallest string greater than every string that starts with prefix"""
+    return prefix[:-1] + chr(ord(prefix[-1]) + 1)
+
+
+class PathIndex(MutableMapping):
+    """Mapping of virtual path -> index entry that supports fast prefix queries.
+
+    Next to the plain dict it keeps every path in a sorted list, so all paths under a
+    prefix are found with two bisections (O(log N + k)), and a reference count per
+    folder (the parent directory of each path), so folders never have to be re-derived
+    from every key.
+    """
+
+    def __init__(self, entries=None):
+        self._entries = dict(entries or {})
+        self._sorted_paths = sorted(self._entries)
+        self._folder_refs = {}
+        for virtual_path in self._entries:
+            self._add_folder_ref(virtual_path)
+
+    @staticmethod
+    def _folder_of(virtual_path):
+        """Folder that holds a path ("a/b/.folder_marker" and "a/b/c.enc" both live in "a/b")"""
+        separator = virtual_path.rfind("/")
+        if separator <= 0:
+            return None
+        return virtual_path[:separator]
+
+    def _add_folder_ref(self, virtual_path):
+        folder = self._folder_of(virtual_path)
+        if folder is not None:
+            self._folder_refs[folder] = self._folder_refs.get(folder, 0) + 1
+
+    def _remove_folder_ref(self, virtual_path):
+        folder = self._folder_of(virtual_path)
+        if folder is not None:
+            remaining = self._folder_refs.get(folder, 0) - 1
+            if remaining > 0:
+                self._folder_refs[folder] = remaining
+            else:
+                self._folder_refs.pop(folder, None)
+
+    def __getitem__(self, virtual_path):
+        return self._entries[virtual_path]
+
+    def __setitem__(self, virtual_path, info):
+        if virtual_path not in self._entries:
+            insort(self._sorted_paths, virtual_path)
+            self._add_folder_ref(virtual_path)
+        self._entries[virtual_path] = info
+
+    def __delitem__(self, virtual_path):
+        del self._entries[virtual_path]
+        position = bisect_left(self._sorted_paths, virtual_path)
+        del self._sorted_paths[position]
+        self._remove_folder_ref(virtual_path)
+
+    def __contains__(self, virtual_path):
+        return virtual_path in self._entries
+
+    def __iter__(self):
+        return iter(self._entries)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def keys(self):
+        return self._entries.keys()
+
+    def values(self):
+        return self._entries.values()
+
+    def items(self):
+        return self._entries.items()
+
+    def get(self, virtual_path, default=None):
+        return self._entries.get(virtual_path, default)
+
+    def to_dict(self):
+        """Plain dict view of the index, for serialization"""
+        return self._entries
+
+    def paths_with_prefix(self, path_prefix):
+        """All paths starting with path_prefix, in sorted order"""
+        if not path_prefix:
+            return list(self._sorted_paths)
+        start = bisect_left(self._sorted_paths, path_prefix)
+        end = bisect_left(self._sorted_paths, _prefix_upper_bound(path_prefix), start)
+        return self._sorted_paths[start:end]
+
+    def folders(self):
+        """All folders that currently contain at least one path, sorted"""
+        return sorted(self._folder_refs)
@@ -1,55 +1,900 @@
 import os
+import mmap
 import json
-import hashlib
+import base64
+import random
+import struct
+import secrets
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager, nullcontext
+from functools import partial
 from cryptography.fernet import Fernet
 from datetime import datetime
+from path_index import PathIndex
+from blob_cache import BlobCache, DEFAULT_CACHE_MAX_BYTES, DEFAULT_CACHE_MAX_ENTRIES
+from blob_codec import (encode_blob, encode_blob_stream, decode_blob_stream, iter_decode_blob, get_codec,
+                        peek_codec, BLOB_HEADER_SIZE, DEFAULT_CODEC, DEFAULT_COMPRESSION_LEVEL)
+from crypto_backend import AEAD_MAGIC, BlobCipher, DEFAULT_CIPHER, STREAM_CHUNK_SIZE
+from compression_dictionary import build_default_dictionary, train_dictionary, DEFAULT_DICTIONARY_ID, MAX_DICTIONARY_SIZE
+from durable_io import DurabilityPolicy, DEFAULT_DURABILITY, DEFAULT_GROUP_COMMIT_WINDOW
+from image_store import IMAGE_COMPRESSION, IMAGE_PATH_PREFIX, image_path, image_id_of_path
+
+
+# Number of index log records written before they are folded back into index.enc
+INDEX_CHECKPOINT_INTERVAL = 500
+
+# Every index log record is framed as a 4-byte big-endian length followed by an encrypted token
+_LOG_RECORD_HEADER = struct.Struct(">I")
+
+# Version of the index.enc snapshot layout (version 1 was the bare file index dict)
+INDEX_SNAPSHOT_VERSION = 2
+
+# Associated ids the index files are encrypted under (blobs use their secure filename)
+_INDEX_SNAPSHOT_ID = "index.enc"
+_INDEX_LOG_ID = "index.log"
+_DICTIONARIES_ID = "index.dictionaries.enc"
+
+# Suffix of index files set aside by a checkpoint because they could not be fully read
+_UNREADABLE_SUFFIX = ".unreadable-"
+
+# Contents at least this large (and file objects) are written in the chunked stream format
+STREAM_THRESHOLD = 1024 * 1024
+
+# Blob files at least this large are memory-mapped for reading instead of read()
+MMAP_THRESHOLD = 64 * 1024
+
+# Threads that seal/open stream chunks in parallel; 1 seals them in line. The crypto suite
+# of storage_benchmark measured the thread pool slower than in-line sealing for every
+# stream size, so chunks are processed serially unless this is raised
+STREAM_WORKERS = 1
+
+# Blobs live in nested fan-out directories named after the first hex digits of their
+# (random) name, e.g. secure_storage/3f/a2/3fa2....dat, so no directory grows past a few
+# hundred entries. Journals from before the sharded layout are migrated in the background.
+BLOB_SHARD_LEVELS = 2
+BLOB_SHARD_WIDTH = 2
+_HEX_DIGITS = frozenset("0123456789abcdef")
+
+# Directory entries handled between progress reports / cancellation checks during cleanup
+CLEANUP_SCAN_BATCH_SIZE = 1000
+
+# Files modified this recently before a cleanup starts are never treated as orphans
+# (covers coarse filesystem timestamps)
+CLEANUP_GRACE_SECONDS = 2
+
+
+def notebook_for_path(virtual_path):
+    """Get the notebook a virtual path belongs to, or None for paths outside any notebook"""
+    if virtual_path.startswith("default/"):
+        return "Default"
+    if virtual_path.startswith("notebooks/"):
+        parts = virtual_path.split("/")
+        if len(parts) > 2 and parts[1]:
+            return parts[1]
+    return None
+
+
+def _take_range(pieces, offset, length):
+    """Bytes offset..offset+length of the concatenation of pieces, consuming only what is needed"""
+    collected = bytearray()
+    position = 0
+    for piece in pieces:
+        piece_end = position + len(piece)
+        if piece_end > offset:
+            collected += piece[max(0, offset - position):offset + length - position]
+            if len(collected) >= length:
+                break
+        position = piece_end
+    return bytes(collected)
 
 
 class SecureStorageManager:
     """Handles encrypted file system where even filenames and folder structure are encrypted"""
     
-    def __init__(self, base_path, fernet):
+    def __init__(self, base_path, fernet, checkpoint_interval=INDEX_CHECKPOINT_INTERVAL,
+                 cache_max_bytes=DEFAULT_CACHE_MAX_BYTES, cache_max_entries=DEFAULT_CACHE_MAX_ENTRIES,
+                 compression=DEFAULT_CODEC, compression_level=DEFAULT_COMPRESSION_LEVEL,
+                 cipher=DEFAULT_CIPHER, master_key=None, durability=DEFAULT_DURABILITY,
+                 group_commit_window=DEFAULT_GROUP_COMMIT_WINDOW):
         self.base_path = base_path
         self.fernet = fernet
+        # Every file is replaced through a temp file + rename; the mode decides when it is
+        # fsynced ("strict", "group" or "relaxed", see durable_io)
+        self.durability = DurabilityPolicy(durability, group_commit_window)
+        # Encrypts with the configured cipher, decrypts any format (see crypto_backend);
+        # the AEAD ciphers need the master key and fall back to Fernet without it for new
+        # storage, but storage that already holds AEAD data refuses to open without it
+        self.cipher = BlobCipher(fernet, cipher, master_key)
         self.secure_path = os.path.join(base_path, "secure_storage")
         self.index_file = os.path.join(self.secure_path, "index.enc")
+        self.index_log_file = os.path.join(self.secure_path, "index.log")
+        self.dictionary_file = os.path.join(self.secure_path, "index.dictionaries.enc")
+        self.checkpoint_interval = checkpoint_interval
         os.makedirs(self.secure_path, exist_ok=True)
+        self._check_master_key()
+        # Blobs still in the old flat layout are looked up in both places until migrated
+        self._flat_blobs_remaining = self._has_flat_blobs()
+        
+        # Codec applied to file contents before encryption (see blob_codec);
+        # an unknown codec name from the config falls back to the default
+        try:
+            get_codec(compression)
+        except ValueError:
+            compression = DEFAULT_CODEC
+        self.compression = compression
+        self.compression_level = compression_level
+        self._load_dictionaries()
+        
+        # Worker threads for chunked encryption, created on first use
+        self._stream_executor = None
+        
+        # Decrypted contents of recently loaded files
+        self.blob_cache = BlobCache(cache_max_bytes, cache_max_entries)
+        
+        # Load or create the encrypted index (snapshot plus the log tail)
+        self.file_index = PathIndex()
+        self.notebook_aggregates = {}
+        self._blob_owners = {}  # secure_filename -> virtual path
+        self._image_refs = {}  # image id -> number of files listing it in metadata["images"]
+        self._unreferenced_images = set()
+        self.storage_totals = self._empty_storage_totals()
+        # Files/bytes on disk that the index does not account for (index files excluded),
+        # as measured by the last reconcile_storage_stats()
+        self.disk_adjustment = {"files": 0, "bytes": 0, "reconciled_time": None}
+        # Why the index could not be fully read, if it could not (see _load_index)
+        self.index_load_error = None
+        # Whether the unreadable index files have been set aside by a checkpoint
+        self._unreadable_index_set_aside = False
+        # Index files set aside by this or an earlier session: the entries only they hold
+        # still own their blobs and images, so nothing is garbage collected until the user
+        # confirms they are not needed (see confirm_index_recovery)
+        self.index_recovery_files = self._find_set_aside_index_files()
+        self._log_records = 0
+        self._load_index()
+        # Images nothing refers to any more are deleted once the change that dropped the
+        # last reference is persisted (including ones left behind by an earlier session)
+        self._unreferenced_images = {
+            image_id for image_id in map(image_id_of_path, self.file_index.paths_with_prefix(IMAGE_PATH_PREFIX))
+            if image_id is not None and image_id not in self._image_refs
+        }
+        
+        # Callbacks notified with a list of change events after each committed change
+        self._listeners = []
+        
+        # Transaction state (see begin/commit/rollback)
+        self._in_transaction = False
+        self._reset_transaction_state()
+    
+    def _generate_secure_filename(self):
+        """Generate a random blob filename; it carries no information about the virtual path"""
+        return f"{secrets.token_hex(8)}.dat"
+    
+    @staticmethod
+    def _is_shardable(filename):
+        """Whether a file name is a blob name that has a shard (hex digits + ".dat")"""
+        prefix = filename[:BLOB_SHARD_LEVELS * BLOB_SHARD_WIDTH]
+        return (filename.endswith(".dat") and len(filename) > len(prefix) + len(".dat")
+                and set(prefix) <= _HEX_DIGITS)
+    
+    def _sharded_blob_path(self, secure_filename):
+        """Physical path of a blob in the sharded layout"""
+        if not self._is_shardable(secure_filename):
+            return os.path.join(self.secure_path, secure_filename)
+        shards = [secure_filename[level * BLOB_SHARD_WIDTH:(level + 1) * BLOB_SHARD_WIDTH]
+                  for level in range(BLOB_SHARD_LEVELS)]
+        return os.path.join(self.secure_path, *shards, secure_filename)
+    
+    def _blob_path(self, secure_filename):
+        """Physical path of a blob; during the layout migration it may still be in the flat directory"""
+        sharded_path = self._sharded_blob_path(secure_filename)
+        if self._flat_blobs_remaining and not os.path.exists(sharded_path):
+            flat_path = os.path.join(self.secure_path, secure_filename)
+            if os.path.exists(flat_path):
+                return flat_path
+        return sharded_path
+    
+    def _create_in_shard(self, secure_filepath, create):
+        """Run create(), which puts a file at secure_filepath, making its shard directory first.
         
-        # Load or create the encrypted index
-        self.file_index = self._load_index()
+        Shard directories are removed once empty (see _prune_shard_directories), possibly by
+        another thread between making the directory and creating the file; the directory is
+        then made again. Once the file is in it, the directory is not empty and stays.
+        """
+        directory = os.path.dirname(secure_filepath)
+        while True:
+            self.durability.make_directories(directory)
+            try:
+                return create()
+            except FileNotFoundError:
+                if os.path.isdir(directory):
+                    raise
+    
+    def _prune_shard_directories(self, directory):
+        """Remove a shard directory and its parent shard if they are empty, so the shard tree
+        (and every scan of it) does not keep growing with directories of deleted blobs"""
+        for _ in range(BLOB_SHARD_LEVELS):
+            if os.path.normpath(directory) == os.path.normpath(self.secure_path):
+                return
+            try:
+                os.rmdir(directory)
+            except OSError:
+                # Not empty (or already gone)
+                return
+            directory = os.path.dirname(directory)
+    
+    @staticmethod
+    def _scan_shard(directory):
+        """os.scandir of a blob directory; no entries if it was pruned since it was listed"""
+        try:
+            return os.scandir(directory)
+        except FileNotFoundError:
+            return nullcontext(())
+    
+    def _has_flat_blobs(self):
+        """Whether any blob still sits directly in the storage directory (old flat layout)"""
+        with os.scandir(self.secure_path) as entries:
+            return any(self._is_shardable(entry.name) and entry.is_file() for entry in entries)
+    
+    def needs_layout_migration(self):
+        """Whether blobs remain to be moved into the sharded layout (see migrate_to_sharded_layout)"""
+        return self._flat_blobs_remaining
     
-    def _generate_secure_filename(self, original_path):
-        """Generate a secure hash-based filename for the original path"""
-        path_hash = hashlib.sha256(original_path.encode()).hexdigest()
-        return f"{path_hash[:16]}.dat"
+    def migrate_to_sharded_layout(self, progress_callback=None, cancel_event=None):
+        """Move blobs of the old flat layout into their shard directories.
+        
+        Safe to run on a worker thread while the app is in use: every move is an atomic
+        rename within the storage directory, and lookups check both places until the
+        migration has finished. progress_callback(moved, total) and cancel_event work as in
+        cleanup_orphaned_files. Returns the number of blobs moved.
+        """
+        try:
+            moved_count = 0
+            expected_total = self.storage_totals["files"]
+            with os.scandir(self.secure_path) as entries:
+                for entry in entries:
+                    if cancel_event is not None and cancel_event.is_set():
+                        return moved_count
+                    if not self._is_shardable(entry.name) or not entry.is_file():
+                        continue
+                    sharded_path = self._sharded_blob_path(entry.name)
+                    try:
+                        self._create_in_shard(sharded_path, partial(self.durability.move, entry.path, sharded_path))
+                    except FileNotFoundError:
+                        # Deleted or overwritten by the app in the meantime
+                        continue
+                    moved_count += 1
+                    if progress_callback and moved_count % CLEANUP_SCAN_BATCH_SIZE == 0:
+                        progress_callback(moved_count, max(expected_total, moved_count))
+            self._flat_blobs_remaining = False
+            return moved_count
+        except Exception as e:
+            raise Exception(f"Failed to migrate secure storage layout: {str(e)}")
+    
+    def _check_master_key(self):
+        """Refuse to open AEAD-encrypted storage without the master key.
+        
+        Every AEAD index record would fail to authenticate and look corrupt, and nothing
+        encrypted with the configured cipher could be read back.
+        """
+        if self.cipher.has_aead_key:
+            return
+        stored_tokens = []
+        for path, offset in ((self.index_file, 0), (self.index_log_file, _LOG_RECORD_HEADER.size),
+                             (self.dictionary_file, 0)):
+            if os.path.exists(path):
+                with open(path, "rb") as f:
+                    f.seek(offset)
+                    stored_tokens.append(f.read(len(AEAD_MAGIC)))
+        if any(BlobCipher.is_aead(token) for token in stored_tokens):
+            raise Exception("Failed to open secure storage: it is encrypted with an AEAD cipher and needs the master key")
     
     def _load_index(self):
-        """Load the encrypted file index that maps original paths to secure filenames"""
+        """Load the encrypted index snapshot and replay the index log written since the last checkpoint"""
         if os.path.exists(self.index_file):
             try:
                 with open(self.index_file, "rb") as f:
                     encrypted_data = f.read()
-                decrypted_data = self.fernet.decrypt(encrypted_data)
-                return json.loads(decrypted_data.decode())
-            except Exception:
-                return {}
-        return {}
+                decrypted_data = self.cipher.decrypt(encrypted_data, _INDEX_SNAPSHOT_ID)
+                snapshot = json.loads(decrypted_data.decode())
+                if snapshot.get("version") == INDEX_SNAPSHOT_VERSION and "files" in snapshot:
+                    self.file_index = PathIndex(snapshot["files"])
+                    self.notebook_aggregates = snapshot["notebooks"]
+                else:
+                    # Version 1 snapshot: the bare file index, aggregates are rebuilt once
+                    self.file_index = PathIndex(snapshot)
+                    self._rebuild_notebook_aggregates()
+                self._rebuild_file_state()
+            except Exception as e:
+                # Remember the failure: cleanup must not treat every blob as an orphan, and
+                # the snapshot is set aside rather than overwritten at the next checkpoint
+                self.index_load_error = str(e) or type(e).__name__
+                print(f"Error loading secure index: {self.index_load_error}")
+                self.file_index = PathIndex()
+                self.notebook_aggregates = {}
+                self._blob_owners = {}
+                self.storage_totals = self._empty_storage_totals()
+        
+        self._replay_index_log()
+        
+        # Fold a long log tail back into the snapshot right away (unless part of the index
+        # could not be read: the unreadable files are only set aside when the index changes)
+        if self._log_records >= self.checkpoint_interval and self.index_load_error is None:
+            self._save_index()
+        return self.file_index
+    
+    def _find_set_aside_index_files(self):
+        """Paths of index snapshots and logs that a checkpoint set aside as unreadable"""
+        prefixes = tuple(os.path.basename(path) + _UNREADABLE_SUFFIX for path in (self.index_file, self.index_log_file))
+        with os.scandir(self.secure_path) as entries:
+            return sorted(entry.path for entry in entries if entry.name.startswith(prefixes))
+    
+    def index_recovery_pending(self):
+        """Whether unreadable index files were set aside and not yet dismissed by the user"""
+        return bool(self.index_recovery_files)
+    
+    def confirm_index_recovery(self):
+        """Delete the set-aside index files once the user has confirmed they are not needed.
+        
+        Blobs and images only those files referred to become orphans for the next cleanup.
+        """
+        try:
+            for path in self.index_recovery_files:
+                if os.path.exists(path):
+                    os.remove(path)
+            self.index_recovery_files = []
+        except Exception as e:
+            raise Exception(f"Failed to remove set-aside index files: {str(e)}")
+        self._drop_unreferenced_images()
+    
+    def _index_incomplete_reason(self):
+        """Why blobs missing from the index may still be referenced, or None when the index is complete"""
+        if self.index_load_error is not None:
+            return f"the index could not be loaded ({self.index_load_error})"
+        if self.index_recovery_files:
+            return "unreadable index files were set aside and may still refer to them"
+        return None
+    
+    def _replay_index_log(self):
+        """Apply every intact record of the index log to the in-memory index.
+        
+        A short record at the end is the torn tail of an interrupted append and is cut
+        off. A complete record that fails to decrypt is not: replay stops there, the log is
+        left as it is and index_load_error is set, since the index is then incomplete.
+        """
+        if not os.path.exists(self.index_log_file):
+            return
+        
+        with open(self.index_log_file, "rb") as f:
+            log_data = f.read()
+        
+        offset = 0
+        header_size = _LOG_RECORD_HEADER.size
+        while offset + header_size <= len(log_data):
+            (record_length,) = _LOG_RECORD_HEADER.unpack_from(log_data, offset)
+            record_end = offset + header_size + record_length
+            if record_end > len(log_data):
+                break
+            try:
+                token = log_data[offset + header_size:record_end]
+                record = json.loads(self.cipher.decrypt(token, _INDEX_LOG_ID).decode())
+            except Exception as e:
+                error = str(e) or type(e).__name__
+                if self.index_load_error is None:
+                    self.index_load_error = f"index log record at offset {offset}: {error}"
+                print(f"Error replaying secure index log: {error}")
+                return
+            self._apply_index_record(record)
+            self._log_records += len(record["ops"]) if record.get("op") == "batch" else 1
+            offset = record_end
+        
+        if offset < len(log_data):
+            # A torn tail (crash mid-append) - drop it so new records stay readable
+            with open(self.index_log_file, "r+b") as f:
+                f.truncate(offset)
+    
+    def _apply_index_record(self, record):
+        """Apply a single index log record to the in-memory index"""
+        op = record.get("op")
+        virtual_path = record.get("path")
+        if op == "put":
+            self._index_put(virtual_path, record["info"], record["info"].get("created_time"))
+        elif op == "del":
+            self._index_remove(virtual_path, record.get("time"))
+        elif op == "move":
+            info = self._index_remove(record["from"], record.get("time"))
+            if info is not None:
+                self._index_put(record["to"], info, record.get("time"))
+        elif op == "batch":
+            for sub_record in record["ops"]:
+                self._apply_index_record(sub_record)
+    
+    def _index_put(self, virtual_path, info, change_time):
+        """Set an index entry and keep the derived aggregates in step"""
+        previous_info = self.file_index.get(virtual_path)
+        if previous_info is not None:
+            self._update_notebook_aggregate(virtual_path, previous_info, -1, None)
+            self._update_storage_totals(virtual_path, previous_info, -1)
+            self._release_blob_owner(virtual_path, previous_info)
+            if previous_info["secure_filename"] != info["secure_filename"]:
+                self.blob_cache.invalidate(virtual_path)
+            self._update_image_refs(previous_info, -1)
+        self.file_index[virtual_path] = info
+        self._blob_owners[info["secure_filename"]] = virtual_path
+        self._update_notebook_aggregate(virtual_path, info, 1, change_time)
+        self._update_storage_totals(virtual_path, info, 1)
+        self._update_image_refs(info, 1)
+    
+    def _index_remove(self, virtual_path, change_time):
+        """Remove an index entry and keep the derived aggregates in step; returns the old entry"""
+        info = self.file_index.pop(virtual_path, None)
+        if info is not None:
+            self._update_notebook_aggregate(virtual_path, info, -1, change_time)
+            self._update_storage_totals(virtual_path, info, -1)
+            self._release_blob_owner(virtual_path, info)
+            self._update_image_refs(info, -1)
+            self.blob_cache.invalidate(virtual_path)
+        return info
+    
+    def _release_blob_owner(self, virtual_path, info):
+        """Drop the reverse mapping of a blob, unless another path has claimed it since"""
+        secure_filename = info["secure_filename"]
+        if self._blob_owners.get(secure_filename) == virtual_path:
+            del self._blob_owners[secure_filename]
+    
+    def _rebuild_file_state(self):
+        """Recompute the reverse blob map, the storage totals and the image references from the file index"""
+        self._blob_owners = {}
+        self._image_refs = {}
+        self.storage_totals = self._empty_storage_totals()
+        for virtual_path, info in self.file_index.items():
+            self._blob_owners[info["secure_filename"]] = virtual_path
+            self._update_storage_totals(virtual_path, info, 1)
+            self._update_image_refs(info, 1)
+    
+    def _update_image_refs(self, info, direction):
+        """Count (direction=1) or uncount (direction=-1) the images a file's metadata lists"""
+        for image_id in (info.get("metadata") or {}).get("images") or ():
+            count = self._image_refs.get(image_id, 0) + direction
+            if count > 0:
+                self._image_refs[image_id] = count
+                self._unreferenced_images.discard(image_id)
+            else:
+                self._image_refs.pop(image_id, None)
+                self._unreferenced_images.add(image_id)
+    
+    def image_ref_count(self, image_id):
+        """Number of files that refer to a stored image"""
+        return self._image_refs.get(image_id, 0)
+    
+    def _drop_unreferenced_images(self):
+        """Delete the stored images whose last reference went away in a persisted change"""
+        if self._in_transaction or not self._unreferenced_images:
+            return
+        if self._index_incomplete_reason() is not None:
+            # Entries missing from a partly loaded index may still refer to these images
+            return
+        unreferenced, self._unreferenced_images = self._unreferenced_images, set()
+        for image_id in unreferenced:
+            if image_id not in self._image_refs and image_path(image_id) in self.file_index:
+                self.delete_file(image_path(image_id))
+    
+    @staticmethod
+    def _empty_storage_totals():
+        return {"files": 0, "bytes": 0, "image_bytes": 0, "text_bytes": 0}
+    
+    def _update_storage_totals(self, virtual_path, info, direction):
+        """Add (direction=1) or remove (direction=-1) one file from the running storage totals"""
+        size = direction * info.get("size", 0)
+        self.storage_totals["files"] += direction
+        self.storage_totals["bytes"] += size
+        metadata = info.get("metadata") or {}
+        if metadata.get("has_images"):
+            self.storage_totals["image_bytes"] += size
+        else:
+            self.storage_totals["text_bytes"] += size
+    
+    def get_blob_owner(self, secure_filename):
+        """Get the virtual path that references a physical blob, or None for an orphan"""
+        return self._blob_owners.get(secure_filename)
+    
+    def _update_notebook_aggregate(self, virtual_path, info, direction, change_time):
+        """Add (direction=1) or remove (direction=-1) one file from its notebook's aggregate"""
+        notebook_name = notebook_for_path(virtual_path)
+        if notebook_name is None:
+            return
+        
+        aggregate = self.notebook_aggregates.get(notebook_name)
+        if aggregate is None:
+            aggregate = {"entries": 0, "bytes": 0, "folders": 0, "last_modified": ""}
+            self.notebook_aggregates[notebook_name] = aggregate
+        
+        if virtual_path.endswith("/.folder_marker"):
+            aggregate["folders"] += direction
+        elif virtual_path.endswith(".enc"):
+            aggregate["entries"] += direction
+            aggregate["bytes"] += direction * info.get("size", 0)
+        if change_time and change_time > aggregate["last_modified"]:
+            aggregate["last_modified"] = change_time
+        
+        if aggregate["entries"] <= 0 and aggregate["folders"] <= 0:
+            del self.notebook_aggregates[notebook_name]
+    
+    def _rebuild_notebook_aggregates(self):
+        """Recompute every notebook aggregate from the file index"""
+        self.notebook_aggregates = {}
+        for virtual_path, info in self.file_index.items():
+            self._update_notebook_aggregate(virtual_path, info, 1, info.get("created_time"))
+    
+    def add_listener(self, callback):
+        """Register callback(events) to be told about committed changes.
+        
+        Each event is a dict with "type" ("added", "updated", "removed" or "moved"),
+        "path", "info" (the new index entry, None when removed) and, for moves, "old_path".
+        Changes made in a transaction are delivered together after commit().
+        """
+        if callback not in self._listeners:
+            self._listeners.append(callback)
+    
+    def remove_listener(self, callback):
+        """Unregister a change listener"""
+        if callback in self._listeners:
+            self._listeners.remove(callback)
+    
+    def _notify_listeners(self, events):
+        """Deliver change events; a failing listener must not break storage"""
+        if not events:
+            return
+        for callback in list(self._listeners):
+            try:
+                callback(events)
+            except Exception as e:
+                print(f"Error in storage listener: {e}")
+    
+    def _describe_index_record(self, record):
+        """Build the change event for an index record, before it is applied"""
+        op = record["op"]
+        if op == "move":
+            return {"type": "moved", "path": record["to"], "old_path": record["from"],
+                    "info": self.file_index.get(record["from"])}
+        if op == "del":
+            return {"type": "removed", "path": record["path"], "info": None}
+        event_type = "updated" if record["path"] in self.file_index else "added"
+        return {"type": event_type, "path": record["path"], "info": record["info"]}
+    
+    def _append_index_record(self, record):
+        """Apply an index change and append it to the encrypted index log"""
+        if record["op"] in ("del", "move"):
+            record["time"] = datetime.now().isoformat()
+        event = self._describe_index_record(record)
+        if self._in_transaction:
+            # Remember how to undo the change and defer persistence to commit()
+            if record["op"] == "move":
+                self._undo_records.append({"op": "move", "from": record["to"], "to": record["from"]})
+            else:
+                virtual_path = record["path"]
+                previous_info = self.file_index.get(virtual_path)
+                if previous_info is None:
+                    self._undo_records.append({"op": "del", "path": virtual_path})
+                else:
+                    self._undo_records.append({"op": "put", "path": virtual_path, "info": previous_info})
+            self._apply_index_record(record)
+            self._pending_records.append(record)
+            self._pending_events.append(event)
+            return
+        
+        self._apply_index_record(record)
+        self._write_index_log(record, 1)
+        self._notify_listeners([event])
+        self._drop_unreferenced_images()
+    
+    def _write_index_log(self, record, op_count):
+        """Append one encrypted record to the index log, checkpointing when the log grows too long"""
+        if self.index_load_error is not None and not self._unreadable_index_set_aside:
+            # Records appended behind an unreadable one would never be replayed; checkpoint
+            # instead, which sets the unreadable files aside (the record is already applied)
+            self._save_index()
+            return
+        try:
+            token = self.cipher.encrypt(json.dumps(record).encode(), _INDEX_LOG_ID)
+            with open(self.index_log_file, "ab") as f:
+                f.write(_LOG_RECORD_HEADER.pack(len(token)) + token)
+                self.durability.written(f)
+            self._log_records += op_count
+        except Exception as e:
+            raise Exception(f"Failed to append to secure index log: {str(e)}")
+        
+        if self._log_records >= self.checkpoint_interval:
+            # The record is in the log already, so the change stands even if the checkpoint
+            # fails; the log is simply folded in at a later write
+            try:
+                self._save_index()
+            except Exception as e:
+                print(f"Error checkpointing secure index, retrying at the next write: {e}")
     
     def _save_index(self):
-        """Save the encrypted file index"""
+        """Checkpoint: write the full encrypted index snapshot and reset the index log"""
         try:
-            index_json = json.dumps(self.file_index).encode()
-            encrypted_index = self.fernet.encrypt(index_json)
-            with open(self.index_file, "wb") as f:
-                f.write(encrypted_index)
+            index_json = json.dumps({
+                "version": INDEX_SNAPSHOT_VERSION,
+                "files": self.file_index.to_dict(),
+                "notebooks": self.notebook_aggregates
+            }).encode()
+            encrypted_index = self.cipher.encrypt(index_json, _INDEX_SNAPSHOT_ID)
+            if self.index_load_error is not None and not self._unreadable_index_set_aside:
+                # Keep the snapshot and log that could not be fully read for recovery
+                suffix = f"{_UNREADABLE_SUFFIX}{datetime.now().strftime('%Y%m%d%H%M%S')}"
+                for path in (self.index_file, self.index_log_file):
+                    if os.path.exists(path):
+                        os.replace(path, path + suffix)
+                        self.index_recovery_files.append(path + suffix)
+                self._unreadable_index_set_aside = True
+            # The snapshot must be durable before the log it supersedes is dropped, and the
+            # emptied log before new records go in (replaying old moves twice is not safe)
+            self.durability.atomic_write(self.index_file, lambda f: f.write(encrypted_index), barrier=True)
+            with open(self.index_log_file, "wb") as f:
+                self.durability.written(f, barrier=True)
+            self._log_records = 0
         except Exception as e:
             raise Exception(f"Failed to save secure index: {str(e)}")
     
-    def store_file(self, virtual_path, data):
-        """Store a file with encrypted filename and content"""
+    def _load_dictionaries(self):
+        """Load the preset compression dictionaries (the shipped one plus any trained ones)"""
+        self.compression_dictionaries = {DEFAULT_DICTIONARY_ID: build_default_dictionary()}
+        self.active_dictionary_id = DEFAULT_DICTIONARY_ID
+        # Why the stored dictionaries could not be read, if they could not; the file is then
+        # never rewritten, since that would drop the trained dictionaries for good
+        self.dictionary_load_error = None
+        try:
+            token = self._read_stored_dictionaries()
+            if token is None:
+                return
+            stored = json.loads(self.cipher.decrypt(token, _DICTIONARIES_ID).decode())
+            for dictionary_id, encoded in stored["dictionaries"].items():
+                self.compression_dictionaries[int(dictionary_id)] = base64.b64decode(encoded)
+            self.active_dictionary_id = stored["active"]
+        except Exception as e:
+            # Blobs that need a missing dictionary fail to load on their own; the rest still work
+            self.dictionary_load_error = str(e) or type(e).__name__
+            print(f"Error loading compression dictionaries: {self.dictionary_load_error}")
+    
+    def _save_dictionaries(self):
+        """Write the trained compression dictionaries; dictionaries are never changed or dropped once written"""
+        if self.dictionary_load_error is not None:
+            raise Exception(f"Failed to save compression dictionaries: the stored dictionaries could not be "
+                            f"loaded ({self.dictionary_load_error}) and would be overwritten")
+        try:
+            stored = {
+                "version": 1,
+                "active": self.active_dictionary_id,
+                "dictionaries": {
+                    str(dictionary_id): base64.b64encode(zdict).decode()
+                    for dictionary_id, zdict in self.compression_dictionaries.items()
+                    if dictionary_id != DEFAULT_DICTIONARY_ID
+                }
+            }
+            self._write_stored_dictionaries(self.cipher.encrypt(json.dumps(stored).encode(), _DICTIONARIES_ID))
+        except Exception as e:
+            raise Exception(f"Failed to save compression dictionaries: {str(e)}")
+    
+    def _read_stored_dictionaries(self):
+        """Encrypted dictionaries as last written, or None"""
+        if not os.path.exists(self.dictionary_file):
+            return None
+        with open(self.dictionary_file, "rb") as f:
+            return f.read()
+    
+    def _write_stored_dictionaries(self, token):
+        # Blobs compressed with a new dictionary must never outlive it
+        self.durability.atomic_write(self.dictionary_file, lambda f: f.write(token), barrier=True)
+    
+    def train_compression_dictionary(self, sample_size=200, max_size=MAX_DICTIONARY_SIZE):
+        """Train a new preset dictionary from a random sample of stored entries and make it active.
+        
+        Blobs already written keep referring to the dictionary they were compressed with;
+        only new writes use the new one. Returns the new dictionary id. Refused while the
+        stored dictionaries could not be loaded: the new one would take an id in use.
+        """
+        if self.dictionary_load_error is not None:
+            raise Exception(f"Failed to train compression dictionary: the stored dictionaries could not be "
+                            f"loaded ({self.dictionary_load_error})")
         try:
-            secure_filename = self._generate_secure_filename(virtual_path)
-            secure_filepath = os.path.join(self.secure_path, secure_filename)
+            entry_paths = [path for path in self.file_index.keys() if path.endswith(".enc")]
+            sample_paths = random.sample(entry_paths, min(sample_size, len(entry_paths)))
+            samples = [self.load_file(path) for path in sample_paths]
+            zdict = train_dictionary([sample for sample in samples if sample], max_size)
+            
+            dictionary_id = max(self.compression_dictionaries) + 1
+            self.compression_dictionaries[dictionary_id] = zdict
+            self.active_dictionary_id = dictionary_id
+            self._save_dictionaries()
+            return dictionary_id
+        except Exception as e:
+            raise Exception(f"Failed to train compression dictionary: {str(e)}")
+    
+    def _active_dictionary(self, compression=None):
+        """(id, bytes) of the preset dictionary for new writes, when the codec uses one"""
+        if get_codec(compression or self.compression).uses_dictionary:
+            return (self.active_dictionary_id, self.compression_dictionaries[self.active_dictionary_id])
+        return None
+    
+    def _encode_contents(self, data, compression=None):
+        """Apply the configured codec, or compression, with the active dictionary when it needs one"""
+        compression = compression or self.compression
+        return encode_blob(data, compression, self.compression_level, self._active_dictionary(compression))
+    
+    def _stream_workers(self):
+        """Thread pool that seals/opens chunks of large blobs in parallel (None: serially, the default)"""
+        if STREAM_WORKERS < 2:
+            return None
+        if self._stream_executor is None:
+            self._stream_executor = ThreadPoolExecutor(max_workers=STREAM_WORKERS)
+        return self._stream_executor
+    
+    def _write_blob(self, secure_filepath, secure_filename, data, compression=None):
+        """Encode, encrypt and write file contents; returns the number of bytes written.
+        
+        The blob only appears under its name once it is complete.
+        """
+        return self._create_in_shard(secure_filepath, partial(
+            self.durability.atomic_write, secure_filepath,
+            lambda f: self._encrypt_blob(secure_filename, data, f.write, compression)))
+    
+    def _encrypt_blob(self, secure_filename, data, write, compression=None):
+        """Encode and encrypt file contents, passing the ciphertext to write(); returns its size.
+        
+        Large contents and file objects go through the chunked stream format: chunks are
+        compressed, sealed and written one at a time, so the ciphertext is never held in
+        memory as a whole.
+        """
+        if hasattr(data, "read"):
+            pieces = iter(lambda: data.read(STREAM_CHUNK_SIZE), b"")
+        elif len(data) >= STREAM_THRESHOLD and self.cipher.supports_streaming:
+            view = memoryview(data)
+            pieces = (view[offset:offset + STREAM_CHUNK_SIZE] for offset in range(0, len(view), STREAM_CHUNK_SIZE))
+        else:
+            encrypted_data = self.cipher.encrypt(self._encode_contents(data, compression), secure_filename)
+            write(encrypted_data)
+            return len(encrypted_data)
+        
+        compression = compression or self.compression
+        encoded = encode_blob_stream(pieces, compression, self.compression_level, self._active_dictionary(compression))
+        return self.cipher.encrypt_stream(encoded, secure_filename, write, self._stream_workers())
+    
+    def _reset_transaction_state(self):
+        """Forget everything recorded for the current transaction"""
+        self._pending_records = []
+        self._pending_events = []
+        self._undo_records = []
+        self._staged_blobs = []
+        self._pending_blob_deletes = []
+    
+    def begin(self):
+        """Start a transaction: index changes are kept in memory until commit()"""
+        if self._in_transaction:
+            raise Exception("A storage transaction is already in progress")
+        self._in_transaction = True
+        self._reset_transaction_state()
+    
+    def commit(self):
+        """Persist every index change of the current transaction as a single atomic log record"""
+        if not self._in_transaction:
+            raise Exception("No storage transaction in progress")
+        
+        try:
+            if self._pending_records:
+                self._make_blobs_durable(self._staged_blobs)
+                self._write_index_batch(self._pending_records)
+        except BaseException:
+            # The record could not be written (a failing checkpoint after a written record
+            # does not raise): undo the changes in memory and drop the staged blobs
+            self.rollback()
+            raise
+        
+        pending_events = self._pending_events
+        pending_blob_deletes = self._pending_blob_deletes
+        self._in_transaction = False
+        self._reset_transaction_state()
+        
+        # Old blobs can only go once the index no longer points at them
+        self._release_blobs(pending_blob_deletes)
+        
+        self._notify_listeners(pending_events)
+        self._drop_unreferenced_images()
+    
+    def _write_index_batch(self, records):
+        """Persist the index records of a committed transaction"""
+        if len(records) >= self.checkpoint_interval:
+            # Large batches go straight into a fresh snapshot
+            self._save_index()
+        else:
+            self._write_index_log({"op": "batch", "ops": records}, len(records))
+    
+    def rollback(self):
+        """Discard every change made since begin()"""
+        if not self._in_transaction:
+            return
+        
+        for undo_record in reversed(self._undo_records):
+            self._apply_index_record(undo_record)
+        
+        for secure_filepath in self._staged_blobs:
+            self._discard_blob(secure_filepath)
+        
+        self._in_transaction = False
+        self._reset_transaction_state()
+    
+    @contextmanager
+    def transaction(self):
+        """Group several operations into one index write; nested use joins the outer transaction"""
+        if self._in_transaction:
+            yield self
+            return
+        
+        self.begin()
+        try:
+            yield self
+            self.commit()
+        except BaseException:
+            # commit() rolls back itself when persisting fails; this is a no-op then
+            self.rollback()
+            raise
+    
+    def _remove_blob(self, secure_filepath):
+        """Remove a physical blob the index no longer points at (at commit time when inside a transaction)"""
+        if self._in_transaction:
+            self._pending_blob_deletes.append(secure_filepath)
+        else:
+            self._release_blobs([secure_filepath])
+    
+    def _release_blobs(self, secure_filepaths):
+        """Delete blobs once the index change that dropped them is durable.
+        
+        With a deferred log fsync, deleting them right away could leave the index that a
+        crash recovers pointing at blobs that are gone, losing the whole file instead of
+        just its last change.
+        """
+        if not secure_filepaths:
+            return
+        
+        def discard():
+            for secure_filepath in secure_filepaths:
+                self._discard_blob(secure_filepath)
+        
+        self.durability.after_sync(discard, (self.index_log_file,))
+    
+    def _make_blobs_durable(self, secure_filepaths):
+        """Sync new blobs before the index record that refers to them is written, so a crash
+        can never leave the log pointing at a blob that did not reach the disk"""
+        self.durability.sync_now(secure_filepaths)
+    
+    def _discard_blob(self, secure_filepath):
+        """Remove a blob that may already be gone, ignoring errors (rollback, deferred deletes)"""
+        try:
+            if os.path.exists(secure_filepath):
+                os.remove(secure_filepath)
+        except OSError:
+            pass
+        self._prune_shard_directories(os.path.dirname(secure_filepath))
+    
+    def _blob_exists(self, secure_filename):
+        return os.path.exists(self._blob_path(secure_filename))
+    
+    def store_file(self, virtual_path, data, metadata=None, compression=None):
+        """Store a file with encrypted filename and content.
+        
+        data is bytes, str, a dict (stored as JSON) or a binary file object (streamed).
+        metadata is an optional small dict kept in the encrypted index so callers can
+        list files without decrypting their contents. compression overrides the configured
+        codec for this file; images default to IMAGE_COMPRESSION (they are JPEG/PNG already).
+        """
+        try:
+            if compression is None and image_id_of_path(virtual_path) is not None:
+                compression = IMAGE_COMPRESSION
+            # Every write goes to a fresh blob; the old one is dropped once the index moves on
+            secure_filename = self._generate_secure_filename()
+            secure_filepath = self._sharded_blob_path(secure_filename)
             
             # Encrypt and store the actual file content
             if isinstance(data, str):
@@ -57,19 +902,27 @@ class SecureStorageManager:
             elif isinstance(data, dict):
                 data = json.dumps(data).encode()
             
-            encrypted_data = self.fernet.encrypt(data)
+            if self._in_transaction:
+                self._staged_blobs.append(secure_filepath)
+            stored_size = self._write_blob(secure_filepath, secure_filename, data, compression)
             
-            with open(secure_filepath, "wb") as f:
-                f.write(encrypted_data)
+            previous_info = self.file_index.get(virtual_path)
             
             # Update the index
-            self.file_index[virtual_path] = {
+            info = {
                 "secure_filename": secure_filename,
                 "created_time": datetime.now().isoformat(),
-                "size": len(encrypted_data)
+                "size": stored_size
             }
+            if metadata is not None:
+                info["metadata"] = metadata
+            if not self._in_transaction:
+                self._make_blobs_durable([secure_filepath])
+            self._append_index_record({"op": "put", "path": virtual_path, "info": info})
             
-            self._save_index()
+            # Drop the blob the index pointed at before this write
+            if previous_info:
+                self._remove_blob(self._blob_path(previous_info["secure_filename"]))
             return True
             
         except Exception as e:
@@ -82,54 +935,251 @@ class SecureStorageManager:
                 return None
             
             secure_filename = self.file_index[virtual_path]["secure_filename"]
-            secure_filepath = os.path.join(self.secure_path, secure_filename)
+            cached_data = self.blob_cache.get(virtual_path, secure_filename)
+            if cached_data is not None:
+                return cached_data
             
-            if not os.path.exists(secure_filepath):
+            if not self._blob_exists(secure_filename):
                 # Clean up invalid index entry
-                del self.file_index[virtual_path]
-                self._save_index()
+                self._append_index_record({"op": "del", "path": virtual_path})
+                return None
+            
+            return self._read_blob(virtual_path, secure_filename)
+            
+        except Exception as e:
+            raise Exception(f"Failed to load file: {str(e)}")
+    
+    def fetch_file(self, virtual_path):
+        """Load a file without changing anything: a missing blob gives None instead of
+        dropping the index entry, and no listeners run. For worker threads (e.g. image decoding)"""
+        try:
+            info = self.file_index.get(virtual_path)
+            if info is None:
                 return None
             
-            with open(secure_filepath, "rb") as f:
-                encrypted_data = f.read()
+            cached_data = self.blob_cache.get(virtual_path, info["secure_filename"])
+            if cached_data is not None:
+                return cached_data
+            return self._read_blob(virtual_path, info["secure_filename"])
             
-            decrypted_data = self.fernet.decrypt(encrypted_data)
-            return decrypted_data
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            raise Exception(f"Failed to load file: {str(e)}")
+    
+    def _read_blob(self, virtual_path, secure_filename):
+        """Decrypt and decode a blob and keep its contents in the blob cache"""
+        with self._blob_view(secure_filename) as view:
+            decrypted_data = decode_blob_stream(
+                self.cipher.decrypt_view(view, secure_filename, self._stream_workers()),
+                self.compression_dictionaries)
+        self.blob_cache.put(virtual_path, secure_filename, decrypted_data)
+        return decrypted_data
+    
+    @contextmanager
+    def _blob_view(self, secure_filename):
+        """Read-only memoryview of a blob file: memory-mapped for large blobs, so decrypting
+        works on slices of the page cache instead of a copy of the whole ciphertext"""
+        with self._open_blob(secure_filename) as f:
+            if os.fstat(f.fileno()).st_size < MMAP_THRESHOLD:
+                yield memoryview(f.read())
+                return
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            view = memoryview(mapped)
+            try:
+                yield view
+            finally:
+                view.release()
+                try:
+                    mapped.close()
+                except BufferError:
+                    # A slice is still referenced (e.g. by an abandoned generator); the map
+                    # is closed when that is collected
+                    pass
+    
+    def _open_blob(self, secure_filename):
+        """Open a blob file for reading, wherever the layout migration has put it"""
+        try:
+            return open(self._blob_path(secure_filename), "rb")
+        except FileNotFoundError:
+            if not self._flat_blobs_remaining:
+                raise
+            # Moved into its shard by the layout migration in the meantime
+            return open(self._sharded_blob_path(secure_filename), "rb")
+    
+    def _secure_filename_of(self, virtual_path):
+        """Secure filename of a virtual path, or None"""
+        info = self.file_index.get(virtual_path)
+        if info is None:
+            return None
+        return info["secure_filename"]
+    
+    def load_file_into(self, virtual_path, buffer):
+        """Decode a file's contents into buffer, a bytearray the caller reuses across loads.
+        
+        The buffer ends up holding exactly the contents (its capacity is kept for the next
+        load), so bulk readers such as exports avoid a fresh allocation per file and do not
+        push everything else out of the blob cache. Any memoryview of the buffer must be
+        released before the next call. Returns the contents length, or None for unknown paths.
+        """
+        secure_filename = self._secure_filename_of(virtual_path)
+        if secure_filename is None:
+            return None
+        try:
+            cached_data = self.blob_cache.get(virtual_path, secure_filename)
+            if cached_data is not None:
+                buffer[:] = cached_data
+                return len(buffer)
             
+            position = 0
+            with self._blob_view(secure_filename) as view:
+                for piece in iter_decode_blob(self.cipher.decrypt_view(view, secure_filename, self._stream_workers()),
+                                              self.compression_dictionaries):
+                    buffer[position:position + len(piece)] = piece
+                    position += len(piece)
+            del buffer[position:]
+            return position
         except Exception as e:
             raise Exception(f"Failed to load file: {str(e)}")
     
+    def iter_file_chunks(self, virtual_path):
+        """Yield the contents of a file piece by piece without holding it all in memory
+        (for large attachments); yields nothing for unknown paths"""
+        secure_filename = self._secure_filename_of(virtual_path)
+        if secure_filename is None:
+            return
+        try:
+            with self._blob_view(secure_filename) as view:
+                yield from iter_decode_blob(
+                    self.cipher.decrypt_view(view, secure_filename, self._stream_workers()),
+                    self.compression_dictionaries)
+        except Exception as e:
+            raise Exception(f"Failed to load file: {str(e)}")
+    
+    def load_range(self, virtual_path, offset, length):
+        """Load length bytes of a file's contents starting at offset, without decoding the rest.
+        
+        Uncompressed chunked blobs only decrypt the chunks that cover the range; other
+        blobs are decoded from the start and decoding stops once the range is covered.
+        Returns None for unknown paths.
+        """
+        secure_filename = self._secure_filename_of(virtual_path)
+        if secure_filename is None:
+            return None
+        try:
+            cached_data = self.blob_cache.get(virtual_path, secure_filename)
+            if cached_data is not None:
+                return cached_data[offset:offset + length]
+            if length <= 0:
+                return b""
+            
+            with self._blob_view(secure_filename) as view:
+                layout = self.cipher.describe(view[:64])
+                if layout["format"] == "stream":
+                    chunk_size = layout["chunk_size"]
+                    first_piece = next(self.cipher.decrypt_view(view, secure_filename, last_chunk=0))
+                    if peek_codec(first_piece[:BLOB_HEADER_SIZE]) == "raw":
+                        # Plain contents: plaintext position = codec header + offset
+                        start = BLOB_HEADER_SIZE + offset
+                        first_chunk = start // chunk_size
+                        last_chunk = (start + length - 1) // chunk_size
+                        pieces = self.cipher.decrypt_view(view, secure_filename, self._stream_workers(),
+                                                          first_chunk, last_chunk)
+                        skip = start - first_chunk * chunk_size
+                        return b"".join(pieces)[skip:skip + length]
+                
+                pieces = iter_decode_blob(self.cipher.decrypt_view(view, secure_filename),
+                                          self.compression_dictionaries)
+                try:
+                    return _take_range(pieces, offset, length)
+                finally:
+                    pieces.close()
+        except Exception as e:
+            raise Exception(f"Failed to load file range: {str(e)}")
+    
+    def read_blob_header(self, virtual_path):
+        """Describe how a file is stored (cipher format, chunking, codec) without decoding its contents.
+        
+        For chunked blobs only the first chunk is decrypted; single-token blobs have to be
+        authenticated as a whole first. Returns None for unknown paths.
+        """
+        secure_filename = self._secure_filename_of(virtual_path)
+        if secure_filename is None:
+            return None
+        try:
+            with self._blob_view(secure_filename) as view:
+                header = self.cipher.describe(view[:64])
+                header["stored_size"] = len(view)
+                first_piece = next(self.cipher.decrypt_view(view, secure_filename, last_chunk=0))
+                header["codec"] = peek_codec(first_piece[:BLOB_HEADER_SIZE]) or "legacy"
+                return header
+        except Exception as e:
+            raise Exception(f"Failed to read blob header: {str(e)}")
+    
     def delete_file(self, virtual_path):
         """Delete a file by its virtual path"""
         try:
             if virtual_path not in self.file_index:
                 return False
             
-            secure_filename = self.file_index[virtual_path]["secure_filename"]
-            secure_filepath = os.path.join(self.secure_path, secure_filename)
+            secure_filepath = self._blob_path(self.file_index[virtual_path]["secure_filename"])
             
-            # Remove the physical file
-            if os.path.exists(secure_filepath):
-                os.remove(secure_filepath)
-            
-            # Remove from index
-            del self.file_index[virtual_path]
-            self._save_index()
+            # Remove from index, then the physical file
+            self._append_index_record({"op": "del", "path": virtual_path})
+            self._remove_blob(secure_filepath)
             return True
             
         except Exception as e:
             raise Exception(f"Failed to delete file: {str(e)}")
     
+    def update_metadata(self, virtual_path, metadata):
+        """Replace the index metadata of a file without touching its contents"""
+        try:
+            if virtual_path not in self.file_index:
+                return False
+            
+            info = dict(self.file_index[virtual_path])
+            info["metadata"] = metadata
+            self._append_index_record({"op": "put", "path": virtual_path, "info": info})
+            return True
+            
+        except Exception as e:
+            raise Exception(f"Failed to update metadata: {str(e)}")
+    
+    def move_file(self, old_virtual_path, new_virtual_path):
+        """Move a file to a new virtual path; only the index changes, the blob is untouched"""
+        try:
+            if old_virtual_path not in self.file_index:
+                return False
+            if new_virtual_path in self.file_index:
+                raise Exception("Target path already exists")
+            
+            self._append_index_record({"op": "move", "from": old_virtual_path, "to": new_virtual_path})
+            return True
+            
+        except Exception as e:
+            raise Exception(f"Failed to move file: {str(e)}")
+    
+    def move_prefix(self, old_prefix, new_prefix):
+        """Move every file under old_prefix to new_prefix in a single transaction"""
+        moved_count = 0
+        with self.transaction():
+            for virtual_path in self.file_index.paths_with_prefix(old_prefix):
+                if self.move_file(virtual_path, new_prefix + virtual_path[len(old_prefix):]):
+                    moved_count += 1
+        return moved_count
+    
     def list_files(self, path_prefix=""):
         """List all files that match the given path prefix"""
         matching_files = []
-        for virtual_path in self.file_index.keys():
-            if virtual_path.startswith(path_prefix):
-                matching_files.append({
-                    "virtual_path": virtual_path,
-                    "created_time": self.file_index[virtual_path]["created_time"],
-                    "size": self.file_index[virtual_path]["size"]
-                })
+        for virtual_path in self.file_index.paths_with_prefix(path_prefix):
+            info = self.file_index[virtual_path]
+            matching_files.append({
+                "virtual_path": virtual_path,
+                "created_time": info["created_time"],
+                "size": info["size"],
+                "metadata": info.get("metadata")
+            })
         return matching_files
     
     def create_virtual_folder(self, folder_path):
@@ -140,18 +1190,22 @@ class SecureStorageManager:
     
     def list_virtual_folders(self):
         """List all virtual folders"""
-        folders = set()
-        for virtual_path in self.file_index.keys():
-            if "/.folder_marker" in virtual_path:
-                folder_path = virtual_path.replace("/.folder_marker", "")
-                folders.add(folder_path)
-            else:
-                # Extract folder path from file path
-                path_parts = virtual_path.split("/")
-                if len(path_parts) > 1:
-                    folder_path = "/".join(path_parts[:-1])
-                    folders.add(folder_path)
-        return sorted(list(folders))
+        return self.file_index.folders()
+    
+    def list_notebooks(self):
+        """List the names of all notebooks that have entries or a folder marker"""
+        return sorted(self.notebook_aggregates)
+    
+    def get_notebook_stats(self, notebook_name):
+        """Get the maintained entry count, size and last change time of a notebook"""
+        aggregate = self.notebook_aggregates.get(notebook_name)
+        if aggregate is None:
+            return {"total_entries": 0, "total_size_bytes": 0, "last_modified": ""}
+        return {
+            "total_entries": aggregate["entries"],
+            "total_size_bytes": aggregate["bytes"],
+            "last_modified": aggregate["last_modified"]
+        }
     
     def get_file_info(self, virtual_path):
         """Get information about a file"""
@@ -159,49 +1213,185 @@ class SecureStorageManager:
             return self.file_index[virtual_path].copy()
         return None
     
-    def cleanup_orphaned_files(self):
-        """Remove physical files that are not in the index"""
-        cleaned_count = 0
-        try:
-            for filename in os.listdir(self.secure_path):
-                if filename == "index.enc":
-                    continue
-                    
-                filepath = os.path.join(self.secure_path, filename)
-                if os.path.isfile(filepath):
-                    # Check if this file is referenced in the index
-                    found = False
-                    for entry in self.file_index.values():
-                        if entry["secure_filename"] == filename:
-                            found = True
+    def _blob_directories(self):
+        """Physical directories that hold blob files: the storage directory itself (blobs of
+        the flat layout, stray temp files) and every shard directory that exists"""
+        directories = [self.secure_path]
+        level_directories = [self.secure_path]
+        for _ in range(BLOB_SHARD_LEVELS):
+            next_level = []
+            for parent in level_directories:
+                with self._scan_shard(parent) as entries:
+                    next_level.extend(
+                        entry.path for entry in entries
+                        if len(entry.name) == BLOB_SHARD_WIDTH and set(entry.name) <= _HEX_DIGITS and entry.is_dir()
+                    )
+            level_directories = next_level
+        directories.extend(level_directories)
+        return directories
+    
+    def _is_reserved_file(self, filename):
+        """Files in the storage directory that are never blobs (index snapshot, log, temp files,
+        the database of the SQLite backend)"""
+        return filename.startswith(("index.", "storage.db"))
+    
+    def cleanup_orphaned_files(self, progress_callback=None, cancel_event=None, max_workers=4):
+        """Remove physical files that are not in the index.
+        
+        The set of referenced blobs is snapshotted when the cleanup starts, so this can run
+        on a worker thread while the app keeps writing: files modified around or after the
+        start are left alone. progress_callback(scanned, total) is called after every batch of
+        directory entries and cancel_event (a threading.Event) stops the scan early.
+        Returns the number of files removed.
+        """
+        incomplete_reason = self._index_incomplete_reason()
+        if incomplete_reason is not None:
+            raise Exception(f"Failed to cleanup orphaned files: {incomplete_reason}, "
+                            f"blobs that are still needed would look orphaned")
+        try:
+            referenced = frozenset(self._blob_owners)
+            cutoff_time = time.time() - CLEANUP_GRACE_SECONDS
+            directories = self._blob_directories()
+            expected_total = len(referenced)
+            scanned_count = 0
+            progress_lock = threading.Lock()
+            
+            def report(batch_scanned):
+                nonlocal scanned_count
+                with progress_lock:
+                    scanned_count += batch_scanned
+                    if progress_callback:
+                        progress_callback(scanned_count, max(expected_total, scanned_count))
+            
+            def scan_directory(directory):
+                cleaned = 0
+                batch_scanned = 0
+                with self._scan_shard(directory) as entries:
+                    for entry in entries:
+                        if cancel_event is not None and cancel_event.is_set():
                             break
-                    
-                    if not found:
-                        os.remove(filepath)
-                        cleaned_count += 1
+                        batch_scanned += 1
+                        if batch_scanned >= CLEANUP_SCAN_BATCH_SIZE:
+                            report(batch_scanned)
+                            batch_scanned = 0
+                        
+                        if self._is_reserved_file(entry.name) or entry.name in referenced:
+                            continue
+                        try:
+                            if not entry.is_file():
+                                continue
+                            file_stat = entry.stat()
+                            if file_stat.st_mtime >= cutoff_time:
+                                continue
+                            os.remove(entry.path)
+                            cleaned += 1
+                            with progress_lock:
+                                self.disk_adjustment["files"] -= 1
+                                self.disk_adjustment["bytes"] -= file_stat.st_size
+                        except FileNotFoundError:
+                            # Removed by a concurrent delete/overwrite in the meantime
+                            continue
+                report(batch_scanned)
+                # Also clears out empty shards left by earlier versions
+                self._prune_shard_directories(directory)
+                return cleaned
             
-            return cleaned_count
+            if len(directories) > 1 and max_workers and max_workers > 1:
+                with ThreadPoolExecutor(max_workers=max_workers) as executor:
+                    return sum(executor.map(scan_directory, directories))
+            return sum(scan_directory(directory) for directory in directories)
         except Exception as e:
             raise Exception(f"Failed to cleanup orphaned files: {str(e)}")
     
+    def reconcile_storage_stats(self, progress_callback=None, cancel_event=None, max_workers=4):
+        """Measure the blob directories on disk and record how far they are from the index.
+        
+        get_storage_stats() only reads running totals; this pass counts the physical blob
+        files once (e.g. orphans or blobs lost outside the app) so the physical numbers it
+        reports stay accurate. Shard directories are measured in parallel. Meant for a
+        worker thread; returns the new stats, or None when cancelled.
+        """
+        try:
+            indexed_files = self.storage_totals["files"]
+            indexed_bytes = self.storage_totals["bytes"]
+            directories = self._blob_directories()
+            counted_files = 0
+            progress_lock = threading.Lock()
+            
+            def measure_directory(directory):
+                nonlocal counted_files
+                directory_files = 0
+                directory_bytes = 0
+                with self._scan_shard(directory) as entries:
+                    for entry in entries:
+                        if cancel_event is not None and cancel_event.is_set():
+                            break
+                        if self._is_reserved_file(entry.name) or not entry.is_file():
+                            continue
+                        try:
+                            directory_bytes += entry.stat().st_size
+                        except FileNotFoundError:
+                            continue
+                        directory_files += 1
+                with progress_lock:
+                    counted_files += directory_files
+                    if progress_callback:
+                        progress_callback(counted_files, max(indexed_files, counted_files))
+                return directory_files, directory_bytes
+            
+            if len(directories) > 1 and max_workers and max_workers > 1:
+                with ThreadPoolExecutor(max_workers=max_workers) as executor:
+                    measured = list(executor.map(measure_directory, directories))
+            else:
+                measured = [measure_directory(directory) for directory in directories]
+            if cancel_event is not None and cancel_event.is_set():
+                return None
+            disk_files = sum(files for files, _ in measured)
+            disk_bytes = sum(size for _, size in measured)
+            
+            self.disk_adjustment = {
+                "files": disk_files - indexed_files,
+                "bytes": disk_bytes - indexed_bytes,
+                "reconciled_time": datetime.now().isoformat()
+            }
+            return self.get_storage_stats()
+        except Exception as e:
+            raise Exception(f"Failed to reconcile storage statistics: {str(e)}")
+    
+    def _index_files(self):
+        """Physical files that hold the index rather than blobs, counted in the storage totals"""
+        return (self.index_file, self.index_log_file, self.dictionary_file)
+    
     def get_storage_stats(self):
-        """Get statistics about the secure storage"""
-        total_files = len(self.file_index)
-        total_size = 0
-        physical_files = 0
-        
-        try:
-            for filename in os.listdir(self.secure_path):
-                filepath = os.path.join(self.secure_path, filename)
-                if os.path.isfile(filepath):
-                    physical_files += 1
-                    total_size += os.path.getsize(filepath)
-        except Exception:
-            pass
+        """Get statistics about the secure storage from the running totals (no directory scan)"""
+        index_files = 0
+        index_bytes = 0
+        for index_path in self._index_files():
+            try:
+                index_bytes += os.path.getsize(index_path)
+                index_files += 1
+            except OSError:
+                pass
         
+        physical_files = self.storage_totals["files"] + self.disk_adjustment["files"] + index_files
+        total_size = self.storage_totals["bytes"] + self.disk_adjustment["bytes"] + index_bytes
         return {
-            "virtual_files": total_files,
+            "virtual_files": len(self.file_index),
             "physical_files": physical_files,
             "total_size_bytes": total_size,
-            "total_size_mb": round(total_size / (1024 * 1024), 2)
-        }
\ No newline at end of file
+            "total_size_mb": round(total_size / (1024 * 1024), 2),
+            "image_bytes": self.storage_totals["image_bytes"],
+            "text_bytes": self.storage_totals["text_bytes"],
+            "notebook_bytes": {name: aggregate["bytes"] for name, aggregate in self.notebook_aggregates.items()},
+            "unindexed_files": self.disk_adjustment["files"],
+            "reconciled_time": self.disk_adjustment["reconciled_time"],
+            **self.blob_cache.get_stats()
+        }
+    
+    def clear_cache(self):
+        """Drop all decrypted file contents held in memory"""
+        self.blob_cache.clear()
+    
+    def flush(self):
+        """Make every write so far durable now (runs the fsyncs a group commit deferred)"""
+        self.durability.flush()
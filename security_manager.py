@@ -6,6 +6,9 @@ class SecurityManager:
         self.parent = parent
 
     def lock_and_exit(self):
+        # Decrypted file contents never outlive a lock request, even if it is cancelled
+        self.parent.entry_manager.secure_storage.clear_cache()
+        
         # Verify all files are encrypted before closing
         try:
             self.parent.status_bar.showMessage("Verifying encryption...")
@@ -44,6 +47,9 @@ class SecurityManager:
             if hasattr(self.parent, 'auto_save_thread'):
                 self.parent.auto_save_thread.stop()
             
+            # Stop any running storage task before the window goes away
+            self.parent.entry_manager.stop_background_tasks()
+            
             self.parent.progress_bar.setVisible(False)
             QMessageBox.information(self.parent, "Locked", "🔒 Journal locked securely. All entries are encrypted and safe!")
             QApplication.instance().quit()
@@ -82,6 +88,12 @@ class SecurityManager:
             if hasattr(self.parent, 'auto_save_thread'):
                 self.parent.auto_save_thread.stop()
             
+            # Stop any running storage task before the window goes away
+            self.parent.entry_manager.stop_background_tasks()
+            
+            # Drop decrypted file contents held in memory
+            self.parent.entry_manager.secure_storage.clear_cache()
+            
             event.accept()
             
         except Exception as e:
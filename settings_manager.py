@@ -3,6 +3,11 @@ import json
 from cryptography.fernet import Fernet
 from PyQt5.QtWidgets import QTextEdit
 from PyQt5.QtGui import QFont
+from blob_cache import DEFAULT_CACHE_MAX_BYTES, DEFAULT_CACHE_MAX_ENTRIES
+from blob_codec import DEFAULT_CODEC, DEFAULT_COMPRESSION_LEVEL
+from crypto_backend import DEFAULT_CIPHER
+from durable_io import DEFAULT_DURABILITY, DEFAULT_GROUP_COMMIT_WINDOW
+from image_ingest import DEFAULT_IMAGE_MAX_DIMENSION, DEFAULT_IMAGE_QUALITY
 
 
 class SettingsManager:
@@ -26,7 +31,17 @@ class SettingsManager:
             "theme": "dark",
             "font_size": 12,
             "auto_save": True,
-            "word_wrap": True
+            "word_wrap": True,
+            "cache_max_bytes": DEFAULT_CACHE_MAX_BYTES,
+            "cache_max_entries": DEFAULT_CACHE_MAX_ENTRIES,
+            "compression": DEFAULT_CODEC,  # "raw", "zlib" or "zlib-dict"
+            "compression_level": DEFAULT_COMPRESSION_LEVEL,
+            "cipher": DEFAULT_CIPHER,  # "aes-gcm", "chacha20-poly1305" or "fernet"
+            "durability": DEFAULT_DURABILITY,  # "strict", "group" or "relaxed"
+            "group_commit_window_ms": int(DEFAULT_GROUP_COMMIT_WINDOW * 1000),
+            "storage_backend": "files",  # "files" or "sqlite" (see migrate_storage.py)
+            "image_max_dimension": DEFAULT_IMAGE_MAX_DIMENSION,  # longest side of stored images, in px
+            "image_quality": DEFAULT_IMAGE_QUALITY  # JPEG quality of re-encoded photos
         }
         if os.path.exists(self.parent.config_path):
             try:
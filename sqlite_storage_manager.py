@@ -0,0 +1,258 @@
+import os
+import hmac
+import json
+import sqlite3
+import hashlib
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from crypto_backend import derive_aead_key
+from path_index import PathIndex
+from secure_storage_manager import SecureStorageManager, CLEANUP_GRACE_SECONDS, CLEANUP_SCAN_BATCH_SIZE, _DICTIONARIES_ID
+
+
+# PRAGMA synchronous for each durability mode: in WAL mode NORMAL only syncs at
+# checkpoints, so the last commits can be lost on power failure but never corrupted
+_SYNCHRONOUS_BY_DURABILITY = {"strict": "FULL", "group": "NORMAL", "relaxed": "OFF"}
+
+_SCHEMA = (
+    # One row per index entry: the row key is an HMAC of the virtual path, the entry
+    # (path and index info) is encrypted with the row key as associated data
+    "CREATE TABLE IF NOT EXISTS files (path_key TEXT PRIMARY KEY, entry BLOB NOT NULL)",
+    "CREATE TABLE IF NOT EXISTS blobs (blob_id TEXT PRIMARY KEY, data BLOB NOT NULL, written_time REAL NOT NULL)",
+    "CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value BLOB NOT NULL)",
+)
+
+
+def _index_record_paths(record):
+    """Virtual paths whose index entry an index record changes"""
+    op = record["op"]
+    if op == "batch":
+        return [path for sub_record in record["ops"] for path in _index_record_paths(sub_record)]
+    if op == "move":
+        return [record["from"], record["to"]]
+    return [record["path"]]
+
+
+class SQLiteStorageManager(SecureStorageManager):
+    """SecureStorageManager that keeps blobs and the index in one SQLite database (WAL mode).
+
+    The in-memory index, caching, codecs and transactions are those of SecureStorageManager;
+    only persistence differs. Every committed change is one SQLite transaction that rewrites
+    just the index rows it touches, so there is no log to replay or snapshot to checkpoint.
+    Needs the master key (it derives the row key from it).
+    """
+
+    def __init__(self, base_path, fernet, master_key=None, **options):
+        if master_key is None:
+            raise Exception("The SQLite storage backend needs the master key")
+        self.db_path = os.path.join(base_path, "secure_storage", "storage.db")
+        os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
+        self._row_key = derive_aead_key(master_key, b"securejournal sqlite row key v1")
+        self._db_lock = threading.RLock()
+        # Shared with storage worker threads, always under _db_lock
+        self.db = sqlite3.connect(self.db_path, check_same_thread=False, isolation_level=None)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        for statement in _SCHEMA:
+            self.db.execute(statement)
+        super().__init__(base_path, fernet, master_key=master_key, **options)
+        self.db.execute(f"PRAGMA synchronous={_SYNCHRONOUS_BY_DURABILITY[self.durability.mode]}")
+
+    @contextmanager
+    def _db_transaction(self):
+        """Run statements as one SQLite write transaction"""
+        with self._db_lock:
+            self.db.execute("BEGIN IMMEDIATE")
+            try:
+                yield self.db
+            except BaseException:
+                self.db.execute("ROLLBACK")
+                raise
+            self.db.execute("COMMIT")
+
+    def _path_key(self, virtual_path):
+        return hmac.new(self._row_key, virtual_path.encode(), hashlib.sha256).hexdigest()
+
+    def _write_index_rows(self, db, virtual_paths):
+        """Store the current index entry of each path, or delete its row when it is gone"""
+        for virtual_path in dict.fromkeys(virtual_paths):
+            path_key = self._path_key(virtual_path)
+            info = self.file_index.get(virtual_path)
+            if info is None:
+                db.execute("DELETE FROM files WHERE path_key = ?", (path_key,))
+            else:
+                entry = json.dumps({"path": virtual_path, "info": info}).encode()
+                db.execute("INSERT OR REPLACE INTO files (path_key, entry) VALUES (?, ?)",
+                           (path_key, self.cipher.encrypt(entry, path_key)))
+
+    # Index persistence
+
+    def _load_index(self):
+        """Load and decrypt every index row"""
+        entries = {}
+        try:
+            with self._db_lock:
+                rows = self.db.execute("SELECT path_key, entry FROM files").fetchall()
+            for path_key, token in rows:
+                entry = json.loads(self.cipher.decrypt(token, path_key).decode())
+                entries[entry["path"]] = entry["info"]
+        except Exception as e:
+            # Rows are never rewritten wholesale, so a failed load cannot overwrite them;
+            # cleanup is refused while the index is incomplete
+            self.index_load_error = str(e) or type(e).__name__
+            print(f"Error loading secure index: {self.index_load_error}")
+        self.file_index = PathIndex(entries)
+        self._rebuild_notebook_aggregates()
+        self._rebuild_file_state()
+        return self.file_index
+
+    def _write_index_log(self, record, op_count):
+        """Persist an applied index record by rewriting the rows of the paths it touched"""
+        try:
+            with self._db_transaction() as db:
+                self._write_index_rows(db, _index_record_paths(record))
+        except Exception as e:
+            raise Exception(f"Failed to update secure index: {str(e)}")
+
+    def _write_index_batch(self, records):
+        """Persist a committed transaction; however large, it only touches its own rows"""
+        self._write_index_log({"op": "batch", "ops": records}, len(records))
+
+    def _save_index(self):
+        """Rewrite every index row"""
+        if self.index_load_error is not None:
+            raise Exception(f"Failed to save secure index: the index could not be loaded ({self.index_load_error})")
+        try:
+            with self._db_transaction() as db:
+                db.execute("DELETE FROM files")
+                self._write_index_rows(db, list(self.file_index.keys()))
+        except Exception as e:
+            raise Exception(f"Failed to save secure index: {str(e)}")
+
+    def _read_stored_dictionaries(self):
+        with self._db_lock:
+            row = self.db.execute("SELECT value FROM meta WHERE name = ?", (_DICTIONARIES_ID,)).fetchone()
+        return row[0] if row else None
+
+    def _write_stored_dictionaries(self, token):
+        with self._db_transaction() as db:
+            db.execute("INSERT OR REPLACE INTO meta (name, value) VALUES (?, ?)", (_DICTIONARIES_ID, token))
+
+    # Blobs: rows keyed by their secure filename, which stands in for a physical path
+
+    def _has_flat_blobs(self):
+        return False
+
+    def _sharded_blob_path(self, secure_filename):
+        return secure_filename
+
+    def _write_blob(self, secure_filepath, secure_filename, data, compression=None):
+        """Encode, encrypt and insert file contents; returns the stored size.
+
+        SQLite needs the whole value at once, so unlike the file backend the ciphertext of
+        a large blob is held in memory while it is inserted.
+        """
+        token = bytearray()
+        stored_size = self._encrypt_blob(secure_filename, data, token.extend, compression)
+        with self._db_transaction() as db:
+            db.execute("INSERT OR REPLACE INTO blobs (blob_id, data, written_time) VALUES (?, ?, ?)",
+                       (secure_filename, bytes(token), time.time()))
+        return stored_size
+
+    @contextmanager
+    def _blob_view(self, secure_filename):
+        with self._db_lock:
+            row = self.db.execute("SELECT data FROM blobs WHERE blob_id = ?", (secure_filename,)).fetchone()
+        if row is None:
+            raise FileNotFoundError(f"No blob {secure_filename}")
+        yield memoryview(row[0])
+
+    def _blob_exists(self, secure_filename):
+        with self._db_lock:
+            return self.db.execute("SELECT 1 FROM blobs WHERE blob_id = ?", (secure_filename,)).fetchone() is not None
+
+    def _remove_blob(self, secure_filepath):
+        if self._in_transaction:
+            self._pending_blob_deletes.append(secure_filepath)
+        else:
+            self._discard_blob(secure_filepath)
+
+    def _make_blobs_durable(self, secure_filepaths):
+        # Blob rows are committed before the index rows that refer to them, in the same
+        # write-ahead log, so they always reach the disk first
+        pass
+
+    def _release_blobs(self, secure_filepaths):
+        # The index rows were committed before this, in the same write-ahead log
+        for secure_filepath in secure_filepaths:
+            self._discard_blob(secure_filepath)
+
+    def _discard_blob(self, secure_filepath):
+        with self._db_transaction() as db:
+            db.execute("DELETE FROM blobs WHERE blob_id = ?", (secure_filepath,))
+
+    # Maintenance
+
+    def _index_files(self):
+        # Index rows share the database with the blobs; only the blob sizes are tracked
+        return ()
+
+    def cleanup_orphaned_files(self, progress_callback=None, cancel_event=None, max_workers=4):
+        """Delete blob rows the index does not reference (see SecureStorageManager.cleanup_orphaned_files)"""
+        incomplete_reason = self._index_incomplete_reason()
+        if incomplete_reason is not None:
+            raise Exception(f"Failed to cleanup orphaned files: {incomplete_reason}, "
+                            f"blobs that are still needed would look orphaned")
+        try:
+            referenced = frozenset(self._blob_owners)
+            cutoff_time = time.time() - CLEANUP_GRACE_SECONDS
+            with self._db_lock:
+                candidates = [blob_id for (blob_id,) in self.db.execute(
+                    "SELECT blob_id FROM blobs WHERE written_time < ?", (cutoff_time,))]
+
+            cleaned = 0
+            for position, blob_id in enumerate(candidates, 1):
+                if cancel_event is not None and cancel_event.is_set():
+                    break
+                if blob_id not in referenced:
+                    with self._db_lock:
+                        size = self.db.execute("SELECT length(data) FROM blobs WHERE blob_id = ?",
+                                               (blob_id,)).fetchone()
+                        self.db.execute("DELETE FROM blobs WHERE blob_id = ?", (blob_id,))
+                    if size is not None:
+                        cleaned += 1
+                        self.disk_adjustment["files"] -= 1
+                        self.disk_adjustment["bytes"] -= size[0]
+                if progress_callback and (position % CLEANUP_SCAN_BATCH_SIZE == 0 or position == len(candidates)):
+                    progress_callback(position, len(candidates))
+            return cleaned
+        except Exception as e:
+            raise Exception(f"Failed to cleanup orphaned files: {str(e)}")
+
+    def reconcile_storage_stats(self, progress_callback=None, cancel_event=None, max_workers=4):
+        """Count the stored blobs and record how far they are from the index (see the base class)"""
+        try:
+            with self._db_lock:
+                disk_files, disk_bytes = self.db.execute(
+                    "SELECT count(*), coalesce(sum(length(data)), 0) FROM blobs").fetchone()
+            if cancel_event is not None and cancel_event.is_set():
+                return None
+            self.disk_adjustment = {
+                "files": disk_files - self.storage_totals["files"],
+                "bytes": disk_bytes - self.storage_totals["bytes"],
+                "reconciled_time": datetime.now().isoformat()
+            }
+            return self.get_storage_stats()
+        except Exception as e:
+            raise Exception(f"Failed to reconcile storage statistics: {str(e)}")
+
+    def flush(self):
+        """Make every commit durable now by checkpointing the write-ahead log"""
+        with self._db_lock:
+            self.db.execute("PRAGMA wal_checkpoint(FULL)")
+
+    def close(self):
+        """Close the database connection"""
+        with self._db_lock:
+            self.db.close()
@@ -0,0 +1,485 @@
+"""Storage benchmarks.
+
+Run with:  python storage_benchmark.py [--suite compression|crypto|durability|backend|all] [--entries N]
+                                      [--journal DIR] [--directory DIR] [--scales 1000,10000,100000]
+
+Without --journal, sample entries are generated with QTextEdit the same way
+EntryManager.save_entry builds them. With --journal, entries are sampled from an
+existing journal directory (its master.key is used to read them).
+
+The crypto suite encrypts/decrypts three entry shapes (a 1 KB text note, a 50 KB rich
+note and a 5 MB note with base64 images) with every cipher, with and without compression.
+Payloads the app streams (1 MiB and up, AEAD ciphers) are also run through the chunked
+format, written to a scratch file and read back through an mmap view, with and without
+the chunk worker threads.
+
+The durability suite saves entries through SecureStorageManager.store_file in every
+durability mode, in a scratch journal under --directory (default: the system temp
+directory; point it at the disk the journal lives on, fsync cost depends on it).
+
+The backend suite fills the blob-file and the SQLite backend with 1k, 10k and 100k
+1 KB entries (--scales) and times saving, reopening, loading and listing them.
+"""
+import os
+import sys
+import mmap
+import base64
+import json
+import time
+import random
+import argparse
+import shutil
+import tempfile
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from blob_codec import encode_blob, decode_blob, encode_blob_stream, decode_blob_stream, DEFAULT_COMPRESSION_LEVEL
+from compression_dictionary import build_default_dictionary, train_dictionary, DEFAULT_DICTIONARY_ID
+from crypto_backend import BlobCipher, available_ciphers, STREAM_CHUNK_SIZE
+from durable_io import DURABILITY_MODES
+
+
+_WORDS = ("the morning was quiet and I finally had time to write down what happened "
+          "yesterday at work meeting project deadline coffee walk park friend dinner "
+          "idea plan tomorrow weekend book chapter thought feeling tired happy").split()
+
+
+# QApplication kept alive for the widgets used to generate samples
+_qt_app = None
+
+
+def _editor():
+    """A QTextEdit to build entry HTML with (creates the QApplication on first use)"""
+    os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+    from PyQt5.QtWidgets import QApplication, QTextEdit
+
+    global _qt_app
+    _qt_app = QApplication.instance() or QApplication(sys.argv[:1])
+    return QTextEdit()
+
+
+def _random_blocks(rng, block_count):
+    """Paragraphs and lists of random words with some bold text"""
+    blocks = []
+    for _ in range(block_count):
+        words = [rng.choice(_WORDS) for _ in range(rng.randint(5, 60))]
+        if rng.random() < 0.3:
+            words[0] = f"<b>{words[0]}</b>"
+        if rng.random() < 0.2:
+            blocks.append(f"<ul><li>{' '.join(words[:8])}</li><li>{' '.join(words[8:16])}</li></ul>")
+        else:
+            blocks.append(f"<p>{' '.join(words)}</p>")
+    return blocks
+
+
+def _entry_payload(editor, title, html):
+    """Serialize editor content exactly like EntryManager.save_entry"""
+    editor.setHtml(html)
+    content = editor.toHtml()
+    plain_text = editor.toPlainText()
+    now = datetime.now().isoformat()
+    entry_data = {
+        "title": title,
+        "content": content,
+        "plain_text": plain_text,
+        "date": now[:10],
+        "created_time": now,
+        "modified_time": now,
+        "word_count": len(plain_text.split()),
+        "has_images": "<img" in content,
+        "notebook": "Default"
+    }
+    return json.dumps(entry_data).encode()
+
+
+def generate_sample_entries(count, seed=1):
+    """Build entry JSON blobs like EntryManager.save_entry does, from QTextEdit HTML"""
+    editor = _editor()
+    rng = random.Random(seed)
+    return [_entry_payload(editor, f"Entry {index}", "".join(_random_blocks(rng, rng.randint(1, 12))))
+            for index in range(count)]
+
+
+def _noise_png_base64(width, height, rng):
+    """A PNG of random pixels (does not compress, like a photo) as base64"""
+    from PyQt5.QtCore import QBuffer, QByteArray, QIODevice
+    from PyQt5.QtGui import QImage
+
+    pixels = bytes(rng.getrandbits(8) for _ in range(width * height * 4))
+    image = QImage(pixels, width, height, QImage.Format_RGB32)
+    data = QByteArray()
+    buffer = QBuffer(data)
+    buffer.open(QIODevice.WriteOnly)
+    image.save(buffer, "PNG")
+    return base64.b64encode(bytes(data)).decode()
+
+
+def generate_sized_entries(seed=1):
+    """The three entry shapes of the crypto suite: {label: payload}"""
+    editor = _editor()
+    rng = random.Random(seed)
+    payloads = {}
+
+    blocks = []
+    while len(_entry_payload(editor, "Text note", "".join(blocks))) < 1024:
+        blocks.extend(_random_blocks(rng, 1))
+    payloads["1 KB text note"] = _entry_payload(editor, "Text note", "".join(blocks))
+
+    blocks = []
+    while len(_entry_payload(editor, "Rich note", "".join(blocks))) < 50 * 1024:
+        blocks.extend(_random_blocks(rng, 10))
+    payloads["50 KB rich note"] = _entry_payload(editor, "Rich note", "".join(blocks))
+
+    image = _noise_png_base64(600, 500, rng)
+    blocks = _random_blocks(rng, 5)
+    while len("".join(blocks)) < 5 * 1024 * 1024:
+        blocks.append(f'<p><img src="data:image/png;base64,{image}" width="600" height="500" /></p>')
+    payloads["5 MB image note"] = _entry_payload(editor, "Image note", "".join(blocks))
+    return payloads
+
+
+def load_journal_entries(journal_dir, count, seed=1):
+    """Sample decrypted entry blobs from an existing journal directory"""
+    from cryptography.fernet import Fernet
+    from secure_storage_manager import SecureStorageManager
+
+    with open(os.path.join(journal_dir, "master.key"), "rb") as f:
+        master_key = f.read()
+    storage = SecureStorageManager(journal_dir, Fernet(master_key), master_key=master_key)
+    entry_paths = [path for path in storage.file_index.keys() if path.endswith(".enc")]
+    rng = random.Random(seed)
+    return [storage.load_file(path) for path in rng.sample(entry_paths, min(count, len(entry_paths)))]
+
+
+def _time_codec(samples, codec_name, level, dictionary, dictionaries):
+    """Encode and decode every sample; returns (encoded bytes, encode seconds, decode seconds)"""
+    start = time.perf_counter()
+    encoded = [encode_blob(sample, codec_name, level, dictionary) for sample in samples]
+    encode_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for payload, sample in zip(encoded, samples):
+        if decode_blob(payload, dictionaries) != sample:
+            raise AssertionError(f"{codec_name} did not round-trip")
+    decode_seconds = time.perf_counter() - start
+    return sum(len(payload) for payload in encoded), encode_seconds, decode_seconds
+
+
+def benchmark_compression(samples, level=DEFAULT_COMPRESSION_LEVEL):
+    """Compare raw, zlib and preset-dictionary zlib on the same samples.
+
+    The trained dictionary is built from the first half of the samples and every codec
+    is measured on the second half, so the trained result is not flattered by seeing the
+    data it compresses. Returns a list of result dicts.
+    """
+    split = len(samples) // 2
+    training, evaluation = samples[:split], samples[split:]
+    default_dictionary = build_default_dictionary()
+    trained_dictionary = train_dictionary(training)
+    dictionaries = {DEFAULT_DICTIONARY_ID: default_dictionary, DEFAULT_DICTIONARY_ID + 1: trained_dictionary}
+
+    cases = [
+        ("raw", "raw", None),
+        ("zlib", "zlib", None),
+        ("zlib-dict (shipped)", "zlib-dict", (DEFAULT_DICTIONARY_ID, default_dictionary)),
+        ("zlib-dict (trained)", "zlib-dict", (DEFAULT_DICTIONARY_ID + 1, trained_dictionary)),
+    ]
+    original_bytes = sum(len(sample) for sample in evaluation)
+    results = []
+    for label, codec_name, dictionary in cases:
+        stored_bytes, encode_seconds, decode_seconds = _time_codec(
+            evaluation, codec_name, level, dictionary, dictionaries)
+        results.append({
+            "codec": label,
+            "original_bytes": original_bytes,
+            "stored_bytes": stored_bytes,
+            "ratio": original_bytes / stored_bytes if stored_bytes else 0.0,
+            "encode_mb_s": original_bytes / (1024 * 1024) / encode_seconds if encode_seconds else 0.0,
+            "decode_mb_s": original_bytes / (1024 * 1024) / decode_seconds if decode_seconds else 0.0
+        })
+    return results
+
+
+def _percentile(sorted_values, fraction):
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * fraction))]
+
+
+def _token_path(cipher, payload, codec_name, level):
+    """(encrypt, decrypt) for contents stored as a single token, as SecureStorageManager
+    does below STREAM_THRESHOLD and for Fernet: encrypt() returns the stored size,
+    decrypt() the contents"""
+    stored = {}
+
+    def encrypt():
+        stored["token"] = cipher.encrypt(encode_blob(payload, codec_name, level), "benchmark.dat")
+        return len(stored["token"])
+
+    def decrypt():
+        return decode_blob(cipher.decrypt(stored["token"], "benchmark.dat"))
+
+    return encrypt, decrypt
+
+
+def _stream_path(cipher, payload, codec_name, level, file_path, executor):
+    """(encrypt, decrypt) for contents stored in the chunked format, as SecureStorageManager
+    does from STREAM_THRESHOLD up: chunks are written to a file as they are sealed and read
+    back through an mmap view; executor seals/opens chunks in parallel (None: in line)"""
+    def encrypt():
+        view = memoryview(payload)
+        pieces = (view[offset:offset + STREAM_CHUNK_SIZE] for offset in range(0, len(view), STREAM_CHUNK_SIZE))
+        with open(file_path, "wb") as f:
+            return cipher.encrypt_stream(encode_blob_stream(pieces, codec_name, level), "benchmark.dat",
+                                         f.write, executor)
+
+    def decrypt():
+        with open(file_path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            view = memoryview(mapped)
+            try:
+                return decode_blob_stream(cipher.decrypt_view(view, "benchmark.dat", executor))
+            finally:
+                view.release()
+
+    return encrypt, decrypt
+
+
+def _traced_peak(function):
+    """Peak Python memory allocated while function() runs, in bytes"""
+    tracemalloc.start()
+    try:
+        function()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def benchmark_crypto(payloads, iterations=None, level=DEFAULT_COMPRESSION_LEVEL, directory=None):
+    """Encrypt and decrypt every payload with every cipher, with and without compression.
+
+    Each operation is the storage path the app takes for the payload: blob codec + cipher
+    on write, cipher + codec on read. Payloads the app streams are measured both as one
+    token and in the chunked format (see _stream_path), with and without the chunk worker
+    threads. Peak memory of encrypting and of decrypting is measured with tracemalloc on
+    separate rounds so the tracing overhead does not skew the timings. Returns a list of
+    result dicts.
+    """
+    from cryptography.fernet import Fernet
+    from secure_storage_manager import STREAM_THRESHOLD, STREAM_WORKERS
+
+    master_key = Fernet.generate_key()
+    fernet = Fernet(master_key)
+    scratch_dir = tempfile.mkdtemp(prefix="crypto-benchmark-", dir=directory)
+    stream_file = os.path.join(scratch_dir, "benchmark.dat")
+    # The app seals chunks in line unless STREAM_WORKERS is raised; the pool is measured
+    # here either way, to show whether raising it pays off
+    worker_count = max(2, STREAM_WORKERS)
+    executor = ThreadPoolExecutor(max_workers=worker_count)
+    results = []
+    try:
+        for label, payload in payloads.items():
+            rounds = iterations or max(5, min(500, (20 * 1024 * 1024) // len(payload)))
+            megabytes = len(payload) / (1024 * 1024)
+            for cipher_name in available_ciphers():
+                cipher = BlobCipher(fernet, cipher_name, master_key)
+                for codec_name in ("raw", "zlib"):
+                    paths = [("token", _token_path(cipher, payload, codec_name, level))]
+                    if len(payload) >= STREAM_THRESHOLD and cipher.supports_streaming:
+                        paths.append(("stream", _stream_path(cipher, payload, codec_name, level, stream_file, None)))
+                        paths.append((f"stream ({worker_count} threads)",
+                                      _stream_path(cipher, payload, codec_name, level, stream_file, executor)))
+                    for path_name, (encrypt, decrypt) in paths:
+                        encrypt_times = []
+                        decrypt_times = []
+                        for _ in range(rounds):
+                            start = time.perf_counter()
+                            stored_bytes = encrypt()
+                            encrypt_times.append(time.perf_counter() - start)
+
+                            start = time.perf_counter()
+                            decrypted = decrypt()
+                            decrypt_times.append(time.perf_counter() - start)
+                        if decrypted != payload:
+                            raise AssertionError(f"{cipher_name}/{codec_name}/{path_name} did not round-trip")
+                        decrypted = None
+
+                        encrypt_peak = _traced_peak(encrypt)
+                        decrypt_peak = _traced_peak(decrypt)
+
+                        encrypt_times.sort()
+                        decrypt_times.sort()
+                        results.append({
+                            "payload": label,
+                            "cipher": cipher_name,
+                            "codec": codec_name,
+                            "path": path_name,
+                            "stored_bytes": stored_bytes,
+                            "encrypt_mb_s": megabytes * rounds / sum(encrypt_times),
+                            "decrypt_mb_s": megabytes * rounds / sum(decrypt_times),
+                            "encrypt_p50_ms": _percentile(encrypt_times, 0.5) * 1000,
+                            "encrypt_p99_ms": _percentile(encrypt_times, 0.99) * 1000,
+                            "decrypt_p50_ms": _percentile(decrypt_times, 0.5) * 1000,
+                            "decrypt_p99_ms": _percentile(decrypt_times, 0.99) * 1000,
+                            "encrypt_peak_mb": encrypt_peak / (1024 * 1024),
+                            "decrypt_peak_mb": decrypt_peak / (1024 * 1024)
+                        })
+    finally:
+        executor.shutdown()
+        shutil.rmtree(scratch_dir, ignore_errors=True)
+    return results
+
+
+def benchmark_durability(payloads, saves=200, directory=None):
+    """Save every payload repeatedly in every durability mode and time each store_file.
+
+    Saves overwrite a handful of entries the way autosave does. The final flush() is
+    timed separately: in "group" mode it is the fsync work still pending when the app
+    closes. Returns a list of result dicts.
+    """
+    from cryptography.fernet import Fernet
+    from secure_storage_manager import SecureStorageManager
+
+    master_key = Fernet.generate_key()
+    fernet = Fernet(master_key)
+    results = []
+    for label, payload in payloads.items():
+        rounds = max(5, min(saves, (50 * 1024 * 1024) // len(payload)))
+        for mode in DURABILITY_MODES:
+            journal_dir = tempfile.mkdtemp(prefix="journal-benchmark-", dir=directory)
+            try:
+                storage = SecureStorageManager(journal_dir, fernet, master_key=master_key, durability=mode)
+                save_times = []
+                for index in range(rounds):
+                    start = time.perf_counter()
+                    storage.store_file(f"entries/Default/entry_{index % 10}.enc", payload)
+                    save_times.append(time.perf_counter() - start)
+                start = time.perf_counter()
+                storage.flush()
+                flush_seconds = time.perf_counter() - start
+
+                save_times.sort()
+                results.append({
+                    "payload": label,
+                    "durability": mode,
+                    "saves": rounds,
+                    "save_p50_ms": _percentile(save_times, 0.5) * 1000,
+                    "save_p99_ms": _percentile(save_times, 0.99) * 1000,
+                    "saves_per_s": rounds / sum(save_times),
+                    "final_flush_ms": flush_seconds * 1000,
+                    "fsync_calls": storage.durability.sync_count
+                })
+            finally:
+                shutil.rmtree(journal_dir, ignore_errors=True)
+    return results
+
+
+def _timed(function, *args):
+    start = time.perf_counter()
+    function(*args)
+    return time.perf_counter() - start
+
+
+def benchmark_backends(payload, scales=(1000, 10000, 100000), directory=None, lookups=500):
+    """Compare the blob-file and SQLite storage backends at several journal sizes.
+
+    Entries are saved one store_file at a time, like the app does; the journal is then
+    reopened (loading the index) and random entries are loaded and listed. Returns a
+    list of result dicts.
+    """
+    from cryptography.fernet import Fernet
+    from secure_storage_manager import SecureStorageManager
+    from sqlite_storage_manager import SQLiteStorageManager
+
+    master_key = Fernet.generate_key()
+    fernet = Fernet(master_key)
+    backends = (("files", SecureStorageManager), ("sqlite", SQLiteStorageManager))
+    results = []
+    for entry_count in scales:
+        paths = [f"entries/Notebook {index % 20}/entry_{index}.enc" for index in range(entry_count)]
+        lookup_paths = random.Random(1).sample(paths, min(lookups, entry_count))
+        for backend_name, storage_class in backends:
+            journal_dir = tempfile.mkdtemp(prefix="journal-benchmark-", dir=directory)
+            try:
+                storage = storage_class(journal_dir, fernet, master_key=master_key)
+                save_times = [_timed(storage.store_file, path, payload, {"notebook": path.split("/")[1]})
+                              for path in paths]
+                storage.flush()
+
+                start = time.perf_counter()
+                storage = storage_class(journal_dir, fernet, master_key=master_key)
+                open_seconds = time.perf_counter() - start
+
+                storage.clear_cache()
+                load_times = sorted(_timed(storage.load_file, path) for path in lookup_paths)
+                list_seconds = _timed(storage.list_files, "entries/Notebook 7/")
+
+                save_times.sort()
+                results.append({
+                    "entries": entry_count,
+                    "backend": backend_name,
+                    "saves_per_s": entry_count / sum(save_times),
+                    "save_p99_ms": _percentile(save_times, 0.99) * 1000,
+                    "open_ms": open_seconds * 1000,
+                    "load_p50_ms": _percentile(load_times, 0.5) * 1000,
+                    "load_p99_ms": _percentile(load_times, 0.99) * 1000,
+                    "list_ms": list_seconds * 1000,
+                    "disk_mb": sum(os.path.getsize(os.path.join(root, name))
+                                   for root, _, names in os.walk(journal_dir) for name in names) / (1024 * 1024)
+                })
+            finally:
+                shutil.rmtree(journal_dir, ignore_errors=True)
+    return results
+
+
+def print_results(title, results):
+    """Print benchmark results as a table"""
+    if not results:
+        return
+    columns = list(results[0])
+    print(f"\n{title}")
+    print("  ".join(f"{column:>20}" for column in columns))
+    for row in results:
+        cells = []
+        for column in columns:
+            value = row[column]
+            cells.append(f"{value:>20.2f}" if isinstance(value, float) else f"{value!s:>20}")
+        print("  ".join(cells))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="SecureJournal storage benchmarks")
+    parser.add_argument("--suite", choices=("compression", "crypto", "durability", "backend", "all"), default="all")
+    parser.add_argument("--entries", type=int, default=400, help="number of sample entries")
+    parser.add_argument("--journal", help="sample entries from an existing journal directory")
+    parser.add_argument("--level", type=int, default=DEFAULT_COMPRESSION_LEVEL, help="zlib level")
+    parser.add_argument("--directory", help="where the crypto, durability and backend suites create scratch files")
+    parser.add_argument("--scales", default="1000,10000,100000", help="journal sizes for the backend suite")
+    args = parser.parse_args(argv)
+
+    if args.suite in ("compression", "all"):
+        if args.journal:
+            samples = load_journal_entries(args.journal, args.entries)
+        else:
+            samples = generate_sample_entries(args.entries)
+        if len(samples) < 2:
+            print("Need at least two entries to benchmark")
+            return 1
+        print_results(f"Compression ({len(samples) // 2} training / {len(samples) - len(samples) // 2} measured entries)",
+                      benchmark_compression(samples, args.level))
+
+    if args.suite in ("crypto", "all"):
+        print_results("Encryption (codec + cipher, per entry)",
+                      benchmark_crypto(generate_sized_entries(), level=args.level, directory=args.directory))
+
+    if args.suite in ("durability", "all"):
+        print_results("Durability (store_file latency per mode)",
+                      benchmark_durability(generate_sized_entries(), directory=args.directory))
+
+    if args.suite in ("backend", "all"):
+        scales = [int(scale) for scale in args.scales.split(",")]
+        print_results("Storage backends (1 KB entries)",
+                      benchmark_backends(generate_sized_entries()["1 KB text note"], scales, args.directory))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,30 @@
+import threading
+from PyQt5.QtCore import QThread, pyqtSignal
+
+
+class StorageTaskThread(QThread):
+    """Runs a long storage task (task(progress_callback, cancel_event)) off the UI thread"""
+    progress_signal = pyqtSignal(int, int)
+    result_signal = pyqtSignal(object)
+    error_signal = pyqtSignal(str)
+    
+    def __init__(self, task, parent=None):
+        super().__init__(parent)
+        self.task = task
+        self.cancel_event = threading.Event()
+    
+    def run(self):
+        try:
+            result = self.task(self.report_progress, self.cancel_event)
+            self.result_signal.emit(result)
+        except Exception as e:
+            self.error_signal.emit(str(e))
+    
+    def report_progress(self, done, total):
+        self.progress_signal.emit(done, total)
+    
+    def cancel(self):
+        self.cancel_event.set()
+    
+    def is_cancelled(self):
+        return self.cancel_event.is_set()
@@ -293,7 +293,7 @@ def get_app_stylesheet():
     }
     
     /* List Widgets - Full Width with improved formatting */
-    QListWidget#notebooksList, QListWidget#entriesList {
+    QListWidget#notebooksList, QListView#entriesList {
         background-color: #2b2b2b;
         border: none;
         border-radius: 0;
@@ -305,7 +305,7 @@ def get_app_stylesheet():
         font-size: 12px;
     }
     
-    QListWidget#notebooksList::item, QListWidget#entriesList::item {
+    QListWidget#notebooksList::item, QListView#entriesList::item {
         background-color: transparent;
         border: none;
         padding: 12px 15px;
@@ -316,14 +316,14 @@ def get_app_stylesheet():
         min-height: 60px;
     }
     
-    QListWidget#notebooksList::item:selected, QListWidget#entriesList::item:selected {
+    QListWidget#notebooksList::item:selected, QListView#entriesList::item:selected {
         background-color: #6366f1;
         color: white;
         font-weight: bold;
         border-bottom: 1px solid #4f46e5;
     }
     
-    QListWidget#notebooksList::item:hover, QListWidget#entriesList::item:hover {
+    QListWidget#notebooksList::item:hover, QListView#entriesList::item:hover {
         background: qlineargradient(x1: 0, y1: 0, x2: 0, y2: 1,
                                    stop: 0 #374151, stop: 1 #1f2937);
         color: #f9fafb;
@@ -334,7 +334,7 @@ def get_app_stylesheet():
         border-bottom: none;
     }
     
-    QListWidget#entriesList::item:last {
+    QListView#entriesList::item:last {
         border-bottom: none;
     }
     
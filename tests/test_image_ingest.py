@@ -0,0 +1,29 @@
+import os
+import sys
+
+import pytest
+
+QtGui = pytest.importorskip("PyQt5.QtGui")
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from image_ingest import prepare_image
+
+
+def test_prepare_image_drops_png_text_chunks(tmp_path):
+    source = QtGui.QImage(40, 30, QtGui.QImage.Format_RGB32)
+    source.fill(0x336699)
+    source.setText("Comment", "taken at home")
+    source_path = str(tmp_path / "source.png")
+    assert source.save(source_path, "PNG")
+    with open(source_path, "rb") as f:
+        assert b"tEXt" in f.read()
+
+    prepared = prepare_image(source_path)
+
+    assert prepared["mime"] == "image/png"
+    assert b"tEXt" not in prepared["data"]
+    assert b"taken at home" not in prepared["data"]
+    stored = QtGui.QImage.fromData(prepared["data"])
+    assert stored.textKeys() == []
+    assert (stored.width(), stored.height()) == (40, 30)
+    assert stored.pixel(0, 0) == source.pixel(0, 0)
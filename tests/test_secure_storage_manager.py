@@ -0,0 +1,39 @@
+import errno
+import os
+import sys
+
+import pytest
+
+fernet_module = pytest.importorskip("cryptography.fernet")
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from secure_storage_manager import SecureStorageManager
+
+
+def _open_storage(journal_dir, key):
+    return SecureStorageManager(str(journal_dir), fernet_module.Fernet(key), checkpoint_interval=3)
+
+
+def test_failed_checkpoint_keeps_committed_transaction(tmp_path):
+    key = fernet_module.Fernet.generate_key()
+    storage = _open_storage(tmp_path, key)
+    storage.store_file("default/2024-01-01/a.enc", b"v1")
+
+    atomic_write = storage.durability.atomic_write
+
+    def failing_atomic_write(path, write, barrier=False):
+        if path == storage.index_file:
+            raise OSError(errno.ENOSPC, "No space left on device")
+        return atomic_write(path, write, barrier)
+
+    storage.durability.atomic_write = failing_atomic_write
+    with storage.transaction():
+        storage.store_file("default/2024-01-01/a.enc", b"v2")
+        storage.store_file("default/2024-01-01/b.enc", b"new")
+
+    assert storage.load_file("default/2024-01-01/a.enc") == b"v2"
+    storage.flush()
+
+    reopened = _open_storage(tmp_path, key)
+    assert reopened.load_file("default/2024-01-01/a.enc") == b"v2"
+    assert reopened.load_file("default/2024-01-01/b.enc") == b"new"
@@ -9,9 +9,11 @@ from PyQt5.QtCore import Qt
 from PyQt5.QtWidgets import QFontComboBox, QComboBox, QSpinBox
 
 
-from PyQt5.QtWidgets import QListWidget, QMenu, QAction
+from PyQt5.QtWidgets import QListWidget, QListView, QMenu, QAction
 from PyQt5.QtCore import Qt, QPoint
 from PyQt5.QtGui import QCursor
+from entry_list_model import EntryListModel, EntryItemDelegate
+from journal_editor import JournalEditor
 
 class EnhancedNotebookListWidget(QListWidget):
     def __init__(self, parent):
@@ -197,8 +199,14 @@ class UIComponents:
         entries_header_layout.addStretch()
         entries_header_layout.addWidget(self.parent.new_entry_btn)
         
-        # Entry list - Full width
-        self.parent.entry_list = QListWidget()
+        # Entry list - Full width; a model/view pair that only paints visible rows
+        self.parent.entry_list_model = EntryListModel(self.parent)
+        self.parent.entry_list = QListView()
+        self.parent.entry_list.setModel(self.parent.entry_list_model)
+        self.parent.entry_list.setItemDelegate(EntryItemDelegate(self.parent.entry_list))
+        self.parent.entry_list.setUniformItemSizes(True)
+        self.parent.entry_list.setEditTriggers(QListView.NoEditTriggers)
+        self.parent.entry_list.setMouseTracking(True)
         self.parent.entry_list.setObjectName("entriesList")
         self.parent.entry_list.setMinimumHeight(200)
         # Remove margins/padding to ensure full width
@@ -235,7 +243,7 @@ class UIComponents:
         self.parent.new_notebook_btn.clicked.connect(self.parent.create_notebook)
         self.parent.notebooks_list.itemClicked.connect(self.parent.select_notebook)
         self.parent.new_entry_btn.clicked.connect(self.parent.new_entry)
-        self.parent.entry_list.itemClicked.connect(self.parent.load_selected_entry)
+        self.parent.entry_list.clicked.connect(self.parent.load_selected_entry)
         
         return panel
     
@@ -314,8 +322,9 @@ class UIComponents:
         
         container_layout.addWidget(title_section)
         
-        # Editor (single shared QTextEdit owned by the main window)
-        self.parent.editor = QTextEdit()
+        # Editor (single shared QTextEdit owned by the main window); it shows the
+        # images of entries from the encrypted image store
+        self.parent.editor = JournalEditor(self.parent.entry_manager.image_store)
         self.parent.editor.setObjectName("mainEditor")
         self.parent.editor.setAcceptRichText(True)  # REQUIRED for fonts/styles to work
         self.parent.editor.setFont(QFont("Segoe UI", self.parent.config["font_size"]))
@@ -553,17 +562,8 @@ class UIComponents:
             notebook_name = notebook_info['name']
             entry_count = notebook_info['count']
             
-            # Format the display text with plain text formatting
-            if entry_count == 0:
-                subtitle = "Empty"
-            elif entry_count == 1:
-                subtitle = "1 note"
-            else:
-                subtitle = f"{entry_count} notes"
-            
             # Use plain text with newlines instead of HTML
-            display_text = f"{notebook_name}\n{subtitle}"
-            item.setText(display_text)
+            item.setText(self._format_notebook_text(notebook_name, entry_count))
             item.setData(Qt.UserRole, notebook_name)
             
             # Set fonts for better visual hierarchy
@@ -579,25 +579,24 @@ class UIComponents:
                 self.parent.notebooks_list.setCurrentRow(i)
                 break
 
+    def _format_notebook_text(self, notebook_name, entry_count):
+        """Format a notebook row: name plus a plain text note count subtitle"""
+        if entry_count == 0:
+            subtitle = "Empty"
+        elif entry_count == 1:
+            subtitle = "1 note"
+        else:
+            subtitle = f"{entry_count} notes"
+        return f"{notebook_name}\n{subtitle}"
+    
+    def update_notebook_count(self, notebook_name, entry_count):
+        """Update the count shown on a single notebook row"""
+        for i in range(self.parent.notebooks_list.count()):
+            item = self.parent.notebooks_list.item(i)
+            if item.data(Qt.UserRole) == notebook_name:
+                item.setText(self._format_notebook_text(notebook_name, entry_count))
+                break
+    
     def update_entry_list_with_formatting(self, entries):
-        """Update entry list with improved formatting - using plain text"""
-        self.parent.entry_list.clear()
-        for idx, entry in enumerate(entries):
-            item = QListWidgetItem()
-            # Use attribute access for JournalEntry objects
-            title = getattr(entry, "title", "Untitled")
-            date = getattr(entry, "date", "")
-            word_count = getattr(entry, "word_count", 0)
-            # Format word count
-            if word_count == 0:
-                word_text = "No words"
-            elif word_count == 1:
-                word_text = "1 word"
-            else:
-                word_text = f"{word_count} words"
-            display_text = f"{title}\n{date}  •  {word_text}"
-            item.setText(display_text)
-            item.setData(Qt.UserRole, idx)
-            font = QFont("Segoe UI", 11)
-            item.setFont(font)
-            self.parent.entry_list.addItem(item)
\ No newline at end of file
+        """Update entry list; rows are painted on demand by the entry delegate"""
+        self.parent.entry_list_model.set_entries(entries)